@@ -20,6 +20,30 @@ class AtomicExhaustionError(AtomicError):
 
 SIMULATING_PLACEHOLDER = object()
 
+#: Compiled struct types shared between instances. See AtomicStruct.freeze
+compiled_cache = {}
+
+
+def schema_args(args, kwargs):
+    """Reduce define() arguments to a key for compiled_cache
+
+    Plain values are kept as they are. Other objects (such as a Game or a
+    parent struct) are represented by their class, so that instances made
+    for different objects of the same kind still share a type.
+
+    Returns
+    -------
+    key : tuple
+    """
+    def reduce_arg(value):
+        if isinstance(value, (basestring, int, long, float, tuple,
+                              type(None))):
+            return value
+        return value.__class__
+    return (tuple(reduce_arg(arg) for arg in args),
+            tuple(sorted((key, reduce_arg(value))
+                         for key, value in kwargs.items())))
+
 
 class AtomicContext(object):
     def __init__(self, atomic, key, value=True, rel=False):
@@ -78,6 +102,7 @@ class AtomicStruct(object):
         self._type = None
         self._data = None
         self._defaults = {}
+        self._schema_args = ()
         self.context = {
             'field_pos': 0,
             'simulate': False
@@ -540,17 +565,71 @@ class AtomicStruct(object):
         """Lock the model's fields in place and compile the custom type.
 
         No modifications are able to be done after this. This is required
-        before the compiled type and data become accessible.
+        before the compiled type and data become accessible. Compiled types
+        are cached in compiled_cache (see get_schema_key and
+        get_schema_attrs).
         """
         self._pack_ = self.alignment
         self._anonymous_ = tuple(self._anonymous)
         self._fields_ = self._fields
-        self._type = type(self._name+'_s', (NullInitializer, self.__class__,
-                                            ctypes.Structure),
-                          dict(self.__dict__))
+        key = self.get_schema_key()
+        try:
+            self._type = compiled_cache[key]
+        except KeyError:
+            self._type = type(self._name+'_s', (NullInitializer,
+                                                self.__class__,
+                                                ctypes.Structure),
+                              self.get_schema_attrs())
+            if key is not None:
+                compiled_cache[key] = self._type
         self._data = self._type()
         self.set_defaults()
 
+    def get_schema_attrs(self):
+        """Class attributes of the compiled type
+
+        Only the layout of the model goes into the type. Attributes set on
+        this instance (eg a game) are left out, so that cached types do not
+        keep them alive.
+
+        Returns
+        -------
+        attrs : dict
+        """
+        return {
+            '_pack_': self._pack_,
+            '_anonymous_': self._anonymous_,
+            '_fields_': list(self._fields_),
+            '_fields': list(self._fields),
+            '_anonymous': list(self._anonymous),
+            '_defaults': dict(self._defaults),
+            '_name': self._name,
+            '_schema_args': self._schema_args,
+            '_type': None,
+            '_data': None,
+            'context': dict(self.context)
+        }
+
+    def get_schema_key(self):
+        """Key that identifies the compiled type of this model
+
+        Models of the same class, name, arguments and final field layout
+        share one compiled type. Since the layout is part of the key,
+        fields changed by after/replace/remove are accounted for.
+
+        Returns
+        -------
+        key : tuple or None
+            None if the key is not hashable. The type is not cached then.
+        """
+        key = (self.__class__, self._name, self._pack_, self._anonymous_,
+               tuple(self._fields), self._schema_args)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
     def set_defaults(self):
         """Set the data fields to their original defaults.
         """
@@ -1,6 +1,5 @@
 
-import array
-from struct import unpack, pack
+from struct import pack, unpack_from
 from collections import namedtuple
 
 from util.io import BinaryIO
@@ -12,50 +11,95 @@ COMPRESSION_LZSS = 0x11
 LZHeader = namedtuple('LZHeader', 'flag size')
 
 
+def decompress(data):
+    """Decompress an LZ77 (0x10) or LZSS (0x11) stream
+
+    Output is decoded into a preallocated bytearray. Literal runs and
+    back-references are copied as slices; overlapping references are
+    expanded by repeating their period.
+
+    Parameters
+    ----------
+    data : string
+        Compressed data starting with the 4 byte header
+
+    Returns
+    -------
+    decompressed : string
+    """
+    raw_header, = unpack_from('I', data)
+    flag = raw_header & 0xFF
+    size = raw_header >> 8
+    if flag == COMPRESSION_LZSS:
+        lz_ss = True
+    elif flag == COMPRESSION_LZ77:
+        lz_ss = False
+    else:
+        raise ValueError('Invalid compression flag: {0}'.format(flag))
+    src = bytearray(data)
+    out = bytearray(size)
+    pos = 4
+    cur = 0
+    while cur < size:
+        control = src[pos]
+        pos += 1
+        if not control:
+            count = min(8, size-cur)
+            out[cur:cur+count] = src[pos:pos+count]
+            pos += count
+            cur += count
+            continue
+        for shift in (7, 6, 5, 4, 3, 2, 1, 0):
+            if cur >= size:
+                break
+            if not (control >> shift) & 0x1:
+                out[cur] = src[pos]
+                pos += 1
+                cur += 1
+                continue
+            head = src[pos]
+            if not lz_ss:
+                count = (head >> 4) + 3
+                back = ((head & 0xF) << 8 | src[pos+1]) + 1
+                pos += 2
+            else:
+                ind = head >> 4
+                if not ind:
+                    count = ((head & 0xF) << 4 | src[pos+1] >> 4) + 0x11
+                    back = ((src[pos+1] & 0xF) << 8 | src[pos+2]) + 1
+                    pos += 3
+                elif ind == 1:
+                    count = ((head & 0xF) << 12 | src[pos+1] << 4 |
+                             src[pos+2] >> 4) + 0x111
+                    back = ((src[pos+2] & 0xF) << 8 | src[pos+3]) + 1
+                    pos += 4
+                else:
+                    count = ind + 1
+                    back = ((head & 0xF) << 8 | src[pos+1]) + 1
+                    pos += 2
+            count = min(count, size-cur)
+            ref = cur-back
+            if count <= back:
+                out[cur:cur+count] = out[ref:ref+count]
+            else:
+                # Overlapping reference repeats the last back bytes
+                out[cur:cur+count] = (out[ref:cur]*(count//back+1))[:count]
+            cur += count
+    return bytes(out)
+
+
 class LZ(object):
+    """LZ77/LZSS decompression of a handle. See decompress()
+
+    The decompressed data replaces the compressed data in the handle.
+    """
     def __init__(self, reader):
         handle = BinaryIO.reader(reader)
         start = handle.tell()
-        raw_header = unpack('I', handle.read(4))[0]
-        self.header = LZHeader._make([raw_header&0xFF, raw_header>>8])
-        if self.header.flag == 0x11:
-            lz_ss = True
-        elif self.header.flag == 0x10:
-            lz_ss = False
-        else:
-            raise ValueError('Invalid compression flag: {0}'
-                             .format(self.header.flag))
-        out = []
-        while len(out) < self.header.size:
-            flag = unpack('B', handle.read(1))[0]
-            for x in range(7, -1, -1):
-                if len(out) >= self.header.size:
-                    break
-                if not (flag >> x) & 0x1:
-                    r = handle.read(1)
-                    out.append(r)
-                    continue
-                head, = unpack('>H', handle.read(2))
-                if not lz_ss:
-                    count = ((head >> 12) & 0xF) + 3
-                    back = head & 0xFFF
-                else:
-                    ind = (head >> 12) & 0xF
-                    if not ind:
-                        tail = unpack('B', handle.read(1))[0]
-                        count = (head >> 4) + 0x11
-                        back = ((head & 0xF) << 8) | tail
-                    elif ind == 1:
-                        tail = unpack('>H', handle.read(2))[0]
-                        count = (((head & 0xFFF) << 4) | (tail >> 12)) + 0x111
-                        back = tail & 0xFFF
-                    else:
-                        count = ind + 1
-                        back = head & 0xFFF
-                cursz = len(out)
-                for y in range(count):
-                    out.append(out[cursz-back-1+y])
-        self.data = "".join(out)
+        data = handle.read()
+        raw_header, = unpack_from('I', data)
+        self.header = LZHeader._make([raw_header & 0xFF, raw_header >> 8])
+        self.data = decompress(data)
         handle.seek(start)
         handle.write(self.data)
         handle.seek(start)
@@ -66,61 +110,135 @@ class LZ(object):
         return ord(data[0]) in (0x10, 0x11)
 
 
+LZ_MIN_MATCH = 3
+LZ_WINDOW = 0x1000
+LZ_DEFAULT_LEVEL = 6
+
+
+def _match_length(data, ref, pos, limit):
+    """Length of the common prefix of data[ref:] and data[pos:]
+
+    Strings are compared in growing chunks so that long runs do not need
+    a Python step per byte.
+    """
+    length = 0
+    step = 16
+    while length < limit:
+        count = min(step, limit-length)
+        if data[ref+length:ref+length+count] != \
+                data[pos+length:pos+length+count]:
+            while data[ref+length] == data[pos+length]:
+                length += 1
+            return length
+        length += count
+        step <<= 1
+    return limit
+
+
+def compress(data, compression=COMPRESSION_LZ77, level=LZ_DEFAULT_LEVEL):
+    """Compress data into an LZ stream readable by LZ
+
+    Matches are found with a hash chain over 3-byte prefixes, limited to
+    the 0x1000 byte window that the format can address.
+
+    Parameters
+    ----------
+    data : string
+        Uncompressed data
+    compression : int, optional
+        COMPRESSION_LZ77 (0x10) or COMPRESSION_LZSS (0x11). LZSS allows
+        matches up to 0x10110 bytes long.
+    level : int, optional
+        Speed/ratio tradeoff from 0 to 9. At most 2**level candidates are
+        checked for each position. 0 is fastest.
+
+    Returns
+    -------
+    compressed : string
+        Compressed data including the 4 byte header
+    """
+    if compression == COMPRESSION_LZSS:
+        max_len = 0x10110
+    elif compression == COMPRESSION_LZ77:
+        max_len = 0x12
+    else:
+        raise ValueError('Invalid compression flag: {0}'
+                         .format(compression))
+    depth = 1 << max(0, min(level, 9))
+    size = len(data)
+    out = bytearray(pack('I', compression | (size << 8)))
+    head = {}
+    prev = [-1]*size
+    hash_end = size-LZ_MIN_MATCH+1
+    flag_pos = 0
+    bit = 0
+    pos = 0
+    while pos < size:
+        if not bit:
+            flag_pos = len(out)
+            out.append(0)
+            bit = 0x80
+        limit = min(max_len, size-pos)
+        best_len = LZ_MIN_MATCH-1
+        best_ofs = 0
+        if limit >= LZ_MIN_MATCH:
+            cand = head.get(data[pos:pos+LZ_MIN_MATCH], -1)
+            tries = depth
+            while cand >= 0 and tries:
+                ofs = pos-cand
+                if ofs > LZ_WINDOW:
+                    break
+                if data[cand+best_len] == data[pos+best_len]:
+                    length = _match_length(data, cand, pos, limit)
+                    if length > best_len:
+                        best_len = length
+                        best_ofs = ofs
+                        if length == limit:
+                            break
+                tries -= 1
+                cand = prev[cand]
+        if best_len >= LZ_MIN_MATCH:
+            out[flag_pos] |= bit
+            back = best_ofs-1
+            if compression == COMPRESSION_LZ77:
+                out.append((best_len-3) << 4 | back >> 8)
+            elif best_len <= 0x10:
+                out.append((best_len-1) << 4 | back >> 8)
+            elif best_len <= 0x110:
+                count = best_len-0x11
+                out.append(count >> 4)
+                out.append((count & 0xF) << 4 | back >> 8)
+            else:
+                count = best_len-0x111
+                out.append(0x10 | count >> 12)
+                out.append((count >> 4) & 0xFF)
+                out.append((count & 0xF) << 4 | back >> 8)
+            out.append(back & 0xFF)
+            advance = best_len
+        else:
+            out.append(data[pos])
+            advance = 1
+        for idx in xrange(pos, min(pos+advance, hash_end)):
+            key = data[idx:idx+LZ_MIN_MATCH]
+            prev[idx] = head.get(key, -1)
+            head[key] = idx
+        pos += advance
+        bit >>= 1
+    return bytes(out)
+
+
 class LZCompress(object):
-    """LZ77 Compression. Basic sliding window implementation
+    """LZ77/LZSS Compression. See compress()
     """
-    def __init__(self, reader, compression=COMPRESSION_LZ77):
+    def __init__(self, reader, compression=COMPRESSION_LZ77,
+                 level=LZ_DEFAULT_LEVEL):
         handle = BinaryIO.reader(reader)
         start = handle.tell()
-        data = array.array('B', handle.read())
+        data = handle.read()
         self.header = LZHeader._make([compression, len(data)])
         handle.truncate(start)
         handle.seek(start)
-        handle.write(pack('I', self.header.flag | (self.header.size << 8)))
-
-        out = array.array('B')
-        out.append(0)
-        out.extend(data[:4])
-        pos = 4
-        endpos = len(data)
-        search_start = 0
-        max_len = 0x12
-        control_bit = 4
-        flag = 0
-        flag_pos = 0
-        while pos < endpos:
-            best_pos = None
-            best_len = 0
-            for check in xrange(search_start, pos):
-                for idx in xrange(0, min(max_len+1, pos-check, endpos-pos)):
-                    if data[check+idx] != data[pos+idx]:
-                        break
-                if idx >= best_len:
-                    best_len = idx
-                    best_pos = check
-                    if idx >= max_len:
-                        break
-            control_bit -= 1
-            if best_len < 3:
-                out.append(data[pos])
-                pos += 1
-            else:
-                flag |= 1 << control_bit
-                head = (best_len-3) << 0xC
-                head |= pos-best_pos-1
-                out.append(head >> 8)
-                out.append(head & 0xFF)
-                pos += best_len
-            if control_bit <= 0:
-                if pos >= 0x400:
-                    search_start = pos-0x400
-                control_bit = 8
-                out[flag_pos] = flag
-                flag_pos = len(out)
-                flag = 0
-                out.append(0)
-        out[flag_pos] = flag
-        handle.write(out.tostring())
+        handle.write(compress(data, compression, level))
         self.handle = handle
 
 
@@ -1,15 +1,241 @@
 
 import array
-import itertools
+import multiprocessing
 import os
 import shutil
 import struct
 
+import numpy as np
+
 from ntr.overlay import OverlayTable
-from util.io import BinaryIO
+from util.io import AtomicFile, BinaryIO
+from util.manifest import Manifest
 
 ARM9_BLZ_BEACON = 0xdec00621
 ARM9_BLZ_UNBEACON = 0x2106c0de
+BLZ_MIN_MATCH = 3
+BLZ_MAX_MATCH = 0x12
+BLZ_MIN_DISP = 3
+BLZ_MAX_DISP = 0x1002
+
+
+def _control_runs(control):
+    """Split a BLZ control byte into tokens, MSB first. Each token is
+    either the length of a run of literals or 0 for a back-reference.
+    """
+    runs = []
+    literals = 0
+    for shift in xrange(7, -1, -1):
+        if control & (1 << shift):
+            if literals:
+                runs.append(literals)
+                literals = 0
+            runs.append(0)
+        else:
+            literals += 1
+    if literals:
+        runs.append(literals)
+    return tuple(runs)
+
+
+BLZ_CONTROL_RUNS = [_control_runs(control) for control in xrange(0x100)]
+
+
+def _take_is_sequential():
+    """Check that np.take writes element by element when out overlaps the
+    input, so that later indices can read values written by earlier ones.
+    Newer NumPy releases may buffer the output instead.
+    """
+    buff = np.array([1, 0, 0, 0], dtype=np.uint8)
+    np.take(buff, [0, 1, 2], out=buff[1:], mode='clip')
+    return buff.tolist() == [1, 1, 1, 1]
+
+
+BLZ_SEQUENTIAL_TAKE = _take_is_sequential()
+# Number of back-references flagged in each control byte
+BLZ_REFERENCE_COUNTS = np.array([bin(control).count('1')
+                                 for control in xrange(0x100)],
+                                dtype=np.uint8)
+# Length of a group of 8 tokens in the stream, by control byte
+BLZ_GROUP_LENGTHS = BLZ_REFERENCE_COUNTS.astype(np.intp)+9
+# Groups skipped per step when searching for control bytes is 2**this
+BLZ_GROUP_DOUBLINGS = 3
+# Output bytes resolved per np.take call
+BLZ_DECODE_BLOCK = 0x10000
+
+
+def _decode_slices(stream):
+    """Decode a BLZ stream, copying whole literal runs and back-references
+    by slice
+
+    Parameters
+    ----------
+    stream : string
+        Compressed bytes between the uncompressed head and the footer
+
+    Returns
+    -------
+    data : string
+        Decompressed bytes, in file order
+    """
+    src = bytearray(stream)
+    src.reverse()
+    srclen = len(src)
+    out = bytearray()
+    pos = 0
+    while pos < srclen:
+        control = src[pos]
+        pos += 1
+        for run in BLZ_CONTROL_RUNS[control]:
+            if run:
+                out += src[pos:pos+run]
+                pos += run
+                continue
+            if pos >= srclen:
+                break
+            count = src[pos]
+            ofs = ((count & 0xF) << 8 | src[pos+1])+BLZ_MIN_DISP
+            count = (count >> 4)+BLZ_MIN_MATCH
+            pos += 2
+            ref = len(out)-ofs
+            if count <= ofs:
+                out += out[ref:ref+count]
+            else:
+                # Overlapping copy repeats the last ofs bytes
+                out += (out[ref:]*(count//ofs+1))[:count]
+    out.reverse()
+    return bytes(out)
+
+
+def _control_positions(src):
+    """Find the control bytes of a reversed BLZ stream
+
+    Each control byte is followed by 8 tokens, so the next one is
+    BLZ_GROUP_LENGTHS further on. Jumps of 2**BLZ_GROUP_DOUBLINGS groups
+    are built by pointer doubling and walked in Python, then filled in.
+
+    Parameters
+    ----------
+    src : ndarray
+        Stream bytes, in decoding order
+
+    Returns
+    -------
+    ctrl : ndarray
+        Positions of the control bytes in src
+    """
+    size = len(src)
+    # Position of the next control byte if each byte were one. Padded so
+    # that positions past the end lead to size.
+    far = np.empty(size+18, dtype=np.intp)
+    far[:size] = src
+    BLZ_GROUP_LENGTHS.take(far[:size], out=far[:size], mode='clip')
+    far[:size] += np.arange(size)
+    far[size:] = size
+    jump = far
+    far = jump.take(jump, mode='clip')
+    for step in xrange(1, BLZ_GROUP_DOUBLINGS):
+        # In place, as every jump is forward
+        far.take(far, out=far, mode='clip')
+    samples = []
+    pos = 0
+    item = far.item
+    while pos < size:
+        samples.append(pos)
+        pos = item(pos)
+    ctrl = np.empty((1 << BLZ_GROUP_DOUBLINGS, len(samples)), dtype=np.intp)
+    ctrl[0] = samples
+    for step in xrange(1, 1 << BLZ_GROUP_DOUBLINGS):
+        jump.take(ctrl[step-1], out=ctrl[step], mode='clip')
+    ctrl = ctrl.T.ravel()
+    return ctrl[:np.searchsorted(ctrl, size)]
+
+
+def _decode_array(stream):
+    """Decode a BLZ stream with NumPy
+
+    Every output byte is a copy of either a literal in the stream or an
+    earlier output byte. The stream is parsed into control bytes and
+    references with array operations, giving the source of each output
+    byte. np.take over the stream followed by the output then resolves
+    the copies in order, BLZ_DECODE_BLOCK bytes at a time. Needs
+    BLZ_SEQUENTIAL_TAKE.
+
+    Parameters
+    ----------
+    stream : string
+        Compressed bytes between the uncompressed head and the footer
+
+    Returns
+    -------
+    data : ndarray
+        Decompressed bytes, in file order
+    """
+    size = len(stream)
+    src = np.frombuffer(stream[::-1], dtype=np.uint8)
+    ctrl = _control_positions(src)
+    num_groups = len(ctrl)
+    controls = src.take(ctrl)
+    # Token number (8 per group) and stream position of each reference
+    tokens = np.flatnonzero(np.unpackbits(controls).view(bool))
+    groups = tokens >> 3
+    refs = np.arange(len(tokens))
+    firsts = BLZ_REFERENCE_COUNTS.take(controls)
+    firsts = np.cumsum(firsts, dtype=np.intp)-firsts
+    base = firsts-ctrl
+    base += np.arange(-1, 8*num_groups-1, 8)
+    refpos = tokens+refs
+    refpos -= base.take(groups)
+    num_refs = np.searchsorted(refpos, size-1)
+    refpos = refpos[:num_refs]
+    groups = groups[:num_refs]
+    refs = refs[:num_refs]
+    count = src.take(refpos)
+    disp = (count & 0xF).astype(np.intp) << 8
+    disp |= src.take(refpos+1)
+    disp += BLZ_MIN_DISP
+    count = (count >> 4).astype(np.intp)
+    count += BLZ_MIN_MATCH
+    copied = np.zeros(num_refs+1, dtype=np.intp)
+    np.cumsum(count, out=copied[1:])
+    total = size-num_groups-2*num_refs+copied[-1]
+    # Output position of each reference and of each group's first token
+    starts = tokens[:num_refs]-refs
+    starts += copied[:-1]
+    heads = np.arange(0, 8*num_groups, 8)
+    heads -= firsts
+    heads += copied.take(firsts)
+    # Output byte i is copied from i+offset in src followed by the output.
+    # The offset changes where a reference starts, where literals resume
+    # after one and where a group starts. Literals skip control bytes and
+    # reference bytes, references read disp bytes back.
+    steps = [(starts+count, groups+2*refs+3-copied[1:]),
+             (heads, np.arange(1, num_groups+1)+2*firsts-copied.take(firsts)),
+             (starts, size-disp)]
+    # Spread the offsets forward a block at a time, reusing the buffers
+    bounds = range(0, total, BLZ_DECODE_BLOCK)+[total]
+    cuts = [events.searchsorted(bounds) for events, values in steps]
+    length = min(total, BLZ_DECODE_BLOCK)
+    offsets = np.arange(length)
+    prev = np.empty(length, dtype=np.intp)
+    index = np.empty(length+1, dtype=np.intp)
+    buff = np.empty(size+total, dtype=np.uint8)
+    buff[:size] = src
+    for block in xrange(len(bounds)-1):
+        low, high = bounds[block:block+2]
+        view = index[1:high-low+1]
+        # Each byte takes its offset from the previous one, except events
+        prev[:] = offsets
+        for (events, values), cut in zip(steps, cuts):
+            lo, hi = cut[block:block+2]
+            events = events[lo:hi]-low
+            prev[events] = events+1
+            view[events] = values[lo:hi]+low
+        index.take(prev[:len(view)], out=view, mode='clip')
+        view += offsets[:len(view)]
+        np.take(buff, view, out=buff[size+low:size+high], mode='clip')
+        index[0] = view[-1]+1
+    return buff[:size-1:-1].copy()
 
 
 def decompress(reader, end):
@@ -19,6 +245,10 @@ def decompress(reader, end):
     bad optimization issues in BW. *cough* r8 *cough*). And yes, DP does
     have LZ compression that it does not make use in arm9.bin
 
+    The compressed stream is read backwards from the footer. It is decoded
+    with _decode_array, or token run by token run with _decode_slices if
+    this NumPy cannot do in-order copies (BLZ_SEQUENTIAL_TAKE).
+
     Parameters
     ----------
     reader : io instance
@@ -31,62 +261,163 @@ def decompress(reader, end):
         The fully decompressed file
     """
     reader.seek(0)
-    buff = array.array('B', reader.read(end))
-    reader.seek(end-8)
-    topinfo = reader.readUInt32()
-    diff = reader.readUInt32()
-    buff.extend(itertools.repeat(0, diff))
+    data = reader.read(end)
+    topinfo, diff = struct.unpack_from('II', data, end-8)
     stop = end-(topinfo & 0xFFFFFF)
-    cur = end+diff
     ptr = end-(topinfo >> 24)
-    while(ptr > stop):
-        ptr -= 1
-        control = buff[ptr]
-        shift = 8
-        while shift > 0:
-            shift -= 1
-            if control & 0x80:
-                ptr -= 1
-                count = buff[ptr]
-                ptr -= 1
-                ofs = buff[ptr]
-                ofs |= count << 8
-                ofs &= 0xFFF
-                ofs += 2
-                count += 32  # one extra loop
-                while count >= 0:
-                    dup = buff[cur+ofs]
-                    cur -= 1
-                    buff[cur] = dup
-                    count -= 16
-            else:
-                ptr -= 1
-                cur -= 1
-                dup = buff[ptr]
-                buff[cur] = dup
-            control <<= 1
-            if ptr <= stop:
-                break
+    if BLZ_SEQUENTIAL_TAKE:
+        out = _decode_array(data[stop:ptr])
+    else:
+        out = _decode_slices(data[stop:ptr])
+    cur = end+diff-len(out)
+    if cur > end:
+        buff = array.array('B', data)
+        buff.fromstring('\x00'*(cur-end))
+    else:
+        buff = array.array('B', data[:cur])
+    buff.fromstring(buffer(out))
     return buff
 
 
-def decompress_arm9(game):
+def compress(data, start=0, depth=32):
+    """BLZ Compression compatible with decompress()
+
+    Data is compressed from the end backwards, leaving an uncompressed
+    head wherever compression would not save space or where in-place
+    decompression would overwrite unread input. Matches are found with
+    a hash chain over the reversed data.
+
+    Parameters
+    ----------
+    data : string
+        Uncompressed data
+    start : int, optional
+        Number of bytes at the start of data to always leave uncompressed.
+        For arm9.bin this should be 0x4000 to skip the secure area.
+    depth : int, optional
+        Maximum number of hash chain candidates to check at each position.
+        Higher values give better compression at the cost of speed.
+
+    Returns
+    -------
+    compressed : string or None
+        Compressed data ending in the BLZ footer. None is returned if the
+        data cannot be made smaller.
+    """
+    size = len(data)
+    rdata = bytearray(data[start:])
+    rdata.reverse()
+    total = len(rdata)
+    rstring = bytes(rdata)
+    stream = bytearray()
+    head = {}
+    prev = [-1]*total
+    flag_pos = 0
+    bit = 0
+    best_gain = 0
+    best_in = best_out = 0
+    pos = 0
+    while pos < total:
+        if not bit:
+            flag_pos = len(stream)
+            stream.append(0)
+            bit = 0x80
+        best_len = 0
+        best_ofs = 0
+        max_len = min(BLZ_MAX_MATCH, total-pos)
+        if max_len >= BLZ_MIN_MATCH:
+            key = rstring[pos:pos+BLZ_MIN_MATCH]
+            cand = head.get(key, -1)
+            tries = depth
+            while cand >= 0 and tries:
+                ofs = pos-cand
+                if ofs > BLZ_MAX_DISP:
+                    break
+                if ofs >= BLZ_MIN_DISP:
+                    length = BLZ_MIN_MATCH
+                    while length < max_len and \
+                            rdata[cand+length] == rdata[pos+length]:
+                        length += 1
+                    if length > best_len:
+                        best_len = length
+                        best_ofs = ofs
+                        if length == max_len:
+                            break
+                    tries -= 1
+                cand = prev[cand]
+        if best_len >= BLZ_MIN_MATCH:
+            stream[flag_pos] |= bit
+            disp = best_ofs-BLZ_MIN_DISP
+            stream.append((best_len-BLZ_MIN_MATCH) << 4 | disp >> 8)
+            stream.append(disp & 0xFF)
+            advance = best_len
+        else:
+            stream.append(rdata[pos])
+            advance = 1
+        for idx in xrange(pos, min(pos+advance, total-BLZ_MIN_MATCH+1)):
+            key = rstring[idx:idx+BLZ_MIN_MATCH]
+            prev[idx] = head.get(key, -1)
+            head[key] = idx
+        pos += advance
+        bit >>= 1
+        # Only cut the stream where everything before it saved space, so
+        # that in-place decompression never overtakes its input
+        gain = pos-len(stream)
+        if gain > best_gain:
+            best_gain = gain
+            best_in = len(stream)
+            best_out = pos
+    raw_size = size-best_out
+    padding = (-(raw_size+best_in)) % 4
+    header_size = 8+padding
+    if best_gain <= header_size:
+        return None
+    stream = stream[:best_in]
+    stream.reverse()
+    compressed = size-best_gain+header_size
+    return ''.join([data[:raw_size], bytes(stream), '\xFF'*padding,
+                    struct.pack('II', header_size << 24 | best_in+header_size,
+                                size-compressed)])
+
+
+def workspace_manifest(game):
+    """Get the Manifest of a Game's workspace"""
+    try:
+        return game.manifest
+    except AttributeError:
+        return Manifest(game.files.directory)
+
+
+def decompress_arm9(game, manifest=None):
     """Creates an arm9.dec.bin in the Game's workspace
 
-    This file will be created even if arm9.bin is already decompressed
+    This file will be created even if arm9.bin is already decompressed.
+    It is only created again once arm9.bin or header.bin change.
+
+    Parameters
+    ----------
+    game : Game
+    manifest : Manifest, optional
+        Workspace manifest. If not given, the game's manifest is used and
+        saved when done.
     """
+    save = manifest is None
+    if save:
+        manifest = workspace_manifest(game)
     workspace = game.files.directory
-    try:
-        if os.path.getsize(os.path.join(workspace, 'arm9.dec.bin')) > 0:
-            return
-    except OSError:
-        pass
+    outname = os.path.join(workspace, 'arm9.dec.bin')
+    inputs = [os.path.join(workspace, 'arm9.bin'),
+              os.path.join(workspace, 'header.bin')]
+    if not manifest.changed(outname, inputs, editable=True):
+        if save:
+            manifest.save()
+        return
     with open(os.path.join(workspace, 'header.bin')) as header:
         header.seek(0x24)
         entry, ram_offset, size = struct.unpack('III', header.read(12))
 
     with open(os.path.join(workspace, 'arm9.bin')) as arm9,\
-            open(os.path.join(workspace, 'arm9.dec.bin'), 'w') as arm9dec:
+            AtomicFile(outname) as arm9dec:
         arm9.seek(game.load_info-ram_offset+0x14)
         end, u18, beacon, unbeacon = struct.unpack('IIII', arm9.read(16))
         assert beacon & 0xFFFF0000 == ARM9_BLZ_BEACON & 0xFFFF0000
@@ -100,27 +431,77 @@ def decompress_arm9(game):
             # already decompressed
             arm9.seek(0)
             arm9dec.write(arm9.read())
-            return
+            end = None
         except struct.error:
             pass  # at EOF
-        reader = BinaryIO.reader(arm9)
-        buff = decompress(reader, end-ram_offset)
-        for i in range(game.load_info-ram_offset+0x14,
-                       game.load_info-ram_offset+0x18):
-            buff[i] = 0
-        buff.tofile(arm9dec)
+        if end is not None:
+            reader = BinaryIO.reader(arm9)
+            buff = decompress(reader, end-ram_offset)
+            for i in range(game.load_info-ram_offset+0x14,
+                           game.load_info-ram_offset+0x18):
+                buff[i] = 0
+            buff.tofile(arm9dec)
+    manifest.record(outname, inputs)
+    if save:
+        manifest.save()
+
+
+def _decompress_overlay(job):
+    """Decompresses or copies one overlay
+
+    This is run in worker processes by decompress_overlays()
+
+    Parameters
+    ----------
+    job : tuple
+        (source path, target path, end). end is None for uncompressed
+        overlays, which are copied as-is.
+    """
+    fname, outname, end = job
+    with open(fname, 'rb') as handle:
+        source = handle.read()
+    if end is None:
+        data = source
+    else:
+        data = decompress(BinaryIO(source), end).tostring()
+    with AtomicFile(outname) as handle:
+        handle.write(data)
+    if end is None:
+        shutil.copystat(fname, outname)
 
 
-def decompress_overlays(game):
+def decompress_overlays(game, workers=None, manifest=None):
     """Creates an overarm9.dec.bin in the Game's workspace and
     an overlays_dez directory
+
+    Nothing is done while overarm9.dec.bin exists and overarm9.bin,
+    header.bin and overlays/ are unchanged since it was made. Otherwise
+    only the overlays whose own source changed or whose output is missing
+    are decompressed again, in a process pool, so edits to the others in
+    overlays_dez are kept. Each output is written atomically.
+
+    Parameters
+    ----------
+    game : Game
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs. With
+        1 worker, overlays are decompressed in this process.
+    manifest : Manifest, optional
+        Workspace manifest. If not given, the game's manifest is used and
+        saved when done.
     """
+    save = manifest is None
+    if save:
+        manifest = workspace_manifest(game)
     workspace = game.files.directory
-    try:
-        if os.path.getsize(os.path.join(workspace, 'overarm9.dec.bin')) > 0:
-            return
-    except OSError:
-        pass
+    overarm_name = os.path.join(workspace, 'overarm9.dec.bin')
+    inputs = [os.path.join(workspace, 'overarm9.bin'),
+              os.path.join(workspace, 'header.bin'),
+              os.path.join(workspace, 'overlays')]
+    if not manifest.changed(overarm_name, inputs, editable=True):
+        if save:
+            manifest.save()
+        return
     try:
         os.mkdir(os.path.join(workspace, 'overlays_dez'))
     except:
@@ -131,24 +512,38 @@ def decompress_overlays(game):
     with open(os.path.join(workspace, 'overarm9.bin')) as overarm:
         ovt = OverlayTable(size >> 5, reader=overarm)
 
-        for overlay in ovt.overlays:
-            fname = os.path.join(workspace, 'overlays',
-                                 'overlay_{0:04}.bin'.format(overlay.file_id))
-            outname = os.path.join(workspace, 'overlays_dez',
-                                   'overlay_{0:04}.bin'.format(
-                                       overlay.file_id))
-            if overlay.compressed:
-                end = overlay.reserved & 0xFFFFFF
-                with open(fname) as compressed_handle,\
-                        open(outname, 'w') as decompressed_handle:
-                    reader = BinaryIO.reader(compressed_handle)
-                    buff = decompress(reader, end)
-                    buff.tofile(decompressed_handle)
-                overlay.reserved = 0
-            else:
-                shutil.copy2(fname, outname)
-    with open(os.path.join(workspace, 'overarm9.dec.bin'), 'w') as overarm:
+    jobs = []
+    for overlay in ovt.overlays:
+        basename = 'overlay_{0:04}.bin'.format(overlay.file_id)
+        fname = os.path.join(workspace, 'overlays', basename)
+        outname = os.path.join(workspace, 'overlays_dez', basename)
+        if overlay.compressed:
+            end = overlay.reserved & 0xFFFFFF
+            overlay.reserved = 0
+        else:
+            end = None
+        if manifest.changed(outname, [fname], editable=True):
+            jobs.append((fname, outname, end))
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            pool.map(_decompress_overlay, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        map(_decompress_overlay, jobs)
+    for fname, outname, end in jobs:
+        manifest.record(outname, [fname])
+
+    with AtomicFile(overarm_name) as overarm:
         ovt.save(overarm)
+    manifest.record(overarm_name, inputs)
+    if save:
+        manifest.save()
 
 
 if __name__ == '__main__':
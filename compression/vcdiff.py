@@ -0,0 +1,756 @@
+
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from util.io import AtomicFile
+
+VCDIFF_MAGIC = '\xd6\xc3\xc4\x00'
+VCD_DECOMPRESS = 0x01
+VCD_CODETABLE = 0x02
+VCD_APPHEADER = 0x04
+VCD_SOURCE = 0x01
+VCD_TARGET = 0x02
+#: xdelta3 extension: Adler-32 of the target window after the section sizes
+VCD_ADLER32 = 0x04
+
+NOOP = 0
+ADD = 1
+RUN = 2
+COPY = 3
+
+NEAR_SIZE = 4
+SAME_SIZE = 3
+VCD_SELF = 0
+VCD_HERE = 1
+NUM_MODES = 2+NEAR_SIZE+SAME_SIZE
+
+#: Size of the source blocks indexed for matching
+BLOCK_SIZE = 16
+#: Largest target window encoded at once
+MAX_WINDOW = 0x400000
+#: Source searched on either side of where a target window lines up
+MARGIN = 0x100000
+#: Shortest run of one byte encoded as a RUN instead of being added
+MIN_RUN = 8
+
+HASH_MULTIPLIERS = (np.uint64(0x9E3779B97F4A7C15),
+                    np.uint64(0xC2B2AE3D27D4EB4F))
+
+
+def _default_code_table():
+    """Build the default instruction code table of RFC 3284 section 5.6
+
+    Returns
+    -------
+    table : list
+        (type1, size1, mode1, type2, size2, mode2) for each opcode
+    """
+    table = [(RUN, 0, 0, NOOP, 0, 0)]
+    for size in xrange(18):
+        table.append((ADD, size, 0, NOOP, 0, 0))
+    for mode in xrange(NUM_MODES):
+        table.append((COPY, 0, mode, NOOP, 0, 0))
+        for size in xrange(4, 19):
+            table.append((COPY, size, mode, NOOP, 0, 0))
+    for mode in xrange(6):
+        for add_size in xrange(1, 5):
+            for copy_size in xrange(4, 7):
+                table.append((ADD, add_size, 0, COPY, copy_size, mode))
+    for mode in xrange(6, NUM_MODES):
+        for add_size in xrange(1, 5):
+            table.append((ADD, add_size, 0, COPY, 4, mode))
+    for mode in xrange(NUM_MODES):
+        table.append((COPY, 4, mode, ADD, 1, 0))
+    return table
+
+
+CODE_TABLE = _default_code_table()
+DECODE_TABLE = [tuple(inst for inst in (code[:3], code[3:])
+                      if inst[0] != NOOP) for code in CODE_TABLE]
+SINGLE_CODES = dict((code[:3], idx) for idx, code in enumerate(CODE_TABLE)
+                    if code[3] == NOOP)
+PAIR_CODES = dict((code, idx) for idx, code in enumerate(CODE_TABLE)
+                  if code[3] != NOOP)
+
+#: A target range and the source segment it is encoded against. anchor is
+#: the source offset that lines up with target_start. exact windows only
+#: search their own source range, others search MARGIN around anchor.
+Window = namedtuple('Window', 'target_start target_stop source_start'
+                    ' source_stop anchor exact')
+
+
+def write_int(buff, value):
+    """Append a VCDIFF variable length integer to a bytearray"""
+    digits = [value & 0x7F]
+    value >>= 7
+    while value:
+        digits.append(0x80 | (value & 0x7F))
+        value >>= 7
+    digits.reverse()
+    buff.extend(digits)
+
+
+def read_int(buff, pos):
+    """Read a VCDIFF variable length integer
+
+    Parameters
+    ----------
+    buff : bytearray
+    pos : int
+
+    Returns
+    -------
+    value : int
+    pos : int
+        Position after the integer
+    """
+    value = 0
+    while True:
+        byte = buff[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _read_handle_int(handle):
+    value = 0
+    while True:
+        char = handle.read(1)
+        if not char:
+            raise ValueError('Unexpected end of patch')
+        byte = ord(char)
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value
+
+
+class AddressCache(object):
+    """The near and same address caches of RFC 3284 section 5.1"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.near = [0]*NEAR_SIZE
+        self.next_slot = 0
+        self.same = [0]*(SAME_SIZE*256)
+
+    def update(self, address):
+        self.near[self.next_slot] = address
+        self.next_slot = (self.next_slot+1) % NEAR_SIZE
+        self.same[address % (SAME_SIZE*256)] = address
+
+    def encode(self, address, here):
+        """Pick the mode that stores address in the fewest bytes
+
+        Returns
+        -------
+        mode : int
+        value : int
+        is_byte : bool
+            If True, value is written as a single byte instead of an
+            integer
+        """
+        slot = address % (SAME_SIZE*256)
+        if self.same[slot] == address:
+            self.update(address)
+            return 2+NEAR_SIZE+slot//256, slot % 256, True
+        mode, value = VCD_SELF, address
+        if here-address < value:
+            mode, value = VCD_HERE, here-address
+        for idx, near in enumerate(self.near):
+            if 0 <= address-near < value:
+                mode, value = 2+idx, address-near
+        self.update(address)
+        return mode, value, False
+
+    def decode(self, mode, buff, pos, here):
+        """Read an address
+
+        Returns
+        -------
+        address : int
+        pos : int
+            Position in buff after the address
+        """
+        if mode >= 2+NEAR_SIZE:
+            address = self.same[(mode-2-NEAR_SIZE)*256+buff[pos]]
+            pos += 1
+        else:
+            address, pos = read_int(buff, pos)
+            if mode == VCD_HERE:
+                address = here-address
+            elif mode >= 2:
+                address += self.near[mode-2]
+        self.update(address)
+        return address, pos
+
+
+class WindowEncoder(object):
+    """Instruction, data and address sections of one target window
+
+    Instructions are written with the default code table. An ADD or COPY
+    whose size fits in its opcode is merged with the next instruction when
+    the table has a code for the pair.
+
+    Parameters
+    ----------
+    source_size : int
+        Size of the source segment
+    """
+    def __init__(self, source_size):
+        self.source_size = source_size
+        self.size = 0
+        self.data = bytearray()
+        self.inst = bytearray()
+        self.addr = bytearray()
+        self.cache = AddressCache()
+        self.last = None
+
+    def _emit(self, type_, size, mode=0):
+        if self.last is not None:
+            pos, last = self.last
+            try:
+                self.inst[pos] = PAIR_CODES[last+(type_, size, mode)]
+            except KeyError:
+                pass
+            else:
+                self.last = None
+                return
+        try:
+            code = SINGLE_CODES[(type_, size, mode)]
+        except KeyError:
+            self.inst.append(SINGLE_CODES[(type_, 0, mode)])
+            write_int(self.inst, size)
+            self.last = None
+        else:
+            self.last = (len(self.inst), (type_, size, mode))
+            self.inst.append(code)
+
+    def add(self, data):
+        self._emit(ADD, len(data))
+        self.data.extend(data)
+        self.size += len(data)
+
+    def run(self, byte, size):
+        self._emit(RUN, size)
+        self.data.append(byte)
+        self.size += size
+
+    def copy(self, address, size):
+        mode, value, is_byte = self.cache.encode(address,
+                                                 self.source_size+self.size)
+        self._emit(COPY, size, mode)
+        if is_byte:
+            self.addr.append(value)
+        else:
+            write_int(self.addr, value)
+        self.size += size
+
+    def literal(self, chunk):
+        """Add target bytes, using RUNs for long runs of a single byte
+
+        Parameters
+        ----------
+        chunk : numpy.ndarray
+        """
+        if len(chunk) < MIN_RUN:
+            if len(chunk):
+                self.add(chunk.tobytes())
+            return
+        changes = np.flatnonzero(chunk[1:] != chunk[:-1])+1
+        starts = np.concatenate(([0], changes))
+        stops = np.concatenate((changes, [len(chunk)]))
+        runs = np.flatnonzero(stops-starts >= MIN_RUN)
+        pos = 0
+        for idx in runs.tolist():
+            start = int(starts[idx])
+            stop = int(stops[idx])
+            if start > pos:
+                self.add(chunk[pos:start].tobytes())
+            self.run(int(chunk[start]), stop-start)
+            pos = stop
+        if pos < len(chunk):
+            self.add(chunk[pos:].tobytes())
+
+    def tostring(self, source_start=None, checksum=None):
+        """Serialize the window
+
+        Parameters
+        ----------
+        source_start : int or None
+            Position of the source segment in the source file. None if
+            the window has no source segment.
+        checksum : int or None
+            Adler-32 of the target window
+        """
+        out = bytearray()
+        indicator = 0
+        if source_start is not None:
+            indicator |= VCD_SOURCE
+        if checksum is not None:
+            indicator |= VCD_ADLER32
+        out.append(indicator)
+        if source_start is not None:
+            write_int(out, self.source_size)
+            write_int(out, source_start)
+        delta = bytearray()
+        write_int(delta, self.size)
+        delta.append(0)
+        write_int(delta, len(self.data))
+        write_int(delta, len(self.inst))
+        write_int(delta, len(self.addr))
+        if checksum is not None:
+            delta.extend(struct.pack('>I', checksum & 0xFFFFFFFF))
+        delta.extend(self.data)
+        delta.extend(self.inst)
+        delta.extend(self.addr)
+        write_int(out, len(delta))
+        out.extend(delta)
+        return bytes(out)
+
+
+def _words(data):
+    """Little endian 64-bit words starting at every offset of data"""
+    count = len(data)-7
+    words = data[:count].astype(np.uint64)
+    for shift in xrange(1, 8):
+        words |= data[shift:shift+count].astype(np.uint64) << \
+            np.uint64(shift*8)
+    return words
+
+
+def _block_hashes(words):
+    return words[:-8]*HASH_MULTIPLIERS[0]+words[8:]*HASH_MULTIPLIERS[1]
+
+
+class SourceIndex(object):
+    """Hashes of the aligned BLOCK_SIZE blocks of a source segment
+
+    Parameters
+    ----------
+    source : numpy.ndarray
+    """
+    def __init__(self, source):
+        self.source = source
+        count = len(source)//BLOCK_SIZE
+        words = np.frombuffer(source[:count*BLOCK_SIZE].tobytes(),
+                              dtype='<u8').reshape(count, 2)
+        hashes = words[:, 0]*HASH_MULTIPLIERS[0] + \
+            words[:, 1]*HASH_MULTIPLIERS[1]
+        order = np.argsort(hashes, kind='mergesort')
+        self.hashes = hashes[order]
+        self.offsets = order*BLOCK_SIZE
+
+    def candidates(self, target):
+        """Find target offsets whose block hash is in the source
+
+        Returns
+        -------
+        positions : numpy.ndarray
+            Target offsets
+        offsets : numpy.ndarray
+            Source offset of a block with the same hash for each position
+        """
+        if len(target) < BLOCK_SIZE or not len(self.hashes):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        hashes = _block_hashes(_words(target))
+        found = np.searchsorted(self.hashes, hashes)
+        np.minimum(found, len(self.hashes)-1, out=found)
+        hits = self.hashes[found] == hashes
+        return np.flatnonzero(hits), self.offsets[found[hits]]
+
+
+def _extend(target, source, target_pos, source_pos, limit):
+    """Count how many bytes match going forward, up to limit"""
+    size = min(limit-target_pos, len(source)-source_pos)
+    matched = 0
+    step = 64
+    while matched < size:
+        step = min(step, size-matched)
+        diff = np.flatnonzero(
+            target[target_pos+matched:target_pos+matched+step] !=
+            source[source_pos+matched:source_pos+matched+step])
+        if len(diff):
+            return matched+int(diff[0])
+        matched += step
+        step *= 4
+    return size
+
+
+def diagonal_matches(target, source, anchor, min_size=BLOCK_SIZE*2):
+    """Find the runs of bytes that are unchanged where target lines up
+    with source
+
+    Parameters
+    ----------
+    target : numpy.ndarray
+    source : numpy.ndarray
+    anchor : int
+        Offset in source that lines up with the start of target
+
+    Returns
+    -------
+    matches : list
+        (target_start, target_stop, source_start) of each run
+    """
+    low = max(0, -anchor)
+    high = min(len(target), len(source)-anchor)
+    if high-low < min_size:
+        return []
+    equal = target[low:high] == source[low+anchor:high+anchor]
+    edges = np.diff(np.concatenate(([0], equal.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    keep = stops-starts >= min_size
+    return [(start+low, stop+low, start+low+anchor) for start, stop
+            in zip(starts[keep].tolist(), stops[keep].tolist())]
+
+
+def block_matches(target, index, start, stop, chunk=0x10000):
+    """Find matches of target[start:stop] anywhere in an indexed source
+
+    The target is hashed a chunk at a time, so the parts covered by a
+    long match are never hashed.
+
+    Returns
+    -------
+    matches : list
+        (target_start, target_stop, source_start) of each match
+    """
+    source = index.source
+    matches = []
+    floor = pos = start
+    while stop-pos >= BLOCK_SIZE:
+        end = min(pos+chunk, stop)
+        positions, offsets = index.candidates(
+            target[pos:min(end+BLOCK_SIZE-1, stop)])
+        positions = positions+pos
+        idx = 0
+        while idx < len(positions):
+            target_pos = int(positions[idx])
+            source_pos = int(offsets[idx])
+            size = _extend(target, source, target_pos, source_pos, stop)
+            if size < BLOCK_SIZE:
+                idx += 1
+                continue
+            back = 0
+            while target_pos-back > floor and source_pos-back > 0 and \
+                    target[target_pos-back-1] == source[source_pos-back-1]:
+                back += 1
+            matches.append((target_pos-back, target_pos+size,
+                            source_pos-back))
+            floor = pos = target_pos+size
+            idx = int(np.searchsorted(positions, pos))
+        pos = max(pos, end)
+    return matches
+
+
+def encode_window(target, source, anchor=0):
+    """Encode a target window against a source segment
+
+    Unchanged bytes where the window lines up with the source are found
+    first. What is left is matched against a hash index of the source
+    blocks and otherwise added.
+
+    Parameters
+    ----------
+    target : numpy.ndarray
+    source : numpy.ndarray
+        Empty if the window has no source segment
+    anchor : int
+        Offset in source that lines up with the start of target
+
+    Returns
+    -------
+    window : WindowEncoder
+    """
+    window = WindowEncoder(len(source))
+    if len(target) == len(source) and anchor == 0 and \
+            np.array_equal(target, source):
+        if len(target):
+            window.copy(0, len(target))
+        return window
+    matches = diagonal_matches(target, source, anchor)
+    if len(source) >= BLOCK_SIZE:
+        index = None
+        gaps = []
+        pos = 0
+        for start, stop, source_start in matches+[(len(target), 0, 0)]:
+            if start-pos >= BLOCK_SIZE:
+                gaps.append((pos, start))
+            pos = stop
+        for start, stop in gaps:
+            if index is None:
+                index = SourceIndex(source)
+            matches.extend(block_matches(target, index, start, stop))
+        matches.sort()
+    pos = 0
+    for start, stop, source_start in matches:
+        window.literal(target[pos:start])
+        window.copy(source_start, stop-start)
+        pos = stop
+    window.literal(target[pos:])
+    return window
+
+
+def _array(data, start, stop):
+    if stop <= start:
+        return np.zeros(0, dtype=np.uint8)
+    return np.frombuffer(data, dtype=np.uint8, count=stop-start,
+                         offset=start)
+
+
+def plan_windows(regions, source_size, target_size):
+    """Turn known correspondences between source and target into windows
+
+    Parameters
+    ----------
+    regions : list
+        (target_start, target_stop, source_start, source_stop) of ranges
+        of the target that came from a known range of the source, eg the
+        same file in two archives. Parts of the target that are not
+        covered are lined up with the same offsets in the source.
+    source_size : int
+    target_size : int
+
+    Returns
+    -------
+    windows : list of Window
+        Covering the whole target in order, at most MAX_WINDOW each
+    """
+    windows = []
+    pos = 0
+    for target_start, target_stop, source_start, source_stop in \
+            sorted(regions):
+        target_start = max(target_start, pos)
+        if target_stop <= target_start:
+            continue
+        if target_start > pos:
+            windows.append(Window(pos, target_start, min(pos, source_size),
+                                  min(target_start, source_size), pos,
+                                  False))
+        windows.append(Window(target_start, target_stop, source_start,
+                              source_stop, source_start, True))
+        pos = target_stop
+    if pos < target_size:
+        windows.append(Window(pos, target_size, min(pos, source_size),
+                              min(target_size, source_size), pos, False))
+    merged = []
+    for window in windows:
+        if merged:
+            last = merged[-1]
+            if last.exact == window.exact and \
+                    last.target_stop == window.target_start and \
+                    last.source_stop == window.source_start and \
+                    window.anchor-last.anchor == \
+                    window.target_start-last.target_start and \
+                    window.target_stop-last.target_start <= MAX_WINDOW:
+                merged[-1] = last._replace(target_stop=window.target_stop,
+                                           source_stop=window.source_stop)
+                continue
+        merged.append(window)
+    windows = []
+    for window in merged:
+        if window.exact:
+            low, high = window.source_start, window.source_stop
+        else:
+            low, high = 0, source_size
+        for start in xrange(window.target_start, window.target_stop,
+                            MAX_WINDOW):
+            stop = min(start+MAX_WINDOW, window.target_stop)
+            anchor = window.anchor+start-window.target_start
+            source_start = min(max(anchor-MARGIN, low), high)
+            source_stop = max(min(anchor+stop-start+MARGIN, high),
+                              source_start)
+            windows.append(Window(start, stop, source_start, source_stop,
+                                  anchor, window.exact))
+    return windows
+
+
+def encode(source, target, writer, regions=()):
+    """Write a VCDIFF delta that turns source into target
+
+    Parameters
+    ----------
+    source : string, mmap or buffer
+    target : string, mmap or buffer
+    writer : file
+        Patch output
+    regions : list, optional
+        Known correspondences. See plan_windows
+    """
+    writer.write(VCDIFF_MAGIC+'\x00')
+    for window in plan_windows(regions, len(source), len(target)):
+        target_data = _array(target, window.target_start, window.target_stop)
+        source_data = _array(source, window.source_start, window.source_stop)
+        encoder = encode_window(target_data, source_data,
+                                window.anchor-window.source_start)
+        if window.source_stop > window.source_start:
+            source_start = window.source_start
+        else:
+            source_start = None
+        writer.write(encoder.tostring(source_start,
+                                      zlib.adler32(target_data)))
+
+
+def _copy(out, segment, address, size):
+    """Append a COPY from the combined source segment and target window"""
+    if address < len(segment):
+        chunk = segment[address:address+size]
+        out.extend(chunk)
+        size -= len(chunk)
+        address = len(segment)
+    if not size:
+        return
+    start = address-len(segment)
+    if start+size <= len(out):
+        out.extend(out[start:start+size])
+        return
+    # Overlapping copies repeat the bytes between start and the end
+    pattern = out[start:]
+    out.extend((pattern*(size//len(pattern)+1))[:size])
+
+
+def decode_window(segment, delta, checksum=False):
+    """Decode the delta encoding of one window
+
+    Parameters
+    ----------
+    segment : string
+        Source segment of the window
+    delta : bytearray
+        Delta encoding, starting at the target window length
+    checksum : bool, optional
+        If True, the section sizes are followed by an Adler-32 of the
+        target window (VCD_ADLER32)
+
+    Returns
+    -------
+    target : bytearray
+    """
+    target_size, pos = read_int(delta, 0)
+    if delta[pos]:
+        raise ValueError('Secondary compression is not supported')
+    data_size, pos = read_int(delta, pos+1)
+    inst_size, pos = read_int(delta, pos)
+    addr_size, pos = read_int(delta, pos)
+    if checksum:
+        checksum, = struct.unpack_from('>I', delta, pos)
+        pos += 4
+    else:
+        checksum = None
+    data_pos = pos
+    inst_pos = inst_end = data_pos+data_size
+    inst_end += inst_size
+    addr_pos = inst_end
+    cache = AddressCache()
+    out = bytearray()
+    while inst_pos < inst_end:
+        code = delta[inst_pos]
+        inst_pos += 1
+        for type_, size, mode in DECODE_TABLE[code]:
+            if not size:
+                size, inst_pos = read_int(delta, inst_pos)
+            if type_ == ADD:
+                out.extend(delta[data_pos:data_pos+size])
+                data_pos += size
+            elif type_ == RUN:
+                out.extend(delta[data_pos:data_pos+1]*size)
+                data_pos += 1
+            else:
+                address, addr_pos = cache.decode(mode, delta, addr_pos,
+                                                 len(segment)+len(out))
+                _copy(out, segment, address, size)
+    if len(out) != target_size:
+        raise ValueError('Window decoded to {0} bytes, expected {1}'
+                         .format(len(out), target_size))
+    if checksum is not None and \
+            zlib.adler32(bytes(out)) & 0xFFFFFFFF != checksum:
+        raise ValueError('Window checksum mismatch')
+    return out
+
+
+def decode(source, reader, writer):
+    """Apply a VCDIFF delta
+
+    Windows are decoded one at a time, so memory use is bounded by the
+    largest window rather than the size of the files.
+
+    Parameters
+    ----------
+    source : string, mmap or buffer
+    reader : file
+        Patch input
+    writer : file
+        Target output
+    """
+    if reader.read(4) != VCDIFF_MAGIC:
+        raise ValueError('Not a VCDIFF patch')
+    indicator = ord(reader.read(1))
+    if indicator & VCD_DECOMPRESS:
+        reader.read(1)
+    if indicator & VCD_CODETABLE:
+        raise ValueError('Custom code tables are not supported')
+    if indicator & VCD_APPHEADER:
+        reader.read(_read_handle_int(reader))
+    while True:
+        char = reader.read(1)
+        if not char:
+            break
+        indicator = ord(char)
+        if indicator & VCD_TARGET:
+            raise ValueError('Target source segments are not supported')
+        segment = ''
+        if indicator & VCD_SOURCE:
+            size = _read_handle_int(reader)
+            start = _read_handle_int(reader)
+            if start+size > len(source):
+                raise ValueError('Source segment is out of range')
+            segment = source[start:start+size]
+        delta = bytearray(reader.read(_read_handle_int(reader)))
+        writer.write(decode_window(segment, delta,
+                                   indicator & VCD_ADLER32))
+
+
+def _map(handle):
+    if not os.fstat(handle.fileno()).st_size:
+        return ''
+    return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def make_patch(patchname, fname1, fname2, regions=()):
+    """Write a patch that turns the file fname1 into fname2
+
+    Both files are memory-mapped.
+
+    Parameters
+    ----------
+    patchname : string
+    fname1 : string
+        Original file
+    fname2 : string
+        Modified file
+    regions : list, optional
+        Known correspondences between the files. See plan_windows
+    """
+    with open(fname1, 'rb') as source_handle, \
+            open(fname2, 'rb') as target_handle:
+        source = _map(source_handle)
+        target = _map(target_handle)
+        with AtomicFile(patchname) as handle:
+            encode(source, target, handle, regions)
+
+
+def apply_patch(patchname, fname1, fname2):
+    """Apply the patch to fname1 and write the result to fname2"""
+    with open(fname1, 'rb') as source_handle, \
+            open(patchname, 'rb') as reader:
+        source = _map(source_handle)
+        with AtomicFile(fname2) as handle:
+            decode(source, reader, handle)
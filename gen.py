@@ -1,17 +1,36 @@
 #!/usr/bin/env python
+import glob
 import os, sys
 import struct
+import multiprocessing
 import template
 from nds.fmt import *
 from nds.files import *
+from nds import narc
+from util.cache import ArchiveCache
+from util.manifest import Manifest
 
 allowed_games = ["diamond", "platinum", "heartgold", "black", "black2"]
 EXT = "php"
-DATA_DIR = "local/data/"
-STATIC_DIR = "static/"
+GEN_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = GEN_DIR+"/local/data/"
+STATIC_DIR = GEN_DIR+"/static/"
 FORMAT_SUBDIR = "formats/"
 genindex = False
 games = []
+# Generators run by default, in order. Each is a module with inputs(game)
+# and generate(game, data)
+DEFAULT_STAGES = ["genbaseevo", "genenc", "genevo", "genexprate", "genmoves",
+                  "genpokedex", "gentrdata", "gentxt", "gensearch", "gennarc",
+                  "gennclr", "genfilelist"]
+ALL_STAGES = DEFAULT_STAGES+["genmovedata", "genncgr"]
+# Files that every generated output depends on
+COMMON_INPUTS = [GEN_DIR+"/gen.py", GEN_DIR+"/template.py"]+\
+    sorted(glob.glob(GEN_DIR+"/nds/*.py"))
+stages = []
+jobs = None
+force = False
+cache_size = 512
 
 args = sys.argv[1:]
 while args:
@@ -23,11 +42,20 @@ If game is left blank, all games will be processed.
 Options:
 --gen-index         Generate index files.
 --ext <extension>   Use <extension> for newly created files.
+--stage <name>      Only run this generator. May be repeated.
+--jobs <n>          Number of games to process at once. Defaults to the
+                    number of CPUs.
+--force             Regenerate outputs even if their inputs are unchanged.
+--cache-size <mb>   Megabytes of parsed archives to keep per game.
+                    Defaults to %d.
 --help              Show this help, then exit.
 
 Valid Games:
 %s
-"""%(sys.argv[0], ", ".join(allowed_games)))
+
+Stages:
+%s
+"""%(sys.argv[0], cache_size, ", ".join(allowed_games), ", ".join(ALL_STAGES)))
         exit()
     if a == "--gen-index":
         genindex = True
@@ -35,10 +63,24 @@ Valid Games:
     if a == "--ext":
         EXT = args.pop(0)
         continue
+    if a == "--stage":
+        stages.append(args.pop(0))
+        continue
+    if a == "--jobs":
+        jobs = int(args.pop(0))
+        continue
+    if a == "--force":
+        force = True
+        continue
+    if a == "--cache-size":
+        cache_size = int(args.pop(0))
+        continue
     if a in allowed_games:
         games.append(a)
 if not games:
     games = allowed_games
+if not stages:
+    stages = DEFAULT_STAGES
 FEXT = "."+EXT
 
 struct_name = {"B": "UInt8", "H":"UInt16", "I":"UInt32"}
@@ -76,7 +118,104 @@ def writefmt(ofile, fmt, datafmt):
         fmt = fmt[1:]
         i += 1
         
+class GameData:
+    """Files of one game, shared by every generator run on it
+
+    Each NARC is read and parsed once and then handed to every generator
+    that asks for it, as long as it fits in the cache. Paths are relative
+    to the game's fs directory and start with "/", as in nds.fmt.
+    """
+    def __init__(self, game, max_size=None):
+        if max_size is None:
+            max_size = cache_size<<20
+        self.game = game
+        self.directory = DATA_DIR+game+"/fs"
+        self.archives = ArchiveCache(max_size)
+        self.tree = None
+
+    def path(self, fname):
+        return self.directory+fname
+
+    def read(self, fname):
+        f = open(self.path(fname), "rb")
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def narc(self, fname):
+        """Get the parsed nds.narc.NARC at fname. None if it is not a NARC"""
+        path = self.path(fname)
+        f = open(path, "rb")
+        try:
+            if f.read(4) != "NARC":
+                return None
+        finally:
+            f.close()
+        return self.archives.get(path, lambda f: narc.NARC(f.read()))
+
+    def files(self):
+        """Every path under fs, directories included, depth-first and sorted"""
+        if self.tree is None:
+            self.tree = [""]
+            self._walk("")
+        return self.tree
+
+    def _walk(self, d):
+        for f in sorted(os.listdir(self.directory+d)):
+            self.tree.append(d+"/"+f)
+            if os.path.isdir(self.directory+d+"/"+f):
+                self._walk(d+"/"+f)
+
+def run_game(args):
+    """Run generators on one game
+
+    The outputs of a generator are only generated again once the contents
+    of its inputs, its generator or the shared modules change, or one of
+    the files it wrote was modified or removed. Their hashes are kept in
+    a manifest in the game's static directory.
+
+    Returns the names of the generators that were run and skipped.
+    """
+    game, names = args
+    data = GameData(game)
+    manifest = Manifest(GEN_DIR, STATIC_DIR+game+"/genmanifest.json")
+    done = []
+    skipped = []
+    for name in names:
+        module = __import__(name)
+        inputs = module.inputs(game)
+        if inputs is None:
+            continue
+        inputs = inputs+[os.path.splitext(module.__file__)[0]+".py"]+COMMON_INPUTS
+        product = STATIC_DIR+game+"/"+module.FNAME
+        if not force and not manifest.changed(product, inputs):
+            skipped.append(name)
+            continue
+        del template.written[:]
+        module.generate(game, data)
+        outputs = [f for f in template.written if f != product]
+        manifest.record(product, inputs, outputs)
+        # Keep the finished outputs if a later generator fails
+        manifest.save()
+        done.append(name)
+    return done, skipped
+
+def run(names):
+    """Run generators on every selected game, one process per game"""
+    work = [(game, names) for game in games]
+    count = min(jobs or multiprocessing.cpu_count(), len(work))
+    if count > 1:
+        pool = multiprocessing.Pool(count)
+        try:
+            results = pool.map(run_game, work)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(run_game, work)
+    for game, (done, skipped) in zip(games, results):
+        print("%s: generated %s; unchanged %s"%(game, ", ".join(done) or "nothing", ", ".join(skipped) or "nothing"))
+
 if __name__ == "__main__":
-    import genbaseevo, genenc, genevo, genexprate, genmoves, genpokedex, gentrdata, gentxt, gensearch
-    import gennarc, gennclr
-    import genfilelist
\ No newline at end of file
+    run(stages)
@@ -1,12 +1,14 @@
 from gen import *
-from nds import narc
 import struct
 
 FNAME = "baseevo"+FEXT
 
-for game in games:
+def inputs(game):
     if game not in BASEEVO_FILE:
-        continue
+        return None
+    return [DATA_DIR+game+"/fs/"+BASEEVO_FILE[game]]
+
+def generate(game, data):
     fmt = "H"
     fmtsize = struct.calcsize(fmt)
     ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", "Pokemon %s Base Evolution/Baby Lookup Format"%game.title())
@@ -22,12 +24,12 @@ for game in games:
 <table>
 <tr><td>Pokemon</td><td>Base Evolution/Baby</td></tr>
 """%(game.title(), BASEEVO_FILE[game], FORMAT_SUBDIR, FNAME))
-    f = open(DATA_DIR+game+"/fs/"+BASEEVO_FILE[game], "rb").read()
-    i = 0
-    while f:
-        data = struct.unpack(fmt, f[:fmtsize])
-        ofile.write("\t<tr><td>%d</td><td>%d</td></tr>\n"%(i, data[0]))
-        f = f[fmtsize:]
-        i += 1
+    f = data.read(BASEEVO_FILE[game])
+    for i in xrange(len(f)//fmtsize):
+        entry = struct.unpack_from(fmt, f, i*fmtsize)
+        ofile.write("\t<tr><td>%d</td><td>%d</td></tr>\n"%(i, entry[0]))
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["genbaseevo"])
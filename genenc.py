@@ -1,15 +1,18 @@
 from gen import *
-from nds import narc
 import struct
 
 FNAME = "enc"+FEXT
 GAMEFILE = ENC_FILE
 datafmt = encfmt
 
-for game in games:
+def inputs(game):
     if not game in datafmt:
-        continue
-    fmt = datafmt[game].pop(0)
+        return None
+    return [DATA_DIR+game+"/fs/"+GAMEFILE[game]]
+
+def generate(game, data):
+    fmt = datafmt[game][0]
+    fields = datafmt[game][1:]
     fmtsize = struct.calcsize(fmt)
     ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", "Pokemon %s Encounter Format"%game.title())
     ofile.write("""
@@ -18,11 +21,7 @@ for game in games:
 <table>
 <tr><td>Offset</td><td>Length</td><td>Name</td></tr>
 """%(game.title(), fmtsize))
-    ofs = 0
-    """for i, entry in enumerate(datafmt[game]):
-        ofile.write("<tr><td>%d</td><td>%d</td><td>%s</td></tr>\n"%(ofs, struct.calcsize(fmt[i]), entry))
-        ofs += struct.calcsize(fmt[i])"""
-    writefmt(ofile, fmt, datafmt[game])
+    writefmt(ofile, fmt, fields)
     ofile.write("</table>\n")
     ofile.close()
     ofile = template.open(STATIC_DIR+game+"/"+FNAME, "w", "Pokemon %s Encounter Data"%game.title())
@@ -31,13 +30,16 @@ for game in games:
 <h3>%s - NARC Container</h3>
 <p><a href='./%s%s'>Format</a></p>
 <table>\n"""%(game.title(), GAMEFILE[game], FORMAT_SUBDIR, FNAME))
-    n = narc.NARC(open(DATA_DIR+game+"/fs/"+GAMEFILE[game], "rb").read())
+    n = data.narc(GAMEFILE[game])
     for j, f in enumerate(n.gmif.files):
         ofile.write("\t<tr><td><h4>Location Id #%d</h4></td></tr>\n"%j)
-        data = struct.unpack(fmt, f[:fmtsize])
-        for i, entry in enumerate(datafmt[game]):
-            if entry == "pad" and data[i]:
-                print(j, data[i])
-            ofile.write("\t<tr><td>%s</td><td>%d</td></tr>\n"%(entry, data[i]))
+        entry = struct.unpack(fmt, f[:fmtsize])
+        for i, field in enumerate(fields):
+            if field == "pad" and entry[i]:
+                print(j, entry[i])
+            ofile.write("\t<tr><td>%s</td><td>%d</td></tr>\n"%(field, entry[i]))
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["genenc"])
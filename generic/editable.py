@@ -1,14 +1,16 @@
 
 import abc
 import binascii
+import itertools
 import json
+import weakref
 from collections import namedtuple
 
 from dispatch.events import Emitter
 
 from atomic import AtomicStruct
 from atomic.atomic_accelerator import AcceleratedAtomicStruct
-from atomic.atomic_struct import SIMULATING_PLACEHOLDER
+from atomic.atomic_struct import SIMULATING_PLACEHOLDER, schema_args
 from util.iter import auto_iterate
 from util import lcm
 
@@ -17,6 +19,9 @@ from util import lcm
 Restriction_ = namedtuple('Restriction', 'name min_value max_value min_length'
                           ' max_length validator children')
 
+#: Source of Editable.generation values. Every change takes the next one.
+GENERATIONS = itertools.count(1)
+
 
 class Restriction(object):
     """Restriction definition on an attribute's value
@@ -395,7 +400,25 @@ class CollectionNotifier(list):
         self.parent.__remove__(self.name, idx, item)
         return list.pop(self, idx)
 
-    # TODO: __setitem__
+    def __setitem__(self, idx, item):
+        if isinstance(idx, slice):
+            items = list(item)
+            indexes = range(*idx.indices(len(self)))
+            for index in reversed(indexes):
+                self.parent.__remove__(self.name, index, self[index])
+            start = indexes[0] if indexes else idx.indices(len(self))[0]
+            for index, value in enumerate(items, start):
+                self.parent.__insert__(self.name, index, value)
+            list.__setitem__(self, idx, items)
+            return
+        if idx < 0:
+            idx += len(self)
+        self.parent.__remove__(self.name, idx, self[idx])
+        self.parent.__insert__(self.name, idx, item)
+        list.__setitem__(self, idx, item)
+
+    def __setslice__(self, start, stop, items):
+        self.__setitem__(slice(start, stop), items)
 
 
 class Editable(Emitter, AtomicStruct):
@@ -429,9 +452,20 @@ class Editable(Emitter, AtomicStruct):
     invalid : (method, *args)
         Fired if an invalid value is passed. The rest of the event signature
         looks matches the method's arguments
+
+    Change Tracking
+    ---------------
+    Every set, insert and remove stamps the instance with a new generation.
+    Restricted attributes that hold Editables (directly or in a list) pass
+    their changes up to this instance under the attribute name, so
+    checking the top-level object (eg a Game) for unsaved changes is O(1)
+    and listing them is O(changes). See touch, dirty and changes.
     """
     # __metaclass__ = abc.ABCMeta
     accelerated = False
+    generation = 0
+    _clean_generation = 0
+    _parent = None
 
     def __init__(self, *args, **kwargs):
         reader = kwargs.pop('reader', None)
@@ -442,6 +476,7 @@ class Editable(Emitter, AtomicStruct):
                 AcceleratedAtomicStruct.freeze(self)
         else:
             AtomicStruct.__init__(self)
+            self._schema_args = schema_args(args, kwargs)
             self.define(*args, **kwargs)
             if self._data is None and self._fields:
                 # Check if frozen and has things to freeze.
@@ -468,12 +503,18 @@ class Editable(Emitter, AtomicStruct):
             return self._keys
         except AttributeError:
             from collections import OrderedDict
-            self._keys = OrderedDict()
+            # Bypass __setattr__, which would look up keys again
+            object.__setattr__(self, '_keys', OrderedDict())
             return self._keys
 
     def __dir__(self):
         return self.__dict__.keys()+self.keys.keys()
 
+    def get_schema_attrs(self):
+        attrs = AtomicStruct.get_schema_attrs(self)
+        attrs['_keys'] = self.keys.copy()
+        return attrs
+
     def restrict(self, name, validator=None, children=None, **kwargs):
         """Restrict an attribute. This adds the attribute to the key
         collection used to build textual representations.
@@ -505,6 +546,12 @@ class Editable(Emitter, AtomicStruct):
             restriction.restrict(validator)
         if name is not SIMULATING_PLACEHOLDER:
             self.keys[name] = restriction
+            value = self.__dict__.get(name)
+            if isinstance(value, list):
+                for item in value:
+                    self._adopt(name, item)
+            else:
+                self._adopt(name, value)
         return restriction
     attribute = restrict
 
@@ -646,13 +693,21 @@ class Editable(Emitter, AtomicStruct):
                     super(XEditable, self).__setattr__(name, value)
                 else:
                     setattr(self._data, name, value)
+                if old_value is not value:
+                    self._disown(old_value)
+                self._adopt(name, value)
                 if old_value != value:
+                    self.touch(name)
                     self.fire('set', (name, value))
 
     def __getattr__(self, name):
+        # Read _data without recursing back here before it has been set
+        data = self.__dict__.get('_data')
+        if data is None:
+            data = getattr(self.__class__, '_data', None)
         if name not in self.__dict__ and name not in self.__class__.__dict__\
-                and self._data is not None:
-            return getattr(self._data, name)
+                and data is not None:
+            return getattr(data, name)
         return object.__getattribute__(self, name)
         # super(XEditable, self).__getattr__(name)
 
@@ -668,12 +723,106 @@ class Editable(Emitter, AtomicStruct):
             except ValueError:
                 self.fire('invalid', ('insert', name, index, value))
                 raise
+            self._adopt(name, value)
+            self.touch(name)
             self.fire('insert', (name, index, value))
 
     def __remove__(self, name, index, value):
         # TODO: validate lengths?
+        self._disown(value)
+        self.touch(name)
         self.fire('remove', (name, index, value))
 
+    def _adopt(self, name, value):
+        """Pass changes of a child Editable up to this one as name"""
+        if isinstance(value, Editable) and value is not self:
+            object.__setattr__(value, '_parent', (weakref.ref(self), name))
+
+    def _disown(self, value):
+        """Stop passing changes of a removed child Editable up"""
+        if isinstance(value, Editable) and value._parent is not None and \
+                value._parent[0]() is self:
+            object.__setattr__(value, '_parent', None)
+
+    def touch(self, name=None):
+        """Record a change to this instance and its parents
+
+        Parameters
+        ----------
+        name : string, optional
+            Attribute that was changed. Parents record the change under
+            the name of the attribute holding this instance.
+        """
+        generation = next(GENERATIONS)
+        editable = self
+        while editable is not None and editable.generation != generation:
+            object.__setattr__(editable, 'generation', generation)
+            if name is not None:
+                try:
+                    changed = editable.__dict__['_changed']
+                except KeyError:
+                    changed = {}
+                    object.__setattr__(editable, '_changed', changed)
+                changed[name] = generation
+            if editable._parent is None:
+                break
+            parent, name = editable._parent
+            editable = parent()
+
+    @property
+    def dirty(self):
+        """Whether this has changed since the last mark_clean()"""
+        return self.generation != self._clean_generation
+
+    def changes(self, since=None):
+        """Get the attributes changed since a generation
+
+        Parameters
+        ----------
+        since : int, optional
+            Generation to compare against. Defaults to the last
+            mark_clean().
+
+        Returns
+        -------
+        names : set
+        """
+        if since is None:
+            since = self._clean_generation
+        return set(name for name, generation
+                   in self.__dict__.get('_changed', {}).items()
+                   if generation > since)
+
+    def mark_clean(self):
+        """Take the current state as saved
+
+        Returns
+        -------
+        generation : int
+            The current generation, for use with changes(since)
+        """
+        object.__setattr__(self, '_clean_generation', self.generation)
+        self.__dict__.pop('_changed', None)
+        return self.generation
+
+    def mark_saved(self, names):
+        """Take the changes to some attributes as saved
+
+        They are no longer listed by changes(). If nothing else changed
+        since the last mark_clean(), this is clean again.
+
+        Parameters
+        ----------
+        names : iterable of strings
+            Attributes whose changes were saved or dropped
+        """
+        changed = self.__dict__.get('_changed', {})
+        for name in names:
+            changed.pop(name, None)
+        if all(generation <= self._clean_generation
+               for generation in changed.itervalues()):
+            object.__setattr__(self, '_clean_generation', self.generation)
+
     @staticmethod
     def fx_property(attr_name, shift=12):
         """Create a property that turns an int into a fixed point number
@@ -0,0 +1,172 @@
+
+import ctypes
+
+import numpy as np
+
+SIMPLE_TYPE = type(ctypes.c_uint8)
+ARRAY_TYPE = type(ctypes.c_uint8*1)
+
+
+def simple_dtype(ctype):
+    """NumPy dtype of a simple ctypes type"""
+    if ctype is ctypes.c_char:
+        return np.dtype('S1')
+    return np.dtype(ctype).newbyteorder('<')
+
+
+class StructLayout(object):
+    """NumPy description of a compiled AtomicStruct type
+
+    Two dtypes are built. raw_dtype matches the bytes of the struct exactly,
+    with one unsigned column per bitfield storage unit. dtype is the
+    unpacked form that gets handed out, where every field (bitfields
+    included) is its own column and nested structs are nested dtypes.
+
+    Parameters
+    ----------
+    ctype : ctypes.Structure subclass
+        Compiled type, such as Editable._type
+    """
+    def __init__(self, ctype):
+        names = []
+        formats = []
+        offsets = []
+        out = []
+        #: List of (kind, name, extra). kind is 'plain', 'struct' or 'bits'
+        self.fields = []
+        for field in ctype._fields_:
+            name, field_type = field[:2]
+            descriptor = getattr(ctype, name)
+            if len(field) > 2:
+                width = descriptor.size >> 16
+                shift = descriptor.size & 0xFFFF
+                container = simple_dtype(field_type)
+                raw_name = '_bits_{0}'.format(descriptor.offset)
+                if raw_name not in names:
+                    names.append(raw_name)
+                    formats.append(np.dtype('<u{0}'.format(
+                        container.itemsize)))
+                    offsets.append(descriptor.offset)
+                signed = container.kind == 'i'
+                out.append((name, container))
+                self.fields.append(('bits', name,
+                                    (raw_name, shift, width, signed)))
+                continue
+            shape = ()
+            base_type = field_type
+            while isinstance(base_type, ARRAY_TYPE):
+                shape += (base_type._length_, )
+                base_type = base_type._type_
+            if isinstance(base_type, SIMPLE_TYPE):
+                raw = simple_dtype(base_type)
+                if base_type is ctypes.c_char and shape:
+                    raw = np.dtype('S{0}'.format(shape[-1]))
+                    shape = shape[:-1]
+                unpacked = raw
+                self.fields.append(('plain', name, None))
+            else:
+                layout = StructLayout(base_type)
+                raw = layout.raw_dtype
+                unpacked = layout.dtype
+                self.fields.append(('struct', name, layout))
+            names.append(name)
+            formats.append((raw, shape) if shape else raw)
+            offsets.append(descriptor.offset)
+            out.append((name, unpacked, shape) if shape else (name, unpacked))
+        self.raw_dtype = np.dtype({'names': names, 'formats': formats,
+                                   'offsets': offsets,
+                                   'itemsize': ctypes.sizeof(ctype)})
+        self.dtype = np.dtype(out)
+
+    def unpack(self, raw, out):
+        """Fill unpacked array out from raw"""
+        for kind, name, extra in self.fields:
+            if kind == 'plain':
+                out[name] = raw[name]
+            elif kind == 'struct':
+                extra.unpack(raw[name], out[name])
+            else:
+                raw_name, shift, width, signed = extra
+                value = (raw[raw_name].astype(np.int64) >> shift) & \
+                    ((1 << width)-1)
+                if signed:
+                    value -= (value >> (width-1)) << width
+                out[name] = value
+
+    def pack(self, out, raw):
+        """Write unpacked array out back into raw"""
+        for kind, name, extra in self.fields:
+            if kind == 'plain':
+                raw[name] = out[name]
+            elif kind == 'struct':
+                extra.pack(out[name], raw[name])
+            else:
+                raw_name, shift, width, signed = extra
+                mask = ((1 << width)-1) << shift
+                value = (out[name].astype(np.int64) << shift) & mask
+                raw[raw_name] = (raw[raw_name].astype(np.int64) & ~mask) | \
+                    value
+
+
+class RecordTable(object):
+    """Columnar view of an archive of fixed-size records
+
+    Every record is read into one NumPy structured array, using the layout
+    of the model's compiled struct (including nested structs, arrays and
+    bitfields). Any bytes after the struct in a file are kept as they are.
+
+    Parameters
+    ----------
+    model : Editable
+        Frozen instance describing a single record, eg Personal(game)
+    files : list
+        Raw record data, usually archive.files
+
+    Attributes
+    ----------
+    records : numpy.ndarray
+        One row per file. Modify this and call to_files() to write back
+
+    Examples
+    --------
+    >>> table = game.records('personal', Personal)
+    >>> stats = table.records['base_stat']
+    >>> totals = sum(stats[stat] for stat in Stats.STATS)
+    >>> table.records['catchrate'][totals < 300] = 255
+    >>> game.save_records('personal', table)
+    """
+    def __init__(self, model, files):
+        self.layout = StructLayout(model._type)
+        size = self.layout.raw_dtype.itemsize
+        self.tails = []
+        chunks = []
+        for idx, data in enumerate(files):
+            if len(data) < size:
+                raise ValueError('Record {0} is {1} bytes. Expected at least'
+                                 ' {2}'.format(idx, len(data), size))
+            chunks.append(data[:size])
+            self.tails.append(data[size:])
+        # Backed by a bytearray so bytes between fields are kept as well
+        self.raw = np.frombuffer(bytearray(''.join(chunks)),
+                                 dtype=self.layout.raw_dtype)
+        self.records = np.zeros(len(self.raw), dtype=self.layout.dtype)
+        self.layout.unpack(self.raw, self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    def to_files(self):
+        """Pack records back into raw record data
+
+        Returns
+        -------
+        files : list
+        """
+        self.layout.pack(self.records, self.raw)
+        size = self.layout.raw_dtype.itemsize
+        data = self.raw.tostring()
+        return [data[idx*size:(idx+1)*size]+tail
+                for idx, tail in enumerate(self.tails)]
@@ -1,11 +1,14 @@
 from gen import *
-from nds import narc
 import struct
 
 FNAME = "evo"+FEXT
 
-for game in games:
-    fmt = evofmt[game].pop(0)
+def inputs(game):
+    return [DATA_DIR+game+"/fs/"+EVO_FILE[game]]
+
+def generate(game, data):
+    fmt = evofmt[game][0]
+    fields = evofmt[game][1:]
     ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", "Pokemon %s Evolution Format"%game.title())
     ofile.write("""
 <h2>Pokemon %s Evolution Format</h2>
@@ -14,7 +17,7 @@ for game in games:
 <tr><td>Offset</td><td>Byte Size</td><td>Name</td></tr>
 """%(game.title(), struct.calcsize(fmt)))
     ofs = 0
-    for i, entry in enumerate(evofmt[game]):
+    for i, entry in enumerate(fields):
         ofile.write("<tr><td>%d</td><td>%d</td><td>%s</td></tr>"%(ofs, struct.calcsize(fmt[i]), entry[0]))
         ofs += struct.calcsize(fmt[i])
     ofile.write("</table>\n")
@@ -25,11 +28,14 @@ for game in games:
 <h3>%s - NARC Container</h3>
 <p><a href='./%s%s'>Format</a></p>
 <table>\n"""%(game.title(), EVO_FILE[game], FORMAT_SUBDIR, FNAME))
-    n = narc.NARC(open(DATA_DIR+game+"/fs/"+EVO_FILE[game], "rb").read())
+    n = data.narc(EVO_FILE[game])
     for j, f in enumerate(n.gmif.files):
         ofile.write("\t<tr><td><h4>Evolution Id #%d</h4></td></tr>\n"%j)
         evodata = struct.unpack(fmt, f)
-        for i, entry in enumerate(evofmt[game]):
+        for i, entry in enumerate(fields):
             ofile.write("\t<tr><td>%s</td><td>%d</td></tr>\n"%(entry[0], evodata[i]))
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["genevo"])
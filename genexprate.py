@@ -1,10 +1,12 @@
 from gen import *
-from nds import narc
 import struct
 
 FNAME = "exprate"+FEXT
 
-for game in games:
+def inputs(game):
+    return [DATA_DIR+game+"/fs/"+EXPRATE_FILE[game]]
+
+def generate(game, data):
     fmt = "I"*101
     ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", "Pokemon %s Experience/Growth Table Format"%game.title())
     ofile.write("""
@@ -17,11 +19,14 @@ for game in games:
 <h3>%s - NARC Container</h3>
 <p><a href='./%s%s'>Format</a></p>
 <table>\n"""%(game.title(), EXPRATE_FILE[game], FORMAT_SUBDIR, FNAME))
-    n = narc.NARC(open(DATA_DIR+game+"/fs/"+EXPRATE_FILE[game], "rb").read())
+    n = data.narc(EXPRATE_FILE[game])
     for j, f in enumerate(n.gmif.files):
         ofile.write("\t<tr><td><h4>Growth Id #%d</h4></td></tr>\n"%j)
         expdata = struct.unpack(fmt, f)
         for i, entry in enumerate(expdata):
             ofile.write("\t<tr><td>Level %s</td><td>%d Exp</td></tr>\n"%(i, entry))
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["genexprate"])
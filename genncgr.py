@@ -1,22 +1,24 @@
 from gen import *
-from nds import narc, ncgr
+from nds import ncgr
 import os
 
-ofile = None
-
 FNAME = "ncgr"+FEXT
 
-def recursefs(d):
-    if os.path.isdir(C_DIR+d):
-        for f in sorted(os.listdir(C_DIR+d)):
-            recursefs(d+"/"+f)
-    else:
-        f = open(C_DIR+d, "rb")
+def inputs(game):
+    return [DATA_DIR+game+"/fs"]
+
+def generate(game, data):
+    ODIR = STATIC_DIR+game+"/ncgr/"
+    ofile = template.open(STATIC_DIR+game+"/"+FNAME, "w", "Pokemon %s NCGR (Graphics) Files"%game.title())
+    ofile.write("""
+<h2>Pokemon %s NCGR (Graphics) Files</h2>
+<table class='filelist'>\n"""%game.title())
+    for d in data.files():
+        if os.path.isdir(data.path(d)):
+            continue
         count = 0
-        if f.read(4) == "NARC":
-            f.seek(0)
-            n = narc.NARC(f.read())
-            f.close()
+        n = data.narc(d)
+        if n is not None:
             pfile = None
             dirname = os.path.dirname(ODIR+d)
             for j, f in enumerate(n.gmif.files):
@@ -29,25 +31,18 @@ def recursefs(d):
                         pfile.write("<p><a href='%s%s'>RGCN list</a></p>\n"%("../"*len(d.strip("/").split("/")), FNAME))
                     pfile.write("<p>File %i: %ix%i</p>"%(j, graphic.char.width, graphic.char.height))
                     pfile.write("<p><img src='%i.png' alt='%s %i RGCN'></p>\n"%(j, d, j))
-                    graphic.toImage().save("%s/%i.png"%(dirname, j))
+                    png = "%s/%i.png"%(dirname, j)
+                    graphic.toImage().save(png)
+                    template.written.append(png)
                     del graphic
             if pfile:
                 pfile.close()
-        else:
-            f.close()
         if count:
             ofile.write("\t<tr><td><a href='ncgr%s'>%s</a></td><td>%i files</td></tr>\n"%(d+FEXT, d, count))
         else:
             ofile.write("\t<tr><td>%s</td><td>0 files</td></tr>\n"%d)
-            
-
-for game in games:
-    ODIR = STATIC_DIR+game+"/ncgr/"
-    ofile = template.open(STATIC_DIR+game+"/"+FNAME, "w", "Pokemon %s NCGR (Graphics) Files"%game.title())
-    ofile.write("""
-<h2>Pokemon %s NCGR (Graphics) Files</h2>
-<table class='filelist'>\n"""%game.title())
-    C_DIR = DATA_DIR+game+"/fs"
-    recursefs("")
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["genncgr"])
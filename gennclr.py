@@ -1,22 +1,24 @@
 from gen import *
-from nds import narc, nclr
+from nds import nclr
 import os
 
-ofile = None
-
 FNAME = "nclr"+FEXT
 
-def recursefs(d):
-    if os.path.isdir(C_DIR+d):
-        for f in sorted(os.listdir(C_DIR+d)):
-            recursefs(d+"/"+f)
-    else:
-        f = open(C_DIR+d, "rb")
+def inputs(game):
+    return [DATA_DIR+game+"/fs"]
+
+def generate(game, data):
+    ODIR = STATIC_DIR+game+"/nclr/"
+    ofile = template.open(STATIC_DIR+game+"/"+FNAME, "w", "Pokemon %s NCLR (Palette) Files"%game.title())
+    ofile.write("""
+<h2>Pokemon %s NCLR (Palette) Files</h2>
+<table class='filelist'>\n"""%game.title())
+    for d in data.files():
+        if os.path.isdir(data.path(d)):
+            continue
         count = 0
-        if f.read(4) == "NARC":
-            f.seek(0)
-            n = narc.NARC(f.read())
-            f.close()
+        n = data.narc(d)
+        if n is not None:
             pfile = None
             for j, f in enumerate(n.gmif.files):
                 if f[:4] == "RLCN":
@@ -32,21 +34,12 @@ def recursefs(d):
                     pfile.write("</p>\n")
             if pfile:
                 pfile.close()
-        else:
-            f.close()
         if count:
             ofile.write("\t<tr><td><a href='nclr%s'>%s</a></td><td>%i files</td></tr>\n"%(d+FEXT, d, count))
         else:
             ofile.write("\t<tr><td>%s</td><td>0 files</td></tr>\n"%d)
-            
-
-for game in games:
-    ODIR = STATIC_DIR+game+"/nclr/"
-    ofile = template.open(STATIC_DIR+game+"/"+FNAME, "w", "Pokemon %s NCLR (Palette) Files"%game.title())
-    ofile.write("""
-<h2>Pokemon %s NCLR (Palette) Files</h2>
-<table class='filelist'>\n"""%game.title())
-    C_DIR = DATA_DIR+game+"/fs"
-    recursefs("")
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["gennclr"])
@@ -1,10 +1,12 @@
 from gen import *
-from nds import narc, fieldgen
-import struct
+from nds import fieldgen
 
 FNAME = "pokedex"+FEXT
 
-for game in games:
+def inputs(game):
+    return [DATA_DIR+game+"/fs/"+POKEDEX_FILE[game]]
+
+def generate(game, data):
     title = "Pokemon %s Pokedex/Personal Format"%game.title()
     ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", title)
     fieldgen.generateFormatHTML(dexfmt[game], title, ofile)
@@ -15,6 +17,9 @@ for game in games:
 <h3>%s - NARC Container</h3>
 <p><a href='./%s%s'>Format</a></p>
 """%(game.title(), POKEDEX_FILE[game], FORMAT_SUBDIR, FNAME))
-    fieldgen.makeHtmlEntries(dexfmt[game], 
-        DATA_DIR+game+"/fs/"+POKEDEX_FILE[game], ofile)
-    ofile.close()
\ No newline at end of file
+    fieldgen.makeHtmlEntries(dexfmt[game],
+        data.narc(POKEDEX_FILE[game]), ofile)
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["genpokedex"])
@@ -1,12 +1,14 @@
 from gen import *
-from nds import narc
 import struct
 
 FNAME = "search"+FEXT
 
-for game in games:
+def inputs(game):
     if game not in ZUKAN_FILE:
-        continue
+        return None
+    return [DATA_DIR+game+"/fs/"+ZUKAN_FILE[game]]
+
+def generate(game, data):
     ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", "Pokemon %s Pokedex Search Format"%game.title())
     ofile.write("""
 <h2>Pokemon %s Pokedex Search</h2>\n"""%(game.title()))
@@ -22,8 +24,7 @@ for game in games:
 <p><a href='./%s%s'>Format</a></p>
 <table>
 """%(game.title(), ZUKAN_FILE[game], FORMAT_SUBDIR, FNAME))
-    n = narc.NARC(open(DATA_DIR+game+"/fs/"+ZUKAN_FILE[game], "rb").read())
-    i = 0
+    n = data.narc(ZUKAN_FILE[game])
     for j, f in enumerate(n.gmif.files):
         if j in searchfiles[game]:
             fmt = searchfiles[game][j][1]
@@ -35,12 +36,12 @@ for game in games:
             name = "undocumented/unknown"
         fmtsize = struct.calcsize(fmt)
         ofile.write("<h4>File Id #%d - %s</h4>\n"%(j, name))
-        k = 0
-        while len(f) >= fmtsize:
-            data = struct.unpack(fmt, f[:fmtsize])
-            for i, entry in enumerate(datafmt):
-                ofile.write("\t<p>%i: %i %s</p>\n"%(k, data[i], entry))
-            f = f[fmtsize:]
-            k += 1
+        for k in xrange(len(f)//fmtsize):
+            entry = struct.unpack_from(fmt, f, k*fmtsize)
+            for i, field in enumerate(datafmt):
+                ofile.write("\t<p>%i: %i %s</p>\n"%(k, entry[i], field))
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["gensearch"])
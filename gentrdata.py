@@ -1,11 +1,14 @@
 from gen import *
-from nds import narc
 import struct
 
 FNAME = "trdata"+FEXT
 
-for game in games:
-    fmt = trdatafmt[game].pop(0)
+def inputs(game):
+    return [DATA_DIR+game+"/fs/"+TRDATA_FILE[game]]
+
+def generate(game, data):
+    fmt = trdatafmt[game][0]
+    fields = trdatafmt[game][1:]
     fmtsize = struct.calcsize(fmt)
     ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", "Pokemon %s Trainer Data Format"%game.title())
     ofile.write("""
@@ -15,7 +18,7 @@ for game in games:
 <tr><td>Offset</td><td>Length</td><td>Name</td></tr>
 """%(game.title(), fmtsize))
     ofs = 0
-    for i, entry in enumerate(trdatafmt[game]):
+    for i, entry in enumerate(fields):
         ofile.write("<tr><td>%d</td><td>%d</td><td>%s</td></tr>\n"%(ofs, struct.calcsize(fmt[i]), entry[0]))
         ofs += struct.calcsize(fmt[i])
     ofile.write("</table>\n")
@@ -26,13 +29,16 @@ for game in games:
 <h3>%s - NARC Container</h3>
 <p><a href='./%s%s'>Format</a></p>
 <table>\n"""%(game.title(), TRDATA_FILE[game], FORMAT_SUBDIR, FNAME))
-    n = narc.NARC(open(DATA_DIR+game+"/fs/"+TRDATA_FILE[game], "rb").read())
+    n = data.narc(TRDATA_FILE[game])
     for j, f in enumerate(n.gmif.files):
         ofile.write("\t<tr><td><h4>Trainer Id #%d</h4></td></tr>\n"%j)
         if len(f) < fmtsize:
             continue
-        data = struct.unpack(fmt, f[:fmtsize])
-        for i, entry in enumerate(trdatafmt[game]):
-            ofile.write("\t<tr><td>%s</td><td>%d</td></tr>\n"%(entry[0], data[i]))
+        entry = struct.unpack(fmt, f[:fmtsize])
+        for i, field in enumerate(fields):
+            ofile.write("\t<tr><td>%s</td><td>%d</td></tr>\n"%(field[0], entry[i]))
     ofile.write("</table>")
-    ofile.close()
\ No newline at end of file
+    ofile.close()
+
+if __name__ == "__main__":
+    run(["gentrdata"])
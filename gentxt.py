@@ -1,5 +1,4 @@
 from gen import *
-from nds import narc
 from nds.txt import gen4get, gen5get
 import struct, array
 import cStringIO as StringIO
@@ -132,22 +131,28 @@ textfmt = {
     "black2":[gen5get, gen5alg, getlenfromlabel],
 }
 
-for msg in [["msg", MSG_FILE, "Message/Text"], ["msg2", MSG_FILE2, "Script/Text"]]:
-    FNAME = msg[0]+FEXT
-    for game in games:
+MSGS = [["msg", MSG_FILE, "Message/Text"], ["msg2", MSG_FILE2, "Script/Text"]]
+
+def inputs(game):
+    files = [DATA_DIR+game+"/fs/"+msg[1][game] for msg in MSGS if game in msg[1]]
+    return files or None
+
+def generate(game, data):
+    for msg in MSGS:
         if game not in msg[1]:
             continue
+        fname = msg[0]+FEXT
         gettext = textfmt[game][0]
         alg = textfmt[game][1]
         getlen = textfmt[game][2]
-        ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+FNAME, "w", "Pokemon %s %s Format"%(game.title(), msg[2]))
+        ofile = template.open(STATIC_DIR+game+"/"+FORMAT_SUBDIR+fname, "w", "Pokemon %s %s Format"%(game.title(), msg[2]))
         ofile.write("<code style='white-space:pre;'>\n")
         for line in alg.split("\n"):
             ofile.write("%s\n"%line)
         ofile.write("</code>\n")
         ofile.close()
-        n = narc.NARC(open(DATA_DIR+game+"/fs/"+msg[1][game], "rb").read())
-        ofile = template.open(STATIC_DIR+game+"/"+FNAME, "w", "Pokemon %s %s Format"%(game.title(), msg[2]))
+        n = data.narc(msg[1][game])
+        ofile = template.open(STATIC_DIR+game+"/"+fname, "w", "Pokemon %s %s Format"%(game.title(), msg[2]))
         ofile.write("""
 <h2>Pokemon %s Message Data</h2>
 <h3>%s - NARC Container</h3>
@@ -155,7 +160,7 @@ for msg in [["msg", MSG_FILE, "Message/Text"], ["msg2", MSG_FILE2, "Script/Text"
 <table>
 <tr>
     <td>Index</td><td>Contents</td><td>Entries</td>
-</tr>\n"""%(game.title(), msg[1][game], FORMAT_SUBDIR, FNAME))
+</tr>\n"""%(game.title(), msg[1][game], FORMAT_SUBDIR, fname))
         ODIR = STATIC_DIR+game+"/"+msg[0]+"/"
         if not os.path.exists(ODIR):
             os.mkdir(ODIR)
@@ -167,10 +172,12 @@ for msg in [["msg", MSG_FILE, "Message/Text"], ["msg2", MSG_FILE2, "Script/Text"
 <h2>Pokemon %s Message File #%i</h2>
 <h3>%s/%i - <a href="../%s%s">Message Formatted File</a></h3>
 <p><a href="../%s">Message File Index</a></p>
-"""%(game.title(), j, msg[1][game], j, FORMAT_SUBDIR, FNAME, FNAME))
+"""%(game.title(), j, msg[1][game], j, FORMAT_SUBDIR, fname, fname))
             for k, text in enumerate(texts):
                 mfile.write("<p><a href='#entry%i' name='entry%i'># %s</a> %s</p>\n"%(k, k, text[0], "<br>".join("<br>".join(text[1].encode("utf-8").split("\\n")).split("\\r"))))
             mfile.close()
         ofile.write("</table>\n")
         ofile.close()
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    run(["gentxt"])
@@ -10,7 +10,11 @@ def getFieldsByString(datafmt, f):
     return ret
         
 def getEntries(datafmt, fname):
-    n = narc.NARC(open(fname, "rb").read())
+    # fname may also be an already parsed NARC
+    if isinstance(fname, narc.NARC):
+        n = fname
+    else:
+        n = narc.NARC(open(fname, "rb").read())
     ret = []
     for j, f in enumerate(n.gmif.files):
         ret.append(getFieldsByString(datafmt, f))
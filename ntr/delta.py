@@ -0,0 +1,148 @@
+
+import struct
+
+from compression import vcdiff
+from ntr.narc import file_ranges
+from ntr.rom import ROM, crc16
+
+
+def narc_regions(source, target, source_range, target_range):
+    """Line up the files of two versions of a NARC
+
+    Each file is extended up to the start of the next one, so that the
+    regions are contiguous and unchanged runs of files merge into a single
+    window.
+
+    Parameters
+    ----------
+    source : string, buffer or mmap
+    target : string, buffer or mmap
+    source_range : tuple
+        (start, stop) of the original NARC in source
+    target_range : tuple
+        (start, stop) of the modified NARC in target
+
+    Returns
+    -------
+    regions : list or None
+        See compression.vcdiff.plan_windows. None if either is not a NARC
+    """
+    source_files = file_ranges(source, source_range[0])
+    target_files = file_ranges(target, target_range[0])
+    if not source_files or not target_files:
+        return None
+    source_starts = [start for start, stop in source_files]+[source_range[1]]
+    target_starts = [start for start, stop in target_files]+[target_range[1]]
+    if source_starts != sorted(source_starts) or \
+            target_starts != sorted(target_starts):
+        return None
+    regions = [(target_range[0], target_starts[0],
+                source_range[0], source_starts[0])]
+    for idx in xrange(len(target_files)):
+        if idx < len(source_files):
+            source_start = source_starts[idx]
+            source_stop = source_starts[idx+1]
+        else:
+            source_start = source_stop = source_range[1]
+        regions.append((target_starts[idx], target_starts[idx+1],
+                        source_start, source_stop))
+    return regions
+
+
+def rom_regions(source, target):
+    """Line up the files of two versions of a ROM
+
+    Files are matched by path (overlays by file id). NARCs are lined up
+    file by file within them, so a change in size of one file does not
+    shift the rest of the archive out of place.
+
+    Parameters
+    ----------
+    source : ntr.rom.ROM
+    target : ntr.rom.ROM
+
+    Returns
+    -------
+    regions : list
+        See compression.vcdiff.plan_windows
+    """
+    def file_keys(rom):
+        keys = dict((file_id, file_id) for file_id in xrange(len(rom.fat)))
+        for path, file_id in rom.paths.items():
+            del keys[file_id]
+            keys[path] = file_id
+        return keys
+
+    source_ids = file_keys(source)
+    regions = []
+    for key, file_id in file_keys(target).items():
+        try:
+            source_id = source_ids[key]
+        except KeyError:
+            continue
+        if target.fat[file_id][1] <= target.fat[file_id][0] or \
+                source.fat[source_id][1] <= source.fat[source_id][0]:
+            continue
+        target_range = (target.fat[file_id][0], target.slot_end(file_id))
+        source_range = (source.fat[source_id][0],
+                        source.slot_end(source_id))
+        narc = narc_regions(source.data, target.data, source_range,
+                            target_range)
+        if narc is None:
+            regions.append(target_range+source_range)
+        else:
+            regions.extend(narc)
+    return regions
+
+
+def is_rom(fname):
+    """Check whether a file starts with a valid NDS header"""
+    with open(fname, 'rb') as handle:
+        header = handle.read(0x160)
+    if len(header) < 0x160:
+        return False
+    return struct.unpack_from('<H', header, 0x15E)[0] == \
+        crc16(header[:0x15E])
+
+
+def _magic(fname):
+    with open(fname, 'rb') as handle:
+        return handle.read(4)
+
+
+def make_patch(patchname, fname1, fname2):
+    """Write a VCDIFF patch that turns fname1 into fname2
+
+    If both are NDS ROMs or both are NARCs, their files are lined up
+    with each other before diffing. See rom_regions and narc_regions.
+
+    Parameters
+    ----------
+    patchname : string
+    fname1 : string
+        Original file
+    fname2 : string
+        Modified file
+    """
+    regions = ()
+    if is_rom(fname1) and is_rom(fname2):
+        source = ROM(fname1)
+        try:
+            target = ROM(fname2)
+            try:
+                regions = rom_regions(source, target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    elif _magic(fname1) == _magic(fname2) == 'NARC':
+        with open(fname1, 'rb') as handle:
+            source = handle.read()
+        with open(fname2, 'rb') as handle:
+            target = handle.read()
+        regions = narc_regions(source, target, (0, len(source)),
+                               (0, len(target))) or ()
+    vcdiff.make_patch(patchname, fname1, fname2, regions)
+
+
+apply_patch = vcdiff.apply_patch
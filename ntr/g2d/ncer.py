@@ -8,6 +8,7 @@ from PIL import Image
 
 from generic.archive import ArchiveList
 from generic.editable import XEditable as Editable
+from renderer import TileRenderer
 from util import BinaryIO
 
 
@@ -211,7 +212,24 @@ class NCER(Editable, ArchiveList):
             writer.writeUInt32(size)
         return writer
 
-    def get_image(self, id, cgr, clr):
+    def get_image(self, id, cgr=None, clr=None, renderer=None):
+        """Render one cell
+
+        Parameters
+        ----------
+        id : int
+            Cell index
+        cgr : NCGR, optional
+        clr : NCLR, optional
+        renderer : TileRenderer, optional
+            Renderer to reuse instead of decoding cgr and clr again
+
+        Returns
+        -------
+        img : Image
+        """
+        if renderer is None:
+            renderer = TileRenderer(cgr, clr)
         cell = self.cebk.cells[id]
         # maxX = min(cell.maxX for cell in self.cebk.cells)
         # maxY = min(cell.maxY for cell in self.cebk.cells)
@@ -228,38 +246,12 @@ class NCER(Editable, ArchiveList):
             minX = min(attr.x for attr in cell.attrs)
             minY = min(attr.y for attr in cell.attrs)
 
-        img = Image.new('RGBA', (maxX-minX+1, maxY-minY+1))
-        tiles = cgr.get_tiles()
-        palettes = clr.get_palettes()
-        pix = img.load()
-
+        canvas = renderer.new_canvas(maxX-minX+1, maxY-minY+1)
         for attr in cell.attrs:
-            tile_id = attr.tileofs
-            # apply flip outside too?
-            if attr.vertical_flip:
-                flip_y_factor = -1
-            else:
-                flip_y_factor = 1
-            if attr.horizontal_flip:
-                flip_x_factor = -1
-            else:
-                flip_x_factor = 1
-            for scr_y in range(attr.y-minY, attr.y-minY+attr.height, 8)[::flip_y_factor]:
-                for scr_x in range(attr.x-minX, attr.x-minX+attr.width, 8)[::flip_x_factor]:
-                    tile = tiles[tile_id]
-                    palette = palettes[attr.pal_id]
-                    for sub_y, tile_y in enumerate(range(8)[::flip_y_factor]):
-                        for sub_x, tile_x in enumerate(range(8)[::flip_x_factor]):
-                            val = tile[tile_y][tile_x]
-                            try:
-                                if val:
-                                    pix[(scr_x+sub_x, scr_y+sub_y)] = palette[val]
-                                elif 0:
-                                    pix[(scr_x+sub_x, scr_y+sub_y)] = (0, 0, 0, 0)
-                            except IndexError:
-                                continue
-                    tile_id += 1
-        return img
+            renderer.blit(canvas, attr.tileofs, attr.width, attr.height,
+                          attr.x-minX, attr.y-minY, attr.pal_id,
+                          attr.horizontal_flip, attr.vertical_flip)
+        return renderer.to_image(canvas)
 
     @property
     def files(self):
@@ -272,8 +264,9 @@ class NCER(Editable, ArchiveList):
             raise ValueError('No dependencies set. '
                              'Call update_dependencies(cgr, clr)')
         self._files = []
+        renderer = TileRenderer(cgr, clr)
         for idx, cell in enumerate(self.cebk.cells):
-            image = self.get_image(idx, cgr, clr)
+            image = self.get_image(idx, renderer=renderer)
             buffer = StringIO()
             image.save(buffer, format='PNG', pnginfo=cell)
             self._files.append(buffer.getvalue())
@@ -1,6 +1,6 @@
 
-import array
 
+import numpy as np
 from PIL import Image
 
 from generic import Editable
@@ -11,6 +11,165 @@ def default_palette():
     return [(c, c, c, 255) for c in range(16)*16]
 
 
+def unpack_pixels(data, format):
+    """Split character data into one palette index per pixel
+
+    Parameters
+    ----------
+    data : string or numpy.ndarray
+        Raw character bytes
+    format : int
+        CHAR.FORMAT_16BIT (4bpp, low nibble first) or CHAR.FORMAT_256BIT
+
+    Returns
+    -------
+    pixels : numpy.ndarray
+        Flat uint8 array
+    """
+    if isinstance(data, np.ndarray):
+        data = data.astype(np.uint8, copy=False)
+    else:
+        data = np.frombuffer(data, dtype=np.uint8)
+    if format == CHAR.FORMAT_16BIT:
+        pixels = np.empty(len(data)*2, dtype=np.uint8)
+        pixels[0::2] = data & 0xF
+        pixels[1::2] = data >> 4
+        return pixels
+    elif format == CHAR.FORMAT_256BIT:
+        return data.copy()
+    raise ValueError('Unknown format: {0}'.format(format))
+
+
+def pack_pixels(pixels, format):
+    """Join palette indexes into character data. See unpack_pixels()
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Flat uint8 array
+    """
+    pixels = np.asarray(pixels).astype(np.uint8).ravel()
+    if format == CHAR.FORMAT_16BIT:
+        return pixels[0::2] | (pixels[1::2] << 4)
+    elif format == CHAR.FORMAT_256BIT:
+        return pixels
+    raise ValueError('Unknown format: {0}'.format(format))
+
+
+def tiles_to_image(tiles, width, height):
+    """Arrange 8x8 tiles in rows
+
+    Parameters
+    ----------
+    tiles : numpy.ndarray
+        Array of shape (width*height, 8, 8). Any further axes, such as
+        RGBA channels, are kept
+    width : int
+        Width in tiles
+    height : int
+        Height in tiles
+
+    Returns
+    -------
+    pixels : numpy.ndarray
+        Array of shape (height*8, width*8)
+    """
+    extra = tiles.shape[3:]
+    return tiles.reshape((height, width, 8, 8)+extra).swapaxes(1, 2)\
+        .reshape((height*8, width*8)+extra)
+
+
+def image_to_tiles(pixels, width, height):
+    """Cut rows of pixels into 8x8 tiles. Inverse of tiles_to_image()"""
+    return np.asarray(pixels).reshape(height, 8, width, 8).swapaxes(1, 2)\
+        .reshape(width*height, 8, 8)
+
+
+_lcg_tables = []
+
+
+def lcg_tables():
+    """Full cycle of the 16-bit sprite encryption LCG
+
+    Only the low 16 bits of the generator are used, so every seed lies on
+    one cycle of period 0x10000. The cycle is built once by repeatedly
+    jumping ahead by the length already known.
+
+    Returns
+    -------
+    cycle : numpy.ndarray
+        Keys starting from 0, repeated twice so any run of up to 0x10000
+        keys is a contiguous slice
+    positions : numpy.ndarray
+        Index of each key within the cycle
+    """
+    if not _lcg_tables:
+        keys = np.zeros(1, dtype=np.uint32)
+        mult = CHAR.ENCRYPT_MULT & 0xFFFF
+        carry = CHAR.ENCRYPT_CARRY
+        while len(keys) < 0x10000:
+            keys = np.concatenate((keys, (keys*mult+carry) & 0xFFFF))
+            carry = (carry*mult+carry) & 0xFFFF
+            mult = (mult*mult) & 0xFFFF
+        positions = np.empty(0x10000, dtype=np.intp)
+        positions[keys] = np.arange(0x10000)
+        keys = keys.astype(np.uint16)
+        _lcg_tables.extend((np.concatenate((keys, keys)), positions))
+    return _lcg_tables
+
+
+def keystream(seed, length):
+    """Get length keys of the sprite encryption starting at seed
+
+    Returns
+    -------
+    keys : numpy.ndarray
+        uint16 array. Streams of up to 0x10000 keys are read-only views
+        of the shared cycle
+    """
+    cycle, positions = lcg_tables()
+    start = positions[seed & 0xFFFF]
+    if length <= 0x10000:
+        return cycle[start:start+length]
+    return cycle.take(np.arange(start, start+length), mode='wrap')
+
+
+def crypt(data, encryption, seed=None):
+    """Apply the sprite encryption to character data
+
+    The keystream is XORed over the 16-bit words of data. With
+    NCGR.ENCRYPTION_REVERSE it starts at the last word and runs backwards.
+
+    Parameters
+    ----------
+    data : string
+    encryption : int
+        NCGR.ENCRYPTION_REVERSE or NCGR.ENCRYPTION_FORWARDS
+    seed : int, optional
+        First key. Defaults to the first word to be processed, which is
+        the seed when decrypting.
+
+    Returns
+    -------
+    data : string
+    seed : int
+    """
+    words = np.frombuffer(data, dtype='<u2')
+    if not len(words):
+        return data, seed or 0
+    if encryption == NCGR.ENCRYPTION_REVERSE:
+        if seed is None:
+            seed = int(words[-1])
+        keys = keystream(seed, len(words))[::-1]
+    elif encryption == NCGR.ENCRYPTION_FORWARDS:
+        if seed is None:
+            seed = int(words[0])
+        keys = keystream(seed, len(words))
+    else:
+        raise ValueError('Unknown encryption: {0}'.format(encryption))
+    return (words ^ keys).astype('<u2').tostring(), seed
+
+
 class CHAR(Editable):
     """Character information"""
     FORMAT_16BIT = 3
@@ -31,6 +190,7 @@ class CHAR(Editable):
         self.uint32('datasize')
         self.uint32('offset')
         self.data = ''
+        self.seed = 0
 
     def load(self, reader):
         Editable.load(self, reader)
@@ -40,184 +200,114 @@ class CHAR(Editable):
 
     def save(self, writer):
         old_datasize = self.datasize
+        data = self.data
         if self.cgr.encryption != NCGR.ENCRYPTION_NONE:
-            self.encrypt(self.cgr.encryption)
-        self.datasize = len(self.data)
+            data, self.seed = crypt(data, self.cgr.encryption, self.seed)
+        self.datasize = len(data)
         self.size_ += self.datasize-old_datasize
         writer = Editable.save(self, writer)
-        writer.write(self.data)
+        writer.write(data)
         return writer
 
     def encrypt(self, encryption):
-        """Applies encryption/decryption to the sprite.
+        """Applies encryption to the sprite using the seed it was
+        decrypted with.
 
-        Each call toggles its encrypted state, so calling it twice will
-        bring it back to its original state.
+        Calling decrypt() then encrypt() brings back the original data.
         """
-        if encryption is NCGR.ENCRYPTION_NONE:
+        if encryption == NCGR.ENCRYPTION_NONE:
             return
-        enc_data = array.array('H', self.data)
-        if encryption == NCGR.ENCRYPTION_REVERSE:
-            enc_data = enc_data[::-1]
-        dec_data = array.array('H')
-        key = enc_data[0]
-        for val in enc_data:
-            dec_data.append(val ^ (key & 0xFFFF))
-            key *= self.ENCRYPT_MULT
-            key += self.ENCRYPT_CARRY
-        self.data = dec_data.tostring()
-    decrypt = encrypt
+        self.data, self.seed = crypt(self.data, encryption, self.seed)
 
-    def get_tiles(self):
-        tiles = []
+    def decrypt(self, encryption):
+        """Removes encryption from the sprite, remembering its seed"""
+        if encryption == NCGR.ENCRYPTION_NONE:
+            return
+        self.data, self.seed = crypt(self.data, encryption)
+
+    @property
+    def subwidth(self):
+        """Number of bytes in each 8 pixel row of a tile"""
         if self.format == self.FORMAT_16BIT:
-            subwidth = 4
+            return 4
         elif self.format == self.FORMAT_256BIT:
-            subwidth = 8
-        for tile_id in range(self.datasize/subwidth/8):
-            tile = []
-            for tile_y in range(8):
-                tile.append([])
-                for tile_x in range(subwidth):
-                    val = ord(self.data[tile_id*8*subwidth+
-                                        tile_y*subwidth+tile_x])
-                    if self.format == self.FORMAT_16BIT:
-                        tile[tile_y].append(val & 0xF)
-                        tile[tile_y].append(val >> 0x4)
-                    elif self.format == self.FORMAT_256BIT:
-                        tile[tile_y].append(val)
-            tiles.append(tile)
-        return tiles
+            return 8
+        raise ValueError('Unknown format: {0}'.format(self.format))
+
+    def get_tile_array(self):
+        """Get every tile at once
+
+        Returns
+        -------
+        tiles : numpy.ndarray
+            uint8 array of shape (count, 8, 8)
+        """
+        tile_size = self.subwidth*8
+        data = np.frombuffer(self.data, dtype=np.uint8)
+        data = data[:self.datasize//tile_size*tile_size]
+        return unpack_pixels(data, self.format).reshape(-1, 8, 8)
+
+    def get_tiles(self):
+        return self.get_tile_array().tolist()
 
     def get_tile(self, tileofs):
-        if self.format == self.FORMAT_16BIT:
-            subwidth = 4
-        elif self.format == self.FORMAT_256BIT:
-            subwidth = 8
-        tile = []
-        for tile_y in range(8):
-            tile.append([])
-            for tile_x in range(subwidth):
-                val = ord(self.data[tileofs+tile_y*subwidth+tile_x])
-                if self.format == self.FORMAT_16BIT:
-                    tile[tile_y].append(val & 0xF)
-                    tile[tile_y].append(val >> 0x4)
-                elif self.format == self.FORMAT_256BIT:
-                    tile[tile_y].append(val)
-        return tile
+        data = np.frombuffer(self.data, dtype=np.uint8,
+                             count=self.subwidth*8, offset=tileofs)
+        return unpack_pixels(data, self.format).reshape(8, 8).tolist()
 
     def set_tiles(self, tiles):
-        self.data = ''
-        if self.format == self.FORMAT_16BIT:
-            subwidth = 4
-        elif self.format == self.FORMAT_256BIT:
-            subwidth = 8
-        for tile in tiles:
-            for tile_y in range(8):
-                for tile_x in range(subwidth):
-                    if self.format == self.FORMAT_16BIT:
-                        val = tile[tile_y][tile_x*2]
-                        val |= tile[tile_y][tile_x*2+1] << 4
-                    elif self.format == self.FORMAT_256BIT:
-                        val = tile[tile_y][tile_x]
-                    self.data += chr(val)
+        tiles = np.asarray(tiles, dtype=np.uint8).reshape(-1, 8, 8)
+        self.data = pack_pixels(tiles, self.format).tostring()
         old_datasize = self.datasize
         self.datasize = len(self.data)
         self.size_ += self.datasize-old_datasize
 
-    def get_pixels(self, width=None, height=None):
-        """pixels = [[[]]]
-        subx = suby = 0
-        blockx = blocky = 0
-        for c in self.data:
-            val = ord(c)
-            if self.format == self.FORMAT_16BIT:
-                pixels[blocky][blockx][suby].append(val & 0xF)
-                pixels[blocky][blockx][suby].append(val >> 0x4)
-                subx += 2
-            elif self.format == self.FORMAT_256BIT:
-                pixels[blocky][blockx][suby].append(val)
-                subx += 1
-            if subx == 8:
-                subx = 0
-                suby += 1
-                if suby == 8:
-                    blockx += 1
-                    if blockx == 8:
-                        blockx = 0
-                        blocky += 1
-                        pixels.append([[[]]])
-                    else:
-                        pixels[blocky].append([[]])
-                else:
-                    pixels[blocky][blockx].append([])"""
+    def get_pixel_array(self, width=None, height=None):
+        """Get the pixels of the image
+
+        Parameters
+        ----------
+        width : int, optional
+            Width in tiles. Defaults to the stored width
+        height : int, optional
+            Height in tiles. Defaults to the stored height
+
+        Returns
+        -------
+        pixels : numpy.ndarray
+            uint8 array of palette indexes with shape (height*8, width*8)
+        """
         if width is None:
             width = self.width
         if height is None:
             height = self.height
-        pixels = []
-        if self.format == self.FORMAT_16BIT:
-            subwidth = 4
-        elif self.format == self.FORMAT_256BIT:
-            subwidth = 8
-        else:
-            raise ValueError('Unknown format: {0}'.format(self.format))
+        size = width*height*8*self.subwidth
+        data = np.frombuffer(self.data, dtype=np.uint8, count=size)
+        pixels = unpack_pixels(data, self.format)
         if self.type == self.TYPE_LINEAR:
-            data_idx = 0
-            for suby in range(height*8):
-                for subx in range(width*4):
-                    val = ord(self.data[data_idx])
-                    if self.format == self.FORMAT_16BIT:
-                        pixels.append(val & 0xF)
-                        pixels.append(val >> 0x4)
-                    elif self.format == self.FORMAT_256BIT:
-                        pixels.append(val)
-                    data_idx += 1
-            return pixels
-        for blocky in range(height):
-            for suby in range(8):
-                for blockx in range(width):
-                    for subx in range(subwidth):
-                        val = ord(self.data[(blocky*width*8*subwidth)+
-                                            (blockx*8*subwidth)+
-                                            (suby*subwidth)+subx])
-                        if self.format == self.FORMAT_16BIT:
-                            pixels.append(val & 0xF)
-                            pixels.append(val >> 0x4)
-                        elif self.format == self.FORMAT_256BIT:
-                            pixels.append(val)
-        return pixels
+            return pixels.reshape(height*8, width*8)
+        return tiles_to_image(pixels, width, height)
+
+    def get_pixels(self, width=None, height=None):
+        return self.get_pixel_array(width, height).ravel().tolist()
 
     def set_pixels(self, pixels, width, height):
-        data = array.array('B')
-        if self.format == self.FORMAT_16BIT:
-            subwidth = 4
-        elif self.format == self.FORMAT_256BIT:
-            subwidth = 8
-        else:
-            raise ValueError('Unknown format: {0}'.format(self.format))
-        if self.type == self.TYPE_LINEAR:
-            for pix_idx in range(width*height*8*subwidth):
-                if self.format == self.FORMAT_16BIT:
-                    data.append(pixels[pix_idx*2] |
-                                (pixels[pix_idx*2+1] << 4))
-                elif self.format == self.FORMAT_256BIT:
-                    data.append(pixels[pix_idx])
-        else:
-            for blocky in range(height):
-                for blockx in range(width):
-                    for suby in range(8):
-                        for subx in range(subwidth):
-                            pix_idx = ((blocky*width*8*8) +
-                                       (suby*width*8) +
-                                       (blockx*8) +
-                                       subx*2)
-                            if self.format == self.FORMAT_16BIT:
-                                data.append(pixels[pix_idx] |
-                                            (pixels[pix_idx+1] << 4))
-                            elif self.format == self.FORMAT_256BIT:
-                                data.append(pixels[pix_idx])
-        self.data = data.tostring()
+        """Set the pixels of the image
+
+        Parameters
+        ----------
+        pixels : array_like
+            Palette indexes of width*8 by height*8 pixels, in rows
+        width : int
+            Width in tiles
+        height : int
+            Height in tiles
+        """
+        pixels = np.asarray(pixels, dtype=np.uint8).ravel()
+        pixels = pixels[:width*height*64]
+        if self.type != self.TYPE_LINEAR:
+            pixels = image_to_tiles(pixels, width, height)
+        self.data = pack_pixels(pixels, self.format).tostring()
 
 
 class CPOS(Editable):
@@ -279,7 +369,6 @@ class NCGR(Editable):
 
     def get_image(self, width=None, height=None, clr=None, pal_id=0,
                   transparent=True):
-        data = ''
         if width is None:
             width = self.char.width
         else:
@@ -289,15 +378,14 @@ class NCGR(Editable):
         else:
             height >>= 3
         if clr is None:
-            palette = self.palette
+            palette = np.array(self.palette, dtype=np.uint8)
         else:
-            palette = clr.get_palettes()[pal_id]
-        for pix in self.char.get_pixels(width, height):
-            if not pix and transparent:
-                data += chr(0)*4
-            else:
-                data += ''.join(map(chr, palette[pix]))
-        return Image.frombytes('RGBA', (width*8, height*8), data)
+            palette = clr.get_palette_array()[pal_id]
+        if transparent:
+            palette = palette.copy()
+            palette[0] = 0
+        data = palette[self.char.get_pixel_array(width, height)]
+        return Image.frombytes('RGBA', (width*8, height*8), data.tostring())
 
     def set_image(self, img, clr, modify_palette=EDIT_ANY, pal_id=0):
         img = img.convert('RGBA')
@@ -305,16 +393,20 @@ class NCGR(Editable):
             palette = [(0xF8, 0xF8, 0xF8, 0)]
         else:
             palette = clr.get_palettes()[pal_id]
-        pixels = []
         width, height = img.size
         width >>= 3
         height >>= 3
-        for pix in img.getdata():
-            if pix[3] < 0x80:
-                pixels.append(0)
-                continue
-            color = (pix[0] & 0xF8, pix[1] & 0xF8,
-                     pix[2] & 0xF8, 255)
+        rgba = np.asarray(img, dtype=np.uint8).reshape(-1, 4)
+        opaque = rgba[:, 3] >= 0x80
+        keys = (rgba[opaque, :3] & 0xF8).astype(np.uint32)
+        keys = keys[:, 0] << 16 | keys[:, 1] << 8 | keys[:, 2]
+        # Resolve each distinct color once, in order of first appearance
+        colors, first, inverse = np.unique(keys, return_index=True,
+                                           return_inverse=True)
+        indexes = np.zeros(len(colors), dtype=np.uint8)
+        for color_id in np.argsort(first, kind='mergesort'):
+            key = int(colors[color_id])
+            color = (key >> 16, (key >> 8) & 0xFF, key & 0xFF, 255)
             try:
                 index = palette.index(color, 1)
             except:
@@ -333,13 +425,18 @@ class NCGR(Editable):
                         raise ValueError('Cannot have more than 16 colors')
                 else:
                     palette.append(color)
-            pixels.append(index)
+            indexes[color_id] = index
+        pixels = np.zeros(len(rgba), dtype=np.uint8)
+        pixels[opaque] = indexes[inverse]
         self.char.set_pixels(pixels, width, height)
         if modify_palette != self.EDIT_NONE:
             clr.set_palette(pal_id, palette)
         self.char.width = width
         self.char.height = height
 
+    def get_tile_array(self):
+        return self.char.get_tile_array()
+
     def get_tiles(self):
         return self.char.get_tiles()
 
@@ -1,11 +1,52 @@
 
 import array
 
+import numpy as np
 from PIL import Image
 
 from generic.editable import XEditable as Editable
 
 
+def bgr555_to_rgba(values):
+    """Convert BGR555 colors to RGBA
+
+    Parameters
+    ----------
+    values : array_like
+        16-bit colors of any shape
+
+    Returns
+    -------
+    colors : numpy.ndarray
+        uint8 array with an extra trailing axis of (r, g, b, 255)
+    """
+    values = np.asarray(values, dtype=np.uint16)
+    colors = np.empty(values.shape+(4, ), dtype=np.uint8)
+    colors[..., 0] = (values & 0x1f) << 3
+    colors[..., 1] = ((values >> 5) & 0x1f) << 3
+    colors[..., 2] = ((values >> 10) & 0x1f) << 3
+    colors[..., 3] = 255
+    return colors
+
+
+def rgba_to_bgr555(colors):
+    """Convert RGB or RGBA colors to BGR555
+
+    Parameters
+    ----------
+    colors : array_like
+        Colors with a trailing axis of at least (r, g, b). Alpha is ignored.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        uint16 array without the trailing axis
+    """
+    colors = np.asarray(colors, dtype=np.uint16)
+    return ((colors[..., 0] >> 3) | (colors[..., 1] >> 3 << 5) |
+            (colors[..., 2] >> 3 << 10)).astype(np.uint16)
+
+
 class PLTT(Editable):
     """Palette information"""
     FORMAT_16BIT = 3
@@ -32,42 +73,35 @@ class PLTT(Editable):
         writer.writePadding(ofs+self.datasize)
         return writer
 
-    def get_palettes(self):
-        palettes = []
+    @property
+    def num(self):
+        """Number of colors in each palette"""
         if self.format == self.FORMAT_16BIT:
-            num = 16
+            return 16
         elif self.format == self.FORMAT_256BIT:
-            num = 256
-        start = 0
-        for pal_id in range(len(self.data)/num):
-            palette = []
-            for i in range(num):
-                val = self.data[start+i]
-                palette.append((((val >> 0) & 0x1f) << 3,
-                               ((val >> 5) & 0x1f) << 3,
-                               ((val >> 10) & 0x1f) << 3,
-                               255))
-            start += num
-            palettes.append(palette)
-        return palettes
+            return 256
+        raise ValueError('Unknown format: {0}'.format(self.format))
+
+    def get_palette_array(self):
+        """Get every palette at once
+
+        Returns
+        -------
+        palettes : numpy.ndarray
+            uint8 array of shape (count, num, 4) with RGBA colors
+        """
+        num = self.num
+        values = np.frombuffer(self.data, dtype=np.uint16)
+        count = len(values)//num
+        return bgr555_to_rgba(values[:count*num].reshape(count, num))
+
+    def get_palettes(self):
+        return [map(tuple, palette)
+                for palette in self.get_palette_array().tolist()]
 
     def get_palette(self, pal_id, transparent=True):
-        palette = []
-        if self.format == self.FORMAT_16BIT:
-            num = 16
-        elif self.format == self.FORMAT_256BIT:
-            num = 256
-        start = pal_id*num
-        for i in range(num):
-            if not num and transparent:
-                palette.append(chr(0)*4)
-                continue
-            val = self.data[start+i]
-            palette.append(chr(((val >> 0) & 0x1f) << 3) +
-                           chr(((val >> 5) & 0x1f) << 3) +
-                           chr(((val >> 10) & 0x1f) << 3) +
-                           chr(255))
-        return palette
+        data = self.get_palette_array()[pal_id].tostring()
+        return [data[idx:idx+4] for idx in xrange(0, len(data), 4)]
 
     def set_palette(self, pal_id, palette):
         """
@@ -78,18 +112,14 @@ class PLTT(Editable):
         palette : list of tuple
             List of 4-/3-int-tuple colors
         """
-        if self.format == self.FORMAT_16BIT:
-            num = 16
-        elif self.format == self.FORMAT_256BIT:
-            num = 256
+        num = self.num
         start = pal_id*num
-        for i, color in enumerate(palette):
-            if i > num:
-                break
-            r, g, b = color[:3]
-            self.data[start+i] = ((r >> 3) |
-                                  (g >> 3 << 5) |
-                                  (b >> 3 << 10))
+        colors = np.array([color[:3] for color in palette[:num]],
+                          dtype=np.uint8).reshape(-1, 3)
+        if start+len(colors) > len(self.data):
+            raise IndexError('Palette {0} is out of range'.format(pal_id))
+        self.data[start:start+len(colors)] = array.array(
+            'H', rgba_to_bgr555(colors).tostring())
 
 
 class NCLR(Editable):
@@ -120,5 +150,8 @@ class NCLR(Editable):
     def get_palettes(self):
         return self.pltt.get_palettes()
 
+    def get_palette_array(self):
+        return self.pltt.get_palette_array()
+
     def set_palette(self, pal_id, palette):
         return self.pltt.set_palette(pal_id, palette)
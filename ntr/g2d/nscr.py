@@ -6,6 +6,7 @@ import itertools
 from PIL import Image
 
 from generic.editable import XEditable as Editable
+from renderer import TileRenderer
 from util import BinaryIO
 
 
@@ -62,40 +63,27 @@ class NSCR(Editable):
             writer.writeUInt32(size)
         return writer
 
-    def get_image(self, cgr=None, clr=None):
-        img = Image.new('RGBA', (self.scrn.width, self.scrn.height))
-        if cgr is None:
-            return img
-        tiles = cgr.get_tiles()
-        palettes = clr.get_palettes()
-        pix = img.load()
+    def get_image(self, cgr=None, clr=None, renderer=None):
+        """Render the screen
 
-        scr_x = scr_y = 0
-        for tiledata in self.scrn.data:
-            tile = tiles[tiledata & 0x3FF]
-            if (tiledata >> 10) & 1:
-                flip_y_factor = -1
-            else:
-                flip_y_factor = 1
-            if (tiledata >> 11) & 1:
-                flip_x_factor = -1
-            else:
-                flip_x_factor = 1
-            palette = palettes[(tiledata >> 12) & 0xF]
-            for sub_y in range(8)[::flip_y_factor]:
-                for sub_x in range(8)[::flip_x_factor]:
-                    val = tile[sub_y][sub_x]
-                    if val:
-                        pix[(scr_x+sub_x, scr_y+sub_y)] = palette[val]
-                    else:
-                        pix[(scr_x+sub_x, scr_y+sub_y)] = (0, 0, 0, 0)
-            scr_x += 8
-            if scr_x >= self.scrn.width:
-                scr_x = 0
-                scr_y += 8
-                if scr_y >= self.scrn.height:
-                    break
-        return img
+        Parameters
+        ----------
+        cgr : NCGR, optional
+        clr : NCLR, optional
+        renderer : TileRenderer, optional
+            Renderer to reuse instead of decoding cgr and clr again
+
+        Returns
+        -------
+        img : Image
+        """
+        if renderer is None:
+            if cgr is None:
+                return Image.new('RGBA', (self.scrn.width, self.scrn.height))
+            renderer = TileRenderer(cgr, clr)
+        canvas = renderer.draw_screen(self.scrn.data, self.scrn.width,
+                                      self.scrn.height)
+        return renderer.to_image(canvas)
 
     def get_target_image(self):
         img = Image.new('RGBA', (self.scrn.width, self.scrn.height))
@@ -0,0 +1,160 @@
+
+import numpy as np
+from PIL import Image
+
+from ncgr import tiles_to_image
+
+
+class TileRenderer(object):
+    """Draws 8x8 tiles of a character set with a set of palettes
+
+    The tiles and palettes are decoded once when the renderer is built,
+    so one renderer can draw every screen or cell that uses them.
+    Tiles are composited as whole arrays; flips are views of the
+    decoded tiles.
+
+    Parameters
+    ----------
+    cgr : NCGR
+        Character data
+    clr : NCLR
+        Palettes
+
+    Attributes
+    ----------
+    tiles : numpy.ndarray
+        Palette indexes of shape (count, 8, 8)
+    palettes : numpy.ndarray
+        RGBA colors of shape (count, colors, 4)
+    """
+    def __init__(self, cgr, clr):
+        self.tiles = cgr.get_tile_array()
+        self.palettes = clr.get_palette_array()
+        self._flipped = {}
+
+    def flipped(self, hflip, vflip):
+        """Get every tile flipped
+
+        Variants are built on first use and kept for later calls.
+
+        Parameters
+        ----------
+        hflip : bool
+            Mirror each tile left to right
+        vflip : bool
+            Mirror each tile top to bottom
+
+        Returns
+        -------
+        tiles : numpy.ndarray
+        """
+        key = (bool(hflip), bool(vflip))
+        try:
+            return self._flipped[key]
+        except KeyError:
+            pass
+        tiles = self.tiles
+        if hflip:
+            tiles = tiles[:, :, ::-1]
+        if vflip:
+            tiles = tiles[:, ::-1, :]
+        self._flipped[key] = tiles
+        return tiles
+
+    @staticmethod
+    def new_canvas(width, height):
+        """Transparent RGBA array of height rows by width columns"""
+        return np.zeros((height, width, 4), dtype=np.uint8)
+
+    @staticmethod
+    def to_image(canvas):
+        height, width = canvas.shape[:2]
+        return Image.frombytes('RGBA', (width, height),
+                               np.ascontiguousarray(canvas).tostring())
+
+    def draw_screen(self, entries, width, height):
+        """Render screen data of tile, flip and palette entries
+
+        Parameters
+        ----------
+        entries : array_like
+            16-bit entries. Bits 0-9 are the tile, bit 10 flips the tile
+            horizontally, bit 11 flips it vertically and bits 12-15 are
+            the palette
+        width : int
+            Width in pixels
+        height : int
+            Height in pixels
+
+        Returns
+        -------
+        canvas : numpy.ndarray
+            RGBA array. Index 0 of each palette is transparent
+        """
+        cols = (width+7)//8
+        rows = (height+7)//8
+        entries = np.asarray(entries, dtype=np.uint16)[:cols*rows]
+        tiles = np.zeros((cols*rows, 8, 8), dtype=np.uint8)
+        pal_ids = np.zeros(cols*rows, dtype=np.intp)
+        count = len(entries)
+        tile_ids = entries & 0x3FF
+        flips = (entries >> 10) & 0x3
+        for flip in np.unique(flips):
+            mask = flips == flip
+            variant = self.flipped(flip & 0x1, flip & 0x2)
+            tiles[:count][mask] = variant[tile_ids[mask]]
+        pal_ids[:count] = entries >> 12
+        colors = self.palettes[pal_ids[:, None, None], tiles]
+        colors[tiles == 0] = 0
+        canvas = tiles_to_image(colors, cols, rows)
+        return canvas[:height, :width]
+
+    def blit(self, canvas, tileofs, width, height, x, y, pal_id,
+             hflip=False, vflip=False):
+        """Draw a block of consecutive tiles onto canvas
+
+        Index 0 of the palette is transparent and leaves the canvas as
+        it was. Pixels outside of the canvas are clipped.
+
+        Parameters
+        ----------
+        canvas : numpy.ndarray
+            RGBA array from new_canvas()
+        tileofs : int
+            First tile of the block
+        width : int
+            Block width in pixels
+        height : int
+            Block height in pixels
+        x : int
+            Left of the block on canvas
+        y : int
+            Top of the block on canvas
+        pal_id : int
+        hflip : bool, optional
+            Mirror the whole block left to right
+        vflip : bool, optional
+            Mirror the whole block top to bottom
+        """
+        cols = width//8
+        rows = height//8
+        tiles = self.tiles[tileofs:tileofs+cols*rows]
+        if len(tiles) < cols*rows:
+            raise IndexError('Tile {0} is out of range'.format(
+                tileofs+len(tiles)))
+        block = tiles_to_image(tiles, cols, rows)
+        if hflip:
+            block = block[:, ::-1]
+        if vflip:
+            block = block[::-1]
+        canvas_height, canvas_width = canvas.shape[:2]
+        left = max(0, -x)
+        top = max(0, -y)
+        right = min(width, canvas_width-x)
+        bottom = min(height, canvas_height-y)
+        if left >= right or top >= bottom:
+            return
+        block = block[top:bottom, left:right]
+        target = canvas[y+top:y+bottom, x+left:x+right]
+        mask = block != 0
+        target[mask] = self.palettes[pal_id][block[mask]]
@@ -4,18 +4,176 @@ import json
 import struct
 from cStringIO import StringIO
 
+import numpy as np
+
 from generic.archive import ArchiveList
+from ntr.g2d.nclr import bgr555_to_rgba, rgba_to_bgr555
 from ntr.g3d.resdict import G3DResDict
 from util.io import BinaryIO
 
 from PIL import Image
 
+FORMAT_A3I5 = 1
+FORMAT_I2 = 2
+FORMAT_I4 = 3
+FORMAT_I8 = 4
+FORMAT_4X4 = 5
+FORMAT_A5I3 = 6
+FORMAT_DIRECT = 7
+
+#: Bits per texel of the indexed formats
+INDEXED_BITS = {
+    FORMAT_A3I5: 8,
+    FORMAT_I2: 2,
+    FORMAT_I4: 4,
+    FORMAT_I8: 8,
+    FORMAT_A5I3: 8,
+}
+
 
 def log2(x):
     """Integer log2"""
     return x.bit_length()-1
 
 
+def unpack_texels(data, format, width, height):
+    """Split indexed texture data into palette indexes and alpha
+
+    Parameters
+    ----------
+    data : string
+        Texture data starting at the texture
+    format : int
+        One of FORMAT_A3I5, FORMAT_I2, FORMAT_I4, FORMAT_I8 or FORMAT_A5I3
+    width : int
+    height : int
+
+    Returns
+    -------
+    indexes : numpy.ndarray
+        uint8 array of shape (height, width)
+    alpha : numpy.ndarray or None
+        uint8 alpha of the translucent formats, same shape as indexes
+    """
+    try:
+        bits = INDEXED_BITS[format]
+    except KeyError:
+        raise ValueError('Unhandled format: %d' % format)
+    count = width*height
+    values = np.frombuffer(data, dtype=np.uint8,
+                           count=min(len(data), count*bits >> 3))
+    if bits < 8:
+        shifts = np.arange(0, 8, bits, dtype=np.uint8)
+        values = (values[:, None] >> shifts) & ((1 << bits)-1)
+    values = values.reshape(height, width)
+    if format == FORMAT_A3I5:
+        return values & 0x1F, (values >> 5)*36
+    elif format == FORMAT_A5I3:
+        return values & 0x7, (values >> 3)*8
+    return values, None
+
+
+def pack_texels(indexes, format, alpha=None):
+    """Join palette indexes and alpha into indexed texture data
+
+    Inverse of unpack_texels(). Alpha is only used by FORMAT_A3I5 and
+    FORMAT_A5I3 and defaults to opaque.
+
+    Returns
+    -------
+    data : string
+    """
+    try:
+        bits = INDEXED_BITS[format]
+    except KeyError:
+        raise ValueError('Unhandled format: %d' % format)
+    values = np.asarray(indexes, dtype=np.uint8).ravel()
+    if alpha is None:
+        alpha = 255
+    alpha = np.asarray(alpha, dtype=np.uint8)
+    if format == FORMAT_A3I5:
+        values = (values & 0x1F) | (np.minimum(alpha // 36, 7) << 5).ravel()
+    elif format == FORMAT_A5I3:
+        values = (values & 0x7) | (alpha >> 3 << 3).ravel()
+    elif bits < 8:
+        values = values & ((1 << bits)-1)
+        shifts = np.arange(0, 8, bits, dtype=np.uint8)
+        values = np.bitwise_or.reduce(values.reshape(-1, len(shifts)) <<
+                                      shifts, axis=1)
+    return values.astype(np.uint8).tostring()
+
+
+def decode_direct(data, width, height):
+    """Decode FORMAT_DIRECT texture data to RGBA
+
+    Returns
+    -------
+    rgba : numpy.ndarray
+        uint8 array of shape (height, width, 4)
+    """
+    values = np.frombuffer(data, dtype='<u2', count=width*height)
+    rgba = bgr555_to_rgba(values.reshape(height, width))
+    rgba[..., 3] = np.where(values.reshape(height, width) & 0x8000, 255, 0)
+    return rgba
+
+
+def decode_4x4(texels, plttidx, colors, width, height):
+    """Decode FORMAT_4X4 compressed texture data to RGBA
+
+    Each 4x4 block has a 32-bit word of 2-bit texels and a 16-bit palette
+    index entry. The entry holds the offset of the block's colors in 4
+    byte units and the mode, which decides whether colors 2 and 3 come
+    from the palette, are blended from colors 0 and 1 or are transparent.
+
+    Parameters
+    ----------
+    texels : string
+        Compressed texel data starting at the texture
+    plttidx : string
+        Palette index data starting at the texture
+    colors : numpy.ndarray
+        BGR555 colors starting at the texture's palette
+    width : int
+    height : int
+
+    Returns
+    -------
+    rgba : numpy.ndarray
+        uint8 array of shape (height, width, 4)
+    """
+    cols = width >> 2
+    rows = height >> 2
+    count = cols*rows
+    texels = np.frombuffer(texels, dtype='<u4', count=count)
+    plttidx = np.frombuffer(plttidx, dtype='<u2', count=count)
+    # Four colors per block, as 5-bit components
+    colors = np.append(np.asarray(colors, dtype=np.uint16),
+                       np.zeros(4, dtype=np.uint16))
+    base = (plttidx & 0x3FFF).astype(np.intp)*2
+    mode = plttidx >> 14
+    rgb = np.empty((count, 4, 3), dtype=np.uint16)
+    for idx in xrange(4):
+        values = colors.take(base+idx, mode='clip')
+        rgb[:, idx, 0] = values & 0x1F
+        rgb[:, idx, 1] = (values >> 5) & 0x1F
+        rgb[:, idx, 2] = (values >> 10) & 0x1F
+    color0 = rgb[:, 0]
+    color1 = rgb[:, 1]
+    blend = mode == 1
+    rgb[blend, 2] = (color0[blend]+color1[blend]) // 2
+    blend = mode == 3
+    rgb[blend, 2] = (color0[blend]*5+color1[blend]*3) // 8
+    rgb[blend, 3] = (color0[blend]*3+color1[blend]*5) // 8
+    palettes = np.empty((count, 4, 4), dtype=np.uint8)
+    palettes[..., :3] = rgb << 3
+    palettes[..., 3] = 255
+    palettes[mode < 2, 3] = 0
+    codes = (texels[:, None] >> np.arange(0, 32, 2, dtype=np.uint32)) & 0x3
+    rgba = palettes[np.arange(count)[:, None], codes]
+    return rgba.reshape(rows, cols, 4, 4, 4).swapaxes(1, 2)\
+        .reshape(height, width, 4)
+
+
 class TexInfo(object):
     INFO_TEX = 0
     INFO_TEX4X4 = 1
@@ -38,9 +196,7 @@ class TexInfo(object):
         self._dataofs = reader.readUInt32()
         if self.infotype == TexInfo.INFO_TEX4X4:
             self._paldataofs = reader.readUInt32()
-            self._datasize <<= 2
-        else:
-            self._datasize <<= 3
+        self._datasize <<= 3
 
     def save(self, writer=None):
         """
@@ -90,94 +246,56 @@ class TEX(ArchiveList):
         self.texparams = []
         self.palparams = []
         self.texdata = ''
+        self.tex4x4data = ''
+        self.tex4x4paldata = ''
         self.paldata = ''
         self._images = None
         if reader is not None:
             self.load(reader)
 
-    def _get_bitmaps(self):
-        """List of 2d bitmaps
+    def get_palette_colors(self, palidx):
+        """BGR555 colors from the start of a palette to the end of paldata
 
-        Each pixel is a tuple of (index, alpha)
+        Returns
+        -------
+        colors : numpy.ndarray
         """
-        bitmaps = []
-        for param in self.texparams:
-            pixels = []  # 1d
-            if param.format == 1:  # A3I5
-                block = self.texdata[param.ofs:param.ofs +
-                                     param.width*param.height]
-                for value in block:
-                    value = ord(value)
-                    index = value & 0x1F
-                    alpha = ((value >> 5) & 0x7)*36
-                    if not index and param.color0:
-                        alpha = 0
-                    pixels += [(index, alpha)]
-            elif param.format == 2:  # I2 4 colors
-                block = self.texdata[param.ofs:param.ofs +
-                                     (param.width*param.height >> 2)]
-                for value in block:
-                    value = ord(value)
-                    for shift in xrange(0, 8, 2):
-                        index = value >> shift & 0x3
-                        alpha = None
-                        if not index and param.color0:
-                            alpha = 0
-                        pixels += [(index, alpha)]
-            elif param.format == 3:  # I4 16 colors
-                block = self.texdata[param.ofs:param.ofs +
-                                     (param.width*param.height >> 1)]
-                for value in block:
-                    value = ord(value)
-                    for shift in xrange(0, 8, 4):
-                        index = value >> shift & 0xF
-                        alpha = None
-                        if not index and param.color0:
-                            alpha = 0
-                        pixels += [(index, alpha)]
-            elif param.format == 4:  # I8 256 colors
-                block = self.texdata[param.ofs:param.ofs +
-                                     param.width*param.height]
-                for value in block:
-                    index = ord(value)
-                    alpha = None
-                    if not index and param.color0:
-                        alpha = 0
-                    pixels += [(index, alpha)]
-            elif param.format == 6:  # A5I3
-                block = self.texdata[param.ofs:param.ofs +
-                                     param.width*param.height]
-                for value in block:
-                    value = ord(value)
-                    index = value & 0x7
-                    alpha = ((value >> 3) & 0x1F)*8
-                    if not index and param.color0:
-                        alpha = 0
-                    pixels += [(index, alpha)]
-            else:
-                raise ValueError('Unhandled format: %d' % param.format)
-            pixels2d = [pixels[i:i+param.width]
-                        for i in xrange(0, len(pixels), param.width)]
-            # img = Image.frombytes('RGBA', (param.width, param.height),
-            #                       data)
-            bitmaps.append(pixels2d)
-        return bitmaps
-
-    def _get_palettes(self):
-        palettes = []
-        for param in self.palparams:
-            palette = []
-            data = self.paldata[param.ofs:param.ofs+512]
-            values = [struct.unpack('H', data[i:i+2])[0]
-                      for i in xrange(0, len(data), 2)]
-            for value in values:
-                palette.append(struct.pack('4B',
-                                           (value >> 0 & 0x1F) << 3,
-                                           (value >> 5 & 0x1F) << 3,
-                                           (value >> 10 & 0x1F) << 3,
-                                           255))
-            palettes.append(palette)
-        return palettes
+        data = self.paldata[self.palparams[palidx].ofs:]
+        return np.frombuffer(data, dtype='<u2', count=len(data) >> 1)
+
+    def get_rgba(self, texidx, palidx=None):
+        """Decode a texture
+
+        Parameters
+        ----------
+        texidx : int
+        palidx : int, optional
+            Palette to draw with. Not needed for FORMAT_DIRECT
+
+        Returns
+        -------
+        rgba : numpy.ndarray
+            uint8 array of shape (height, width, 4)
+        """
+        param = self.texparams[texidx]
+        width = param.width
+        height = param.height
+        if param.format == FORMAT_DIRECT:
+            return decode_direct(self.texdata[param.ofs:], width, height)
+        colors = self.get_palette_colors(palidx)
+        if param.format == FORMAT_4X4:
+            return decode_4x4(self.tex4x4data[param.ofs:],
+                              self.tex4x4paldata[param.ofs >> 1:],
+                              colors, width, height)
+        indexes, alpha = unpack_texels(self.texdata[param.ofs:],
+                                       param.format, width, height)
+        palette = bgr555_to_rgba(colors[:256])
+        rgba = palette[indexes]
+        if alpha is not None:
+            rgba[..., 3] = alpha
+        if param.color0:
+            rgba[indexes == 0, 3] = 0
+        return rgba
 
     def _get_imagemap(self):
         imagemap = []
@@ -206,19 +324,10 @@ class TEX(ArchiveList):
 
     def _get_images(self):
         self._images = []
-        bitmaps = self._get_bitmaps()
-        palettes = self._get_palettes()
         for texidx, palidx in self._get_imagemap():
-            palette = palettes[palidx]
-            bitmap = bitmaps[texidx]
-            data = ''
-            for row in bitmap:
-                for pix in row:
-                    if pix[1] is None:
-                        data += palette[pix[0]]
-                    else:
-                        data += palette[pix[0]][:3] + chr(pix[1])
-            image = Image.frombytes('RGBA', (len(row), len(bitmap)), data)
+            rgba = self.get_rgba(texidx, palidx)
+            image = Image.frombytes('RGBA', rgba.shape[1::-1],
+                                    rgba.tostring())
             comment = json.dumps({'texidx': texidx, 'palidx': palidx,
                                   'texname': self.texdict.names[texidx],
                                   'palname': self.paldict.names[palidx]
@@ -283,8 +392,7 @@ class TEX(ArchiveList):
         self.texdict.names = ['image_%03d\x00\x00\x00\x00\x00\x00\x00' % i
                               for i in xrange(num)]
         for mapidx, (texidx, palidx) in enumerate(imagemap):
-            tex = []
-            format = 3  # 16-color
+            format = FORMAT_I4
             image = images[texidx]
             try:
                 info = json.loads(image.info.get('Comment'))
@@ -303,19 +411,24 @@ class TEX(ArchiveList):
                 palettes[palidx] = pal
             has_alpha = None  # None = not determined. False = max colors.
             imagemap[mapidx] = (texidx, palidx)
-            for pix in image.getdata():
-                alpha = pix[3]
-                if not alpha:  # color0=1
+            rgba = np.asarray(image, dtype=np.uint8).reshape(-1, 4)
+            # Transparent pixels (color0=1) are keyed as -1
+            keys = np.where(rgba[:, 3] == 0, -1,
+                            rgba_to_bgr555(rgba).astype(np.int32))
+            # Each distinct value is looked up once, in order of appearance
+            values, first, inverse = np.unique(keys, return_index=True,
+                                               return_inverse=True)
+            indexes = np.zeros(len(values), dtype=np.uint8)
+            replaced = None
+            for value_id in np.argsort(first, kind='mergesort'):
+                value = int(values[value_id])
+                if value < 0:
                     if has_alpha is False:
                         raise OverflowError('Cannot have more than 16 colors'
                                             ' in palette {0}'.format(palidx))
                     has_alpha = True
-                    tex.append(0)
                     continue
-                color = (pix[0] >> 3) << 0 |\
-                    (pix[1] >> 3) << 5 |\
-                    (pix[2] >> 3) << 10
-                color = struct.pack('H', color)
+                color = struct.pack('H', value)
                 try:
                     index = pal.index(color)
                 except ValueError:
@@ -323,20 +436,26 @@ class TEX(ArchiveList):
                     if index >= 16:
                         if has_alpha is None:
                             has_alpha = False
+                            replaced = (first[value_id], pal[0])
                             pal[0] = color
-                            tex.append(0)
                             continue
-                        print(pal)
                         raise OverflowError('Cannot have more than 16 colors'
                                             ' in palette {0}'.format(palidx))
                     pal.append(color)
-                tex.append(index)
+                indexes[value_id] = index
+            if replaced is not None:
+                # The old first color cannot be found again after it is
+                # replaced
+                pos, color = replaced
+                if np.any(keys[pos:] == struct.unpack('H', color)[0]):
+                    raise OverflowError('Cannot have more than 16 colors'
+                                        ' in palette {0}'.format(palidx))
+            tex = indexes[inverse]
             ofs = len(self.texdata)
             size = images[texidx].size
             self.texparams.append(TexParam(ofs, size[0], size[1], format,
                                            int(has_alpha or 0)))
-            self.texdata += ''.join([chr(tex[n] | (tex[n+1] << 4))
-                                     for n in xrange(0, len(tex), 2)])
+            self.texdata += pack_texels(tex, format)
             ofs = len(self.texdata)
             if ofs % 8:
                 self.texdata += '\x00'*(8 - (ofs % 8))  # Align
@@ -387,9 +506,17 @@ class TEX(ArchiveList):
         # Read data.
         reader.seek(start+self.texinfo._dataofs)
         self.texdata = reader.read(self.texinfo._datasize)
+        info = self.tex4x4info
+        if info._datasize:
+            reader.seek(start+info._dataofs)
+            self.tex4x4data = reader.read(info._datasize)
+            reader.seek(start+info._paldataofs)
+            self.tex4x4paldata = reader.read(info._datasize >> 1)
+        else:
+            self.tex4x4data = ''
+            self.tex4x4paldata = ''
         reader.seek(start+self.palinfo._dataofs)
         self.paldata = reader.read(self.palinfo._datasize)
-        # TODO 4x4
         if size:
             reader.seek(start+size)
         self._images = None
@@ -439,6 +566,22 @@ class TEX(ArchiveList):
         with writer.seek(self.texinfo._datasize_ofs):
             writer.writeUInt16(size >> 3)  # texinfo datasize
 
+        if self.tex4x4data:
+            writer.writeAlign(8)
+            ofs = writer.tell()-start
+            with writer.seek(self.tex4x4info._dataofs_ofs):
+                writer.writeUInt32(ofs)  # tex4x4info dataofs
+            datastart = writer.tell()
+            writer.write(self.tex4x4data)
+            writer.writeAlign(8)
+            size = writer.tell()-datastart
+            with writer.seek(self.tex4x4info._datasize_ofs):
+                writer.writeUInt16(size >> 3)  # tex4x4info datasize
+            ofs = writer.tell()-start
+            with writer.seek(self.tex4x4info._dataofs_ofs+4):
+                writer.writeUInt32(ofs)  # tex4x4info paldataofs
+            writer.write(self.tex4x4paldata)
+
         writer.writeAlign(8)
         ofs = writer.tell()-start
         with writer.seek(self.palinfo._dataofs_ofs):
@@ -1,182 +1,32 @@
 
+import struct
 from collections import namedtuple
 
 from atomic import AtomicStruct
 from generic.archive import ArchiveList
 from generic import Editable
-from util.io import BinaryIO
+from util.io import BinaryIO, get_buffer
 
-
-class NARC(ArchiveList):
-    def __init__(self, reader=None):
-        self.magic = 'NARC'
-        self.endian = 0xFFFE
-        self.version = 0x102
-        self.numblocks = 3
-        self.fatb = FATB(self)
-        self.fntb = FNTB(self)
-        self.fimg = FIMG(self)
-        self.files = self.fimg.files
-        if reader is not None:
-            self.load(reader)
-
-    def load(self, reader):
-        reader = BinaryIO.reader(reader)
-        start = reader.tell()
-        self.magic = reader.read(4)
-        self.endian = reader.readUInt16()
-        self.version = reader.readUInt16()
-        size = reader.readUInt32()
-        headersize = reader.readUInt16()
-        numblocks = reader.readUInt16()
-        if headersize:
-            reader.seek(start+headersize)
-        self.fatb.load(reader)
-        self.fntb.load(reader)
-        self.fimg.load(reader)
-        if size:
-            reader.seek(start+size)
-
-    def save(self, writer=None):
-        if writer is None:
-            writer = BinaryIO()
-        start = writer.tell()
-        writer.write(self.magic)
-        writer.writeUInt16(self.endian)
-        writer.writeUInt16(self.version)
-        sizeofs = writer.tell()
-        writer.writeUInt32(0)
-        headersizeofs = writer.tell()
-        writer.writeUInt16(0)
-        writer.writeUInt16(self.numblocks)
-        size = writer.tell()-start
-        with writer.seek(headersizeofs):
-            writer.writeUInt16(size)
-        writer = self.fatb.save(writer)
-        writer = self.fntb.save(writer)
-        writer = self.fimg.save(writer)
-        writer.writeUInt32(0)
-        size = writer.tell()-start
-        with writer.seek(sizeofs):
-            writer.writeUInt32(size)
-        return writer
-
-
-class FATB(object):
-    def __init__(self, narc):
-        self.narc = narc
-        self.magic = 'BTAF'
-        self.entries_ = []
-
-    @property
-    def num(self):
-        return len(self.narc.files)
-
-    @property
-    def entries(self):
-        """List of slice objects that describe file image locations
-        """
-        entries = []
-        start = 0
-        for data in self.narc.fimg.files:
-            stop = start+len(data)
-            entries.append(slice(start, stop))
-            start = stop+((-stop) % 4)
-        return entries
-
-    def load(self, reader):
-        start = reader.tell()
-        self.magic = reader.read(4)
-        size = reader.readUInt32()
-        num = reader.readUInt16()
-        reader.readUInt16()
-        for i in xrange(num):
-            self.entries_.append(slice(reader.readUInt32(),
-                                       reader.readUInt32()))
-        if size:
-            reader.seek(start+size)
-
-    def save(self, writer=None):
-        if writer is None:
-            writer = BinaryIO()
-        start = writer.tell()
-        writer.write(self.magic)
-        sizeofs = writer.tell()
-        writer.writeUInt32(0)
-        writer.writeUInt16(self.num)
-        writer.writeUInt16(0)
-        for entry in self.entries:
-            writer.writeUInt32(entry.start)
-            writer.writeUInt32(entry.stop)
-        size = writer.tell()-start
-        with writer.seek(sizeofs):
-            writer.writeUInt32(size)
-        return writer
-
-
-class FNTB(object):
-    def __init__(self, narc):
-        self.narc = narc
-        self.magic = 'BTNF'
-
-    def load(self, reader):
-        start = reader.tell()
-        self.magic = reader.read(4)
-        size = reader.readUInt32()
-        if size:
-            reader.seek(start+size)
-
-    def save(self, writer=None):
-        if writer is None:
-            writer = BinaryIO()
-        start = writer.tell()
-        writer.write(self.magic)
-        sizeofs = writer.tell()
-        writer.writeUInt32(0)
-        writer.writeUInt32(4)
-        writer.writeUInt32(0x10000)
-        size = writer.tell()-start
-        with writer.seek(sizeofs):
-            writer.writeUInt32(size)
-        return writer
-
-
-class FIMG(object):
-    def __init__(self, narc):
-        self.narc = narc
-        self.magic = 'GMIF'
-        self.files = []
-
-    def load(self, reader):
-        start = reader.tell()
-        self.magic = reader.read(4)
-        size = reader.readUInt32()
-        data = reader.read(size-8)
-        self.files.extend([data[entry]
-                           for entry in self.narc.fatb.entries_])
-
-    def save(self, writer=None):
-        if writer is None:
-            writer = BinaryIO()
-        start = writer.tell()
-        writer.write(self.magic)
-        sizeofs = writer.tell()
-        writer.writeUInt32(0)
-        data = []
-        for fdata, entry in zip(self.files, self.narc.fatb.entries):
-            total = len(data)
-            if entry.start > total:
-                data += '\x00'*(entry.start-total)
-            data[entry] = fdata
-        writer.write(''.join(data))
-        size = writer.tell()-start
-        with writer.seek(sizeofs):
-            writer.writeUInt32(size)
-        return writer
+try:
+    buffer
+except NameError:
+    def view_buffer(source, offset, size):
+        return memoryview(source)[offset:offset+size]
+else:
+    view_buffer = buffer
 
 
 class NARC(ArchiveList, Editable):
-    def __init__(self, reader=None):
+    """Nitro Archive
+
+    Parameters
+    ----------
+    reader : file, BinaryIO, or string, optional
+        Source to load from
+    lazy : bool, optional
+        If True, file contents are not read up front. See FIMG.load
+    """
+    def __init__(self, reader=None, lazy=False):
         Editable.__init__(self)
         self.string('magic', length=4, default='NARC')
         self.uint16('endian', default=0xFFFE)
@@ -189,30 +39,36 @@ class NARC(ArchiveList, Editable):
         self.fimg = FIMG(self)
         self.freeze()
         if reader is not None:
-            self.load(reader)
+            self.load(reader, lazy)
 
     @property
     def files(self):
         return self.fimg.files
 
-    def load(self, reader):
+    def load(self, reader, lazy=False):
         reader = BinaryIO.reader(reader)
         AtomicStruct.load(self, reader)
         self.fatb.load(reader)
         self.fntb.load(reader)
-        self.fimg.load(reader)
+        self.fimg.load(reader, lazy)
 
     def save(self, writer=None):
+        """Writes the archive in a single forward pass
+
+        All block sizes are computed from the file lengths up front, so
+        the writer is never seeked. Files that are LazyFiles buffers are
+        written straight from their source.
+        """
         writer = BinaryIO.writer(writer)
-        start = writer.tell()
+        entries = self.fatb.entries
+        self._data.size_ = self.get_size() +\
+            self.fatb.get_block_size(entries) +\
+            self.fntb.get_block_size() +\
+            self.fimg.get_block_size(entries)
         writer = Editable.save(self, writer)
-        writer = self.fatb.save(writer)
+        writer = self.fatb.save(writer, entries)
         writer = self.fntb.save(writer)
-        writer = self.fimg.save(writer)
-        writer.writeAlign(4)
-        size = writer.tell()-start
-        with writer.seek(start+self.get_offset('size_')):
-            writer.writeUInt32(size)
+        writer = self.fimg.save(writer, entries)
         return writer
 
     def resize(self, num):
@@ -259,28 +115,115 @@ class FATB(Editable):
     def load(self, reader):
         reader = BinaryIO.reader(reader)
         AtomicStruct.load(self, reader)
-        for i in xrange(self._data.num):
-            self.entries_.append(slice(reader.readUInt32(),
-                                       reader.readUInt32()))
+        bounds = reader.readArray('<u4', 2*self._data.num).tolist()
+        self.entries_.extend(slice(start, stop) for start, stop
+                             in zip(bounds[::2], bounds[1::2]))
 
-    def save(self, writer):
-        start = writer.tell()
-        self._data.num = self.num
+    def get_block_size(self, entries=None):
+        """Size of this block
+
+        Parameters
+        ----------
+        entries : list of slice, optional
+            Precomputed entries. If not provided, they will be built.
+        """
+        if entries is None:
+            entries = self.entries
+        return self.get_size()+8*len(entries)
+
+    def save(self, writer, entries=None):
+        if entries is None:
+            entries = self.entries
+        self._data.num = len(entries)
+        self._data.size_ = self.get_block_size(entries)
         writer = Editable.save(self, writer)
-        for entry in self.entries:
+        for entry in entries:
             writer.writeUInt32(entry.start)
             writer.writeUInt32(entry.stop)
-        writer.writeAlign(4)
-        size = writer.tell()-start
-        with writer.seek(start+self.get_offset('size_')):
-            writer.writeUInt32(size)
+        return writer
+
+
+class FNTB(object):
+    def __init__(self, narc):
+        self.narc = narc
+        self.magic = 'BTNF'
+
+    def load(self, reader):
+        start = reader.tell()
+        self.magic = reader.read(4)
+        size = reader.readUInt32()
+        if size:
+            reader.seek(start+size)
+
+    def get_block_size(self):
+        return 16
+
+    def save(self, writer=None):
+        writer = BinaryIO.writer(writer)
+        writer.write(self.magic)
+        writer.writeUInt32(self.get_block_size())
+        writer.writeUInt32(4)
+        writer.writeUInt32(0x10000)
         return writer
 
 
 class LazyFiles(list):
+    """File list that references its contents from a source buffer
+
+    Unmodified files are stored as slices into the source and handed out
+    as zero-copy buffers on access. Assigning or adding a file stores
+    the new string in place of its slice.
+
+    Parameters
+    ----------
+    handle : file or BinaryIO
+        Reader positioned at the start of the file image data. File handles
+        are memory-mapped read-only.
+    entries : list of slice
+        File locations relative to the start of the image data
+    """
     def __init__(self, handle, entries):
         self.offset = handle.tell()
-        self.entries = entries
+        self.source = get_buffer(handle)
+        list.__init__(self, [slice(entry.start+self.offset,
+                                   entry.stop+self.offset)
+                             for entry in entries])
+
+    def _view(self, value):
+        if isinstance(value, slice):
+            return view_buffer(self.source, value.start,
+                               value.stop-value.start)
+        return value
+
+    def is_modified(self, idx):
+        """Whether a file no longer refers to the source buffer"""
+        return not isinstance(list.__getitem__(self, idx), slice)
+
+    def materialize(self, idx):
+        """Copy a file out of the source so that it no longer refers to it
+
+        Returns
+        -------
+        data : string
+        """
+        value = list.__getitem__(self, idx)
+        if isinstance(value, slice):
+            value = self.source[value]
+            list.__setitem__(self, idx, value)
+        return value
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._view(value)
+                    for value in list.__getitem__(self, idx)]
+        return self._view(list.__getitem__(self, idx))
+
+    def __getslice__(self, start, stop):
+        return self[max(start, 0):max(stop, 0):]
+
+    def __iter__(self):
+        for value in list.__iter__(self):
+            yield self._view(value)
 
 
 class FIMG(Editable):
@@ -292,22 +235,96 @@ class FIMG(Editable):
         self.uint32('size_')
         self.freeze()
 
-    def load(self, reader):
+    def load(self, reader, lazy=False):
+        """Load the file image
+
+        Parameters
+        ----------
+        reader : BinaryIO
+        lazy : bool, optional
+            If True, the image data is not read. Files become LazyFiles
+            entries that refer to the reader's buffer (memory-mapped for
+            real files) and are only copied once modified.
+        """
         reader = BinaryIO.reader(reader)
+        start = reader.tell()
         AtomicStruct.load(self, reader)
+        if lazy:
+            # Skip Editable's list wrapping, which would copy every file
+            object.__setattr__(self, 'files',
+                               LazyFiles(reader, self.narc.fatb.entries_))
+            reader.seek(start+self.size_)
+            return
         data = reader.read(self.size_-8)
         self.files.extend([data[entry]
                            for entry in self.narc.fatb.entries_])
 
-    def save(self, writer):
-        start = writer.tell()
+    def get_block_size(self, entries=None):
+        """Size of this block including padding
+
+        Parameters
+        ----------
+        entries : list of slice, optional
+            Precomputed entries. If not provided, they will be built.
+        """
+        if entries is None:
+            entries = self.narc.fatb.entries
+        size = self.get_size()
+        if entries:
+            size += entries[-1].stop+((-entries[-1].stop) % 4)
+        return size
+
+    def save(self, writer, entries=None):
+        if entries is None:
+            entries = self.narc.fatb.entries
+        self._data.size_ = self.get_block_size(entries)
         writer = Editable.save(self, writer)
-        rel = writer.tell()
-        for file_id, entry in enumerate(self.narc.fatb.entries):
-            writer.writePadding(entry.start+rel)
-            writer.write(self.files[file_id])
-        writer.writeAlign(4)
-        size = writer.tell()-start
-        with writer.seek(start+self.get_offset('size_')):
-            writer.writeUInt32(size)
+        pos = 0
+        for data, entry in zip(self.files, entries):
+            if entry.start > pos:
+                writer.write('\x00'*(entry.start-pos))
+            writer.write(data)
+            pos = entry.stop
+        writer.write('\x00'*((-pos) % 4))
         return writer
+
+
+def file_ranges(data, offset=0):
+    """Locate the files of a NARC without loading it
+
+    Parameters
+    ----------
+    data : string, buffer or mmap
+    offset : int, optional
+        Start of the NARC in data
+
+    Returns
+    -------
+    ranges : list or None
+        (start, stop) of each file in data. None if there is no valid
+        NARC at offset.
+    """
+    try:
+        if data[offset:offset+4] != 'NARC':
+            return None
+        header_size, num_blocks = struct.unpack_from('<HH', data, offset+12)
+        pos = offset+max(header_size, 0x10)
+        entries = image = None
+        for block in xrange(num_blocks):
+            magic = data[pos:pos+4]
+            size, = struct.unpack_from('<I', data, pos+4)
+            if magic == 'BTAF':
+                num, = struct.unpack_from('<H', data, pos+8)
+                entries = struct.unpack_from('<{0}I'.format(2*num), data,
+                                             pos+12)
+            elif magic == 'GMIF':
+                image = pos+8
+            if size < 8:
+                return None
+            pos += size
+    except struct.error:
+        return None
+    if entries is None or image is None:
+        return None
+    return [(image+start, image+stop) for start, stop
+            in zip(entries[::2], entries[1::2])]
@@ -0,0 +1,181 @@
+"""Structural diffs of NARC archives
+
+Archives are compared file by file instead of as whole blobs. Every file
+is hashed once, so two archives are compared in a single linear pass,
+and only the files that differ are decoded. All output is produced by
+generators so it can be written out as it is found.
+
+A formatter can be supplied to describe the contents of each file. It is
+any callable that takes the data of one file and returns (key, value)
+pairs, eg one per field of a record or one per line of text. Changed
+files are then diffed by key instead of only being reported as changed.
+"""
+
+import hashlib
+
+from ntr.narc import NARC
+
+
+def load(fname):
+    """Open a NARC without reading its files
+
+    Parameters
+    ----------
+    fname : string
+
+    Returns
+    -------
+    narc : NARC or None
+        Lazily loaded archive. None if the file is not a NARC
+    """
+    with open(fname, 'rb') as handle:
+        if handle.read(4) != 'NARC':
+            return None
+        handle.seek(0)
+        return NARC(handle, lazy=True)
+
+
+def digest(data):
+    """SHA-1 hex digest of a file"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def compare(old_files, new_files):
+    """Match up the files of two archives by index
+
+    Parameters
+    ----------
+    old_files : list
+    new_files : list
+
+    Yields
+    ------
+    idx : int
+        File index
+    status : string
+        'changed', 'added' or 'removed'. Identical files are skipped
+    old_digest : string or None
+    new_digest : string or None
+    """
+    for idx in xrange(max(len(old_files), len(new_files))):
+        if idx >= len(new_files):
+            yield idx, 'removed', digest(old_files[idx]), None
+        elif idx >= len(old_files):
+            yield idx, 'added', None, digest(new_files[idx])
+        else:
+            old_digest = digest(old_files[idx])
+            new_digest = digest(new_files[idx])
+            if old_digest != new_digest:
+                yield idx, 'changed', old_digest, new_digest
+
+
+def fields(data, formatter=None):
+    """Get the (key, value) pairs describing a file
+
+    Data that the formatter cannot handle has no fields.
+
+    Returns
+    -------
+    fields : list
+    """
+    if formatter is None:
+        return []
+    try:
+        return [(key, unicode(value)) for key, value in formatter(data)]
+    except Exception:
+        return []
+
+
+def first_difference(old, new):
+    """Offset of the first byte that differs between two files"""
+    size = min(len(old), len(new))
+    start = 0
+    step = 0x100
+    # Compare growing chunks, so that early differences are found quickly
+    while start < size:
+        stop = min(start+step, size)
+        if old[start:stop] != new[start:stop]:
+            for offset in xrange(start, stop):
+                if old[offset] != new[offset]:
+                    return offset
+        start = stop
+        step = min(step*2, 0x100000)
+    return size
+
+
+def render(files, formatter=None):
+    """Describe every file of an archive, for use as a git textconv
+
+    Each line of a file's fields starts with the file index so that it
+    still identifies the file when shown without context.
+
+    Parameters
+    ----------
+    files : list
+    formatter : callable, optional
+
+    Yields
+    ------
+    line : unicode
+    """
+    for idx, data in enumerate(files):
+        yield u'File {0}: {1} bytes, sha1 {2}'.format(idx, len(data),
+                                                      digest(data))
+        for key, value in fields(data, formatter):
+            yield u'{0} {1}: {2}'.format(idx, key, value)
+
+
+def diff(old_files, new_files, formatter=None):
+    """Describe the differences between two archives
+
+    Parameters
+    ----------
+    old_files : list
+    new_files : list
+    formatter : callable, optional
+
+    Yields
+    ------
+    line : unicode
+        Lines starting with '-' or '+' are fields that were removed or
+        added. A changed field is removed and added again.
+    """
+    if len(old_files) != len(new_files):
+        yield u'Files: {0} -> {1}'.format(len(old_files), len(new_files))
+    for idx, status, old_digest, new_digest in compare(old_files, new_files):
+        if status == 'removed':
+            old = old_files[idx]
+            yield u'File {0} removed: {1} bytes, sha1 {2}'.format(
+                idx, len(old), old_digest)
+            for key, value in fields(old, formatter):
+                yield u'-{0} {1}: {2}'.format(idx, key, value)
+            continue
+        elif status == 'added':
+            new = new_files[idx]
+            yield u'File {0} added: {1} bytes, sha1 {2}'.format(
+                idx, len(new), new_digest)
+            for key, value in fields(new, formatter):
+                yield u'+{0} {1}: {2}'.format(idx, key, value)
+            continue
+        old = old_files[idx]
+        new = new_files[idx]
+        yield u'File {0} changed: {1} -> {2} bytes, sha1 {3} -> {4}'.format(
+            idx, len(old), len(new), old_digest, new_digest)
+        old_fields = fields(old, formatter)
+        new_fields = fields(new, formatter)
+        if not old_fields and not new_fields:
+            yield u'Bytes differ from offset {0:#x}'.format(
+                first_difference(old, new))
+            continue
+        new_values = dict(new_fields)
+        old_keys = set()
+        for key, value in old_fields:
+            old_keys.add(key)
+            if key not in new_values:
+                yield u'-{0} {1}: {2}'.format(idx, key, value)
+            elif new_values[key] != value:
+                yield u'-{0} {1}: {2}'.format(idx, key, value)
+                yield u'+{0} {1}: {2}'.format(idx, key, new_values[key])
+        for key, value in new_fields:
+            if key not in old_keys:
+                yield u'+{0} {1}: {2}'.format(idx, key, value)
@@ -1,29 +1,25 @@
 
 import os
-import subprocess
 
 from compat import input
-
-if os.name == 'nt':
-    binary = os.path.join(os.path.dirname(__file__), '../bin', 'ndstool.exe')
-else:
-    binary = os.path.join(os.path.dirname(__file__), '../bin', 'ndstool')
+from ntr import rom
 
 
 def dump(fname, directory):
-    subprocess.call([binary, '-x', fname,
-                     '-7', os.path.join(directory, 'arm7.bin'),
-                     '-y7', os.path.join(directory, 'overarm7.bin'),
-                     '-9', os.path.join(directory, 'arm9.bin'),
-                     '-y9', os.path.join(directory, 'overarm9.bin'),
-                     '-y', os.path.join(directory, 'overlays'),
-                     '-t', os.path.join(directory, 'banner.bin'),
-                     '-h', os.path.join(directory, 'header.bin'),
-                     '-d', os.path.join(directory, 'fs')
-                     ])
+    rom.dump(fname, directory)
 
 
-def build(fname, directory):
+def build_paths(directory):
+    """Get the workspace files that build() packs
+
+    The decompressed arm9.dec.bin, overarm9.dec.bin and overlays_dez are
+    used when present.
+
+    Returns
+    -------
+    paths : list
+        (name, path) pairs. Names are the arguments of ntr.rom.build
+    """
     arm9 = os.path.join(directory, 'arm9.dec.bin')
     try:
         if not os.path.getsize(arm9):
@@ -37,17 +33,20 @@ def build(fname, directory):
             raise OSError()
     except OSError:
         arm9 = os.path.join(directory, 'arm9.bin')
+        overarm9 = os.path.join(directory, 'overarm9.bin')
         overlays = os.path.join(directory, 'overlays')
-    subprocess.call([binary, '-c', fname,
-                     '-7', os.path.join(directory, 'arm7.bin'),
-                     '-y7', os.path.join(directory, 'overarm7.bin'),
-                     '-9', arm9,
-                     '-y9', overarm9,
-                     '-y', overlays,
-                     '-t', os.path.join(directory, 'banner.bin'),
-                     '-h', os.path.join(directory, 'header.bin'),
-                     '-d', os.path.join(directory, 'fs')
-                     ])
+    return [('arm7', os.path.join(directory, 'arm7.bin')),
+            ('overarm7', os.path.join(directory, 'overarm7.bin')),
+            ('arm9', arm9),
+            ('overarm9', overarm9),
+            ('overlays', overlays),
+            ('banner', os.path.join(directory, 'banner.bin')),
+            ('header', os.path.join(directory, 'header.bin')),
+            ('fs', os.path.join(directory, 'fs'))]
+
+
+def build(fname, directory):
+    rom.build(fname, **dict(build_paths(directory)))
 
 
 def main(argv):
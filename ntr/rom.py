@@ -0,0 +1,605 @@
+
+import bisect
+import mmap
+import os
+import shutil
+import struct
+
+from generic.editable import XEditable as Editable
+from ntr.header_bin import HeaderBin
+from ntr.overlay import OverlayTable
+from util.io import AtomicFile, BinaryIO
+
+HEADER_SIZE = 0x200
+ARM9_OFFSET = 0x4000
+ALIGNMENT = 0x200
+NITROCODE = 0xDEC00621
+BANNER_SIZES = {1: 0x840, 2: 0x940, 3: 0xA40, 0x103: 0x23C0}
+
+
+def _crc16_table():
+    table = []
+    for value in xrange(0x100):
+        for bit in xrange(8):
+            if value & 1:
+                value = (value >> 1) ^ 0xA001
+            else:
+                value >>= 1
+        table.append(value)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, crc=0xFFFF):
+    """CRC-16 as used by the ROM header, banner and secure area"""
+    table = CRC16_TABLE
+    for char in bytearray(data):
+        crc = (crc >> 8) ^ table[(crc ^ char) & 0xFF]
+    return crc
+
+
+class RomHeader(Editable):
+    """Layout fields of the ROM header starting at 0x20
+
+    Use load_header() and save_header() to read or update them in a
+    complete header.
+    """
+    def define(self):
+        self.uint32('arm9_offset')
+        self.uint32('arm9_entry')
+        self.uint32('arm9_address')
+        self.uint32('arm9_size')
+        self.uint32('arm7_offset')
+        self.uint32('arm7_entry')
+        self.uint32('arm7_address')
+        self.uint32('arm7_size')
+        self.uint32('fnt_offset')
+        self.uint32('fnt_size')
+        self.uint32('fat_offset')
+        self.uint32('fat_size')
+        self.uint32('ovt9_offset')
+        self.uint32('ovt9_size')
+        self.uint32('ovt7_offset')
+        self.uint32('ovt7_size')
+        self.uint32('port_normal')
+        self.uint32('port_key1')
+        self.uint32('banner_offset')
+        self.uint16('secure_crc')
+        self.uint16('secure_delay')
+        self.uint32('arm9_autoload')
+        self.uint32('arm7_autoload')
+        self.uint64('secure_disable')
+        self.uint32('rom_size')
+        self.uint32('header_size')
+
+    def load_header(self, data):
+        reader = BinaryIO(data[:HEADER_SIZE])
+        reader.seek(0x20)
+        self.load(reader)
+        return self
+
+    def save_header(self, data):
+        """Write these fields into a header along with its capacity and CRC
+
+        Parameters
+        ----------
+        data : bytearray
+            Header of at least 0x160 bytes. Modified in place.
+        """
+        fields = self.save().getvalue()
+        data[0x20:0x20+len(fields)] = fields
+        capacity = 0
+        while 0x20000 << capacity < self.rom_size:
+            capacity += 1
+        data[0x14] = capacity
+        data[0x15E:0x160] = struct.pack('<H', crc16(data[:0x15E]))
+        return data
+
+
+def read_fnt(data, offset):
+    """Read a file name table
+
+    Parameters
+    ----------
+    data : string or mmap
+        Buffer containing the table
+    offset : int
+        Start of the table in data
+
+    Returns
+    -------
+    paths : list
+        (path, file id) for every file in file id order. Directories are
+        separated by '/'
+    """
+    paths = []
+
+    def walk(dir_id, prefix):
+        sub_offset, file_id, parent_id = struct.unpack_from(
+            '<IHH', data, offset+8*(dir_id & 0xFFF))
+        pos = offset+sub_offset
+        while True:
+            length = ord(data[pos])
+            pos += 1
+            if not length:
+                break
+            name = data[pos:pos+(length & 0x7F)]
+            pos += length & 0x7F
+            if length & 0x80:
+                child_id, = struct.unpack_from('<H', data, pos)
+                pos += 2
+                walk(child_id, prefix+name+'/')
+            else:
+                paths.append((prefix+name, file_id))
+                file_id += 1
+    walk(0xF000, '')
+    return sorted(paths, key=lambda entry: entry[1])
+
+
+def scan_tree(directory):
+    """Get the sorted directory tree to build a file name table from
+
+    Returns
+    -------
+    tree : list
+        (name, subtree) entries. subtree is None for files
+    """
+    tree = []
+    for name in sorted(os.listdir(directory),
+                       key=lambda name: (name.lower(), name)):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            tree.append((name, scan_tree(path)))
+        else:
+            tree.append((name, None))
+    return tree
+
+
+def build_fnt(tree, first_file_id):
+    """Build a file name table
+
+    Directories are numbered in the order they appear in their parent.
+    Files are numbered depth-first, which gives the same file ids as
+    ndstool.
+
+    Parameters
+    ----------
+    tree : list
+        Tree from scan_tree()
+    first_file_id : int
+        Id of the first file. File ids before this belong to overlays.
+
+    Returns
+    -------
+    fnt : string
+    paths : list
+        Path of every file in file id order
+    """
+    def count(node):
+        return 1+sum(count(child) for name, child in node if child is not None)
+    num_dirs = count(tree)
+    main = [None]*num_dirs
+    subtables = []
+    subtable_offset = [8*num_dirs]
+    paths = []
+    next_dir_id = [0xF001]
+
+    def add(node, prefix, dir_id, parent_id):
+        entries = []
+        children = []
+        main[dir_id & 0xFFF] = struct.pack('<IHH', subtable_offset[0],
+                                           first_file_id+len(paths),
+                                           parent_id)
+        for name, child in node:
+            if len(name) > 0x7F:
+                raise ValueError('File name too long: {0}'.format(name))
+            if child is None:
+                entries.append(chr(len(name))+name)
+                paths.append(prefix+name)
+            else:
+                child_id = next_dir_id[0]
+                next_dir_id[0] += 1
+                entries.append(chr(0x80 | len(name))+name +
+                               struct.pack('<H', child_id))
+                children.append((name, child, child_id))
+        entries.append('\x00')
+        subtable = ''.join(entries)
+        subtables.append(subtable)
+        subtable_offset[0] += len(subtable)
+        for name, child, child_id in children:
+            add(child, prefix+name+'/', child_id, dir_id)
+    add(tree, '', 0xF000, num_dirs)
+    return ''.join(main+subtables), paths
+
+
+def _arm9_size(size, tail):
+    """Size of arm9 without the nitrocode footer ndstool extracts with it"""
+    if size >= 12 and struct.unpack('<I', tail[:4])[0] == NITROCODE:
+        return size-12
+    return size
+
+
+class ROM(object):
+    """Memory-mapped Nintendo DS ROM image
+
+    Files are read straight out of the mapping, so single files can be
+    extracted without dumping the whole ROM.
+
+    Parameters
+    ----------
+    path : string
+        ROM file name
+    writable : bool, optional
+        If True, the ROM is mapped for writing so that files can be
+        replaced. See replace()
+
+    Attributes
+    ----------
+    info : HeaderBin
+        Game name and codes
+    header : RomHeader
+        Locations of each part of the ROM
+    fat : list
+        (start, stop) of every file id
+    paths : dict
+        File system path to file id
+    overlays9 : OverlayTable
+    overlays7 : OverlayTable
+
+    Examples
+    --------
+    >>> with ROM('game.nds') as rom:
+    ...     narc = NARC(rom.read('poketool/personal/personal.narc'))
+    """
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self._starts = None
+        self.handle = open(path, 'r+b' if writable else 'rb')
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=(
+            mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ))
+        self.info = HeaderBin(self.data[:HEADER_SIZE])
+        self.header = RomHeader().load_header(self.data)
+        header = self.header
+        self.fat = [struct.unpack_from('<II', self.data, header.fat_offset+ofs)
+                    for ofs in xrange(0, header.fat_size, 8)]
+        self.paths = dict(read_fnt(self.data, header.fnt_offset))
+        self.overlays9 = OverlayTable(header.ovt9_size >> 5, reader=BinaryIO(
+            self.slice(header.ovt9_offset, header.ovt9_size)))
+        self.overlays7 = OverlayTable(header.ovt7_size >> 5, reader=BinaryIO(
+            self.slice(header.ovt7_offset, header.ovt7_size)))
+
+    def close(self):
+        if self.writable:
+            self.data.flush()
+        self.data.close()
+        self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def slice(self, offset, size):
+        return self.data[offset:offset+size]
+
+    def file_id(self, target):
+        """Get the file id of a path. Ids are passed through"""
+        if isinstance(target, basestring):
+            try:
+                return self.paths[target.replace(os.sep, '/')]
+            except KeyError:
+                raise KeyError('No such file in ROM: {0}'.format(target))
+        return target
+
+    def read(self, target):
+        """Read a file
+
+        Parameters
+        ----------
+        target : string or int
+            Path in the file system or file id
+
+        Returns
+        -------
+        data : string
+        """
+        start, stop = self.fat[self.file_id(target)]
+        return self.data[start:stop]
+
+    def extract(self, target, fname):
+        """Write a single file out of the ROM"""
+        with open(fname, 'wb') as handle:
+            handle.write(self.read(target))
+
+    @property
+    def arm9(self):
+        """arm9 along with its nitrocode footer, as ndstool extracts it"""
+        header = self.header
+        end = header.arm9_offset+header.arm9_size
+        if self.data[end:end+4] == struct.pack('<I', NITROCODE):
+            end += 12
+        return self.data[header.arm9_offset:end]
+
+    @property
+    def arm7(self):
+        return self.slice(self.header.arm7_offset, self.header.arm7_size)
+
+    @property
+    def banner(self):
+        offset = self.header.banner_offset
+        if not offset:
+            return ''
+        version, = struct.unpack_from('<H', self.data, offset)
+        return self.slice(offset, BANNER_SIZES.get(version, 0x840))
+
+    def dump(self, directory):
+        """Unpack the ROM into a workspace directory
+
+        The same files as `ndstool -x` are written: header.bin, arm9.bin,
+        arm7.bin, overarm9.bin, overarm7.bin, banner.bin, overlays/ and
+        fs/.
+        """
+        header = self.header
+        overlays = os.path.join(directory, 'overlays')
+        fs = os.path.join(directory, 'fs')
+        for path in (directory, overlays, fs):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        for name, data in (
+                ('header.bin', self.data[:HEADER_SIZE]),
+                ('arm9.bin', self.arm9),
+                ('arm7.bin', self.arm7),
+                ('overarm9.bin', self.slice(header.ovt9_offset,
+                                            header.ovt9_size)),
+                ('overarm7.bin', self.slice(header.ovt7_offset,
+                                            header.ovt7_size)),
+                ('banner.bin', self.banner)):
+            with open(os.path.join(directory, name), 'wb') as handle:
+                handle.write(data)
+        for overlay in list(self.overlays9.overlays) + \
+                list(self.overlays7.overlays):
+            self.extract(overlay.file_id, os.path.join(
+                overlays, 'overlay_{0:04}.bin'.format(overlay.file_id)))
+        for path, file_id in self.paths.iteritems():
+            fname = os.path.join(fs, *path.split('/'))
+            parent = os.path.dirname(fname)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            self.extract(file_id, fname)
+
+    def block_starts(self):
+        """Sorted start of every file and header block"""
+        if self._starts is None:
+            header = self.header
+            self._starts = sorted(set(
+                [entry[0] for entry in self.fat] +
+                [header.arm9_offset, header.arm7_offset, header.fnt_offset,
+                 header.fat_offset, header.ovt9_offset, header.ovt7_offset,
+                 header.banner_offset]))
+        return self._starts
+
+    def slot_end(self, file_id):
+        """End of the space a file can grow into without moving anything
+
+        Nothing grows past the end of the application area (rom_size)
+        into any padding or signature that follows it. Empty files have
+        no slot, since they share their start with the file after them.
+        """
+        start, stop = self.fat[file_id]
+        if stop <= start:
+            return start
+        starts = self.block_starts()
+        limit = len(self.data)
+        if start < self.header.rom_size:
+            limit = min(limit, self.header.rom_size)
+        idx = bisect.bisect_right(starts, start)
+        if idx < len(starts):
+            limit = min(limit, starts[idx])
+        return limit
+
+    def _set_fat(self, file_id, start, end):
+        self.fat[file_id] = (start, end)
+        struct.pack_into('<II', self.data, self.header.fat_offset+file_id*8,
+                         start, end)
+
+    def patch(self, target, data):
+        """Replace a file in place if it fits in its slot
+
+        Space freed by a smaller file is padded with 0xFF.
+
+        Parameters
+        ----------
+        target : string or int
+            Path in the file system or file id
+        data : string
+
+        Returns
+        -------
+        patched : bool
+            False if the file did not fit and nothing was changed
+        """
+        file_id = self.file_id(target)
+        start, stop = self.fat[file_id]
+        if start+len(data) > self.slot_end(file_id):
+            return False
+        end = start+len(data)
+        self.data[start:end] = data
+        if end < stop:
+            self.data[end:stop] = '\xFF'*(stop-end)
+        self._set_fat(file_id, start, end)
+        return True
+
+    def relocate(self, target, data):
+        """Move a file to the end of the application area
+
+        Its old slot is left as it is. The ROM file is extended if
+        needed, and the header's rom_size, capacity and CRC are updated.
+
+        Parameters
+        ----------
+        target : string or int
+            Path in the file system or file id
+        data : string
+        """
+        file_id = self.file_id(target)
+        header = self.header
+        start = header.rom_size+(-header.rom_size) % ALIGNMENT
+        end = start+len(data)
+        if end > len(self.data):
+            self.data.flush()
+            self.data.close()
+            self.handle.seek(0, os.SEEK_END)
+            self.handle.write('\xFF'*(end-self.handle.tell()))
+            self.handle.flush()
+            self.data = mmap.mmap(self.handle.fileno(), 0,
+                                  access=mmap.ACCESS_WRITE)
+        self.data[header.rom_size:start] = '\xFF'*(start-header.rom_size)
+        self.data[start:end] = data
+        self._set_fat(file_id, start, end)
+        self.block_starts().append(start)
+        header.rom_size = end
+        self.data[:HEADER_SIZE] = bytes(header.save_header(
+            bytearray(self.data[:HEADER_SIZE])))
+
+    def replace(self, target, data):
+        """Write a new file, in place if it fits or else at the end
+
+        Returns
+        -------
+        patched : bool
+            True if the file was written in place
+        """
+        if self.patch(target, data):
+            return True
+        self.relocate(target, data)
+        return False
+
+    def flush(self):
+        self.data.flush()
+
+
+class _Layout(object):
+    """Allocates aligned blocks of a ROM being built"""
+    def __init__(self, start):
+        self.pos = start
+        self.blocks = []
+
+    def add(self, size, source):
+        """Place a block
+
+        Parameters
+        ----------
+        size : int
+        source : string or tuple
+            Data or a ('file', path) to be streamed in
+
+        Returns
+        -------
+        offset : int
+        """
+        self.pos += (-self.pos) % ALIGNMENT
+        offset = self.pos
+        self.blocks.append((offset, size, source))
+        self.pos += size
+        return offset
+
+    def add_file(self, path):
+        size = os.path.getsize(path)
+        return self.add(size, ('file', path)), size
+
+
+def _read(path, default=''):
+    try:
+        with open(path, 'rb') as handle:
+            return handle.read()
+    except IOError:
+        return default
+
+
+def build(fname, header, arm9, overarm9, overlays, arm7, overarm7, banner,
+          fs):
+    """Build a ROM from workspace files
+
+    Every file is laid out first from its size, so file contents are then
+    streamed into the ROM in one pass without being held in memory.
+    Blocks are aligned to 0x200 bytes and the gaps padded with 0xFF.
+
+    Parameters
+    ----------
+    fname : string
+        ROM file to write
+    header, arm9, overarm9, arm7, overarm7, banner : string
+        Paths of the binaries
+    overlays : string
+        Directory of overlay_XXXX.bin files
+    fs : string
+        File system directory
+    """
+    head = bytearray(_read(header)[:HEADER_SIZE].ljust(HEADER_SIZE, '\x00'))
+    layout = _Layout(ARM9_OFFSET)
+    rom_header = RomHeader().load_header(bytes(head))
+    fat = {}
+
+    def add_overlays(table_data):
+        table = OverlayTable(len(table_data) >> 5,
+                             reader=BinaryIO(table_data))
+        offset = layout.add(len(table_data), table_data) if table_data else 0
+        for overlay in table.overlays:
+            path = os.path.join(overlays,
+                                'overlay_{0:04}.bin'.format(overlay.file_id))
+            start, size = layout.add_file(path)
+            fat[overlay.file_id] = (start, start+size)
+        return offset, len(table_data)
+
+    rom_header.arm9_offset, size = layout.add_file(arm9)
+    with open(arm9, 'rb') as handle:
+        handle.seek(max(size-12, 0))
+        rom_header.arm9_size = _arm9_size(size, handle.read(4))
+    rom_header.ovt9_offset, rom_header.ovt9_size = add_overlays(
+        _read(overarm9))
+    rom_header.arm7_offset, rom_header.arm7_size = layout.add_file(arm7)
+    rom_header.ovt7_offset, rom_header.ovt7_size = add_overlays(
+        _read(overarm7))
+
+    first_file_id = max(fat)+1 if fat else 0
+    fnt, paths = build_fnt(scan_tree(fs), first_file_id)
+    rom_header.fnt_offset = layout.add(len(fnt), fnt)
+    rom_header.fnt_size = len(fnt)
+    rom_header.fat_size = 8*(first_file_id+len(paths))
+    fat_block = layout.add(rom_header.fat_size, None)
+    rom_header.fat_offset = fat_block
+    banner_data = _read(banner)
+    rom_header.banner_offset = layout.add(len(banner_data), banner_data) \
+        if banner_data else 0
+    for file_id, path in enumerate(paths, first_file_id):
+        start, size = layout.add_file(os.path.join(fs, *path.split('/')))
+        fat[file_id] = (start, start+size)
+    fat_data = ''.join(struct.pack('<II', *fat.get(file_id, (0, 0)))
+                       for file_id in xrange(first_file_id+len(paths)))
+    rom_header.rom_size = layout.pos
+    rom_header.header_size = ARM9_OFFSET
+    rom_header.save_header(head)
+
+    with AtomicFile(fname) as handle:
+        handle.write(bytes(head).ljust(ARM9_OFFSET, '\x00'))
+        pos = ARM9_OFFSET
+        for offset, size, source in layout.blocks:
+            handle.write('\xFF'*(offset-pos))
+            if source is None:
+                handle.write(fat_data)
+            elif isinstance(source, tuple):
+                with open(source[1], 'rb') as src:
+                    shutil.copyfileobj(src, handle, 0x100000)
+            else:
+                handle.write(source)
+            pos = offset+size
+
+
+def dump(fname, directory):
+    """Unpack a ROM into a workspace directory. See ROM.dump"""
+    with ROM(fname) as rom:
+        rom.dump(directory)
@@ -37,9 +37,8 @@ class SYMB(Editable):
             reader.seek(start+record_ofs)
             num = reader.readUInt32()
             if record_name == 'SEQARC':
-                offsets = []
-                for i in range(num):
-                    offsets.append((reader.readUInt32(), reader.readUInt32()))
+                offsets = reader.readArray('<u4', 2*num).tolist()
+                offsets = zip(offsets[::2], offsets[1::2])
                 entries = []
                 for i, (offset, sub_offset) in enumerate(offsets):
                     reader.seek(start+offset)
@@ -53,9 +52,7 @@ class SYMB(Editable):
 
     @staticmethod
     def load_entries(reader, base_offset, prefix, num):
-        offsets = []
-        for i in range(num):
-            offsets.append(reader.readUInt32())
+        offsets = reader.readArray('<u4', num).tolist()
         entries = []
         for i, offset in enumerate(offsets):
             if not offset:
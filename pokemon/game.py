@@ -12,7 +12,10 @@ from ntr.narc import NARC
 from ntr.overlay import OverlayTable
 from ctr.garc import GARC
 from util import cached_property, subclasses
+from util.cache import ArchiveCache, LookupCache
 from util import BinaryIO
+from util.io import AtomicFile
+from util.manifest import Manifest
 from generic import Editable
 
 GAME_CODES = {
@@ -149,6 +152,7 @@ class Game(Editable, Version):
     """
     versions = {'': 0}
     commands_files = ()
+    archive_class = NARC
 
     def __init__(self):
         Editable.__init__(self)
@@ -162,6 +166,11 @@ class Game(Editable, Version):
         self.color = '#E5E4E2'
         self.header = None
         self.config = {}
+        self.archive_cache = ArchiveCache()
+        self.lookups = LookupCache()
+        self.dirty_archives = {}
+        self._batch_depth = 0
+        self._text_index = None
 
     @classmethod
     def from_workspace(cls, workspace, init=False):
@@ -178,6 +187,25 @@ class Game(Editable, Version):
         else:
             header = NTRHeaderBin(handle)
             handle.close()
+        game = cls.from_header(header)
+        game.files = files
+        game.load_config()
+        if init:
+            game.init()
+        return game
+
+    @classmethod
+    def from_header(cls, header):
+        """Create the Game matching a ROM header without a workspace
+
+        Parameters
+        ----------
+        header : ntr.header_bin.HeaderBin or ctr.header_bin.HeaderBin
+
+        Returns
+        -------
+        game : Game
+        """
         game_code = header.base_code[:3]
         region_code = header.base_code[3]
         try:
@@ -192,15 +220,11 @@ class Game(Editable, Version):
         else:
             game = game_cls()
             game.idx = min(game_cls.versions.values())
-        game.files = files
         game.game_name = game_name
         game.game_code = game_code
         game.region_code = region_code
         game.color = GAME_COLORS[game_name]
         game.header = header
-        game.load_config()
-        if init:
-            game.init()
         return game
 
     def init(self):
@@ -210,6 +234,9 @@ class Game(Editable, Version):
     def from_file(filename, workspace, **kwargs):
         """Creates a workspace from a ROM
 
+        A ROM is not dumped again into a workspace that was already made
+        from it. See manifest.
+
         Returns
         -------
         game : Game
@@ -220,7 +247,12 @@ class Game(Editable, Version):
         if ext in ('.3ds', '.3dz'):
             ctrtool.dump(filename, workspace, xorpad=kwargs.pop('xorpad'))
         elif ext == '.nds':
-            ndstool.dump(filename, workspace)
+            manifest = Manifest(workspace)
+            header = os.path.join(workspace, 'header.bin')
+            if manifest.changed(header, [filename]):
+                ndstool.dump(filename, workspace)
+                manifest.record(header, [filename])
+                manifest.save()
         else:
             raise ValueError('Not able to detect file type')
         game = Game.from_workspace(workspace, True)
@@ -230,6 +262,9 @@ class Game(Editable, Version):
     def to_file(self, filename=None):
         """Exports workspace to a built ROM
 
+        The ROM is only built again if it or any file that goes into it
+        has changed since it was last built.
+
         Parameters
         ----------
         filename : string
@@ -239,11 +274,113 @@ class Game(Editable, Version):
         if filename is None:
             filename = os.path.join(self.files.directory, self.project.output)
         if self < GEN_VI:
-            ndstool.build(filename, self.files.directory)
+            inputs = [path for name, path in
+                      ndstool.build_paths(self.files.directory)]
+            if self.manifest.changed(filename, inputs):
+                ndstool.build(filename, self.files.directory)
+                self.manifest.record(filename, inputs)
+            self.manifest.save()
         else:
             # TODO: ctrtool build
             ctrtool.build(filename, self.files.directory)
 
+    def patch_rom(self, rom_path, changed_paths=None):
+        """Write changed files into an already built ROM
+
+        Each file is overwritten in place if it fits its slot in the ROM
+        and is otherwise moved to the end of it, so the time taken only
+        depends on the size of the changed files. If the ROM was built by
+        to_file(), its manifest record is updated to match without reading
+        the ROM again, so that it is not built again.
+
+        Parameters
+        ----------
+        rom_path : string
+            ROM to patch
+        changed_paths : list, optional
+            Paths relative to fs/. If not provided, every file in fs/
+            changed since the ROM was built by to_file() is written.
+
+        Returns
+        -------
+        relocated : list
+            Paths that did not fit their slot and were moved
+
+        Raises
+        ------
+        ValueError
+            If something other than existing files in fs/ has changed, in
+            which case the ROM has to be built again with to_file()
+        """
+        from ntr.rom import ROM
+        fs = os.path.join(self.files.directory, 'fs')
+        if changed_paths is None:
+            changed_paths = self.changed_rom_files(rom_path)
+        relocated = []
+        with ROM(rom_path, writable=True) as rom:
+            for path in changed_paths:
+                path = path.replace(os.sep, '/')
+                if path not in rom.paths:
+                    raise ValueError('{0} is not in the ROM. Use to_file()'
+                                     .format(path))
+                with open(os.path.join(fs, *path.split('/')), 'rb') \
+                        as handle:
+                    data = handle.read()
+                if not rom.replace(path, data):
+                    relocated.append(path)
+        if rom_path not in self.manifest:
+            return relocated
+        self.manifest.amend(rom_path, [
+            os.path.join(fs, *path.replace(os.sep, '/').split('/'))
+            for path in changed_paths])
+        self.manifest.save()
+        return relocated
+
+    def changed_rom_files(self, rom_path):
+        """Get the files in fs/ that changed since to_file() built a ROM
+
+        Returns
+        -------
+        changed_paths : list
+            Paths relative to fs/
+
+        Raises
+        ------
+        ValueError
+            If the ROM was not built from this workspace or anything but
+            the contents of files in fs/ changed
+        """
+        try:
+            record = self.manifest.products[self.manifest.key(rom_path)]
+        except KeyError:
+            raise ValueError('{0} was not built from this workspace'
+                             .format(rom_path))
+        inputs = [path for name, path in
+                  ndstool.build_paths(self.files.directory)]
+        current = self.manifest.snapshot(inputs)
+        self.manifest.save()
+        built = record['inputs']
+        if sorted(current) != sorted(built):
+            raise ValueError('Files were added or removed. Use to_file()')
+        changed_paths = []
+        for key in sorted(current):
+            if current[key] == built[key]:
+                continue
+            if not key.startswith('fs/'):
+                raise ValueError('{0} changed. Use to_file()'.format(key))
+            changed_paths.append(key[3:])
+        return changed_paths
+
+    @cached_property
+    def manifest(self):
+        """Hashes of the workspace files and of what was built from them
+
+        Returns
+        -------
+        manifest : util.manifest.Manifest
+        """
+        return Manifest(self.files.directory)
+
     def load_config(self):
         try:
             with open(os.path.join(self.files.directory, 'config.json'))\
@@ -272,12 +409,103 @@ class Game(Editable, Version):
                                  self.files.directory, *parts), mode)
 
     def archive(self, filename):
-        return NARC(open(os.path.join(self.files.directory, 'fs', filename)))
+        """Get a parsed archive from the workspace's file system
+
+        Archives are cached by path (see archive_cache) and only reparsed
+        when the file on disk changes. The returned archive is shared, so
+        any modifications to it should be written with save_archive.
+
+        Parameters
+        ----------
+        filename : string
+            Path of the archive relative to fs/
+
+        Returns
+        -------
+        archive : NARC
+        """
+        try:
+            return self.dirty_archives[filename]
+        except KeyError:
+            pass
+        return self.archive_cache.get(
+            os.path.join(self.files.directory, 'fs', filename),
+            self.archive_class)
 
     def save_archive(self, archive, filename):
-        with open(os.path.join(self.files.directory, 'fs', filename), 'wb')\
-                as handle:
-            archive.save(BinaryIO.adapter(handle))
+        """Write an archive back to the workspace
+
+        The archive is written to a temporary file first and renamed over
+        the original, so an interrupted save never leaves a partial file.
+        Inside of a batch(), the write is deferred until the batch ends
+        (or the next flush()) and the filename is recorded as a change of
+        the game (see Editable.changes) until it is written or discarded.
+        """
+        if self._batch_depth:
+            self.dirty_archives[filename] = archive
+            self.touch(filename)
+            return
+        path = os.path.join(self.files.directory, 'fs', filename)
+        try:
+            with AtomicFile(path) as handle:
+                archive.save(BinaryIO.adapter(handle))
+        except Exception:
+            # The cached archive may have been modified already
+            self.archive_cache.invalidate(path)
+            raise
+        self.archive_cache.store(path, archive)
+
+    def batch(self):
+        """Context that defers archive writes until it exits
+
+        Every archive modified through set_* or save_archive inside of the
+        context is written exactly once when the outermost batch exits.
+        If an exception is raised, the pending changes are discarded.
+
+        Returns
+        -------
+        batch : ArchiveBatch
+
+        Examples
+        --------
+        >>> with game.batch():
+        ...     for trainer_id, trainer in enumerate(trainers):
+        ...         game.set_trainer(trainer_id, trainer)
+        """
+        return ArchiveBatch(self)
+
+    def flush(self):
+        """Write all archives with pending changes
+
+        Written archives are no longer listed by changes(). If a write
+        fails, the archives not yet written are discarded.
+        """
+        depth, self._batch_depth = self._batch_depth, 0
+        try:
+            for filename in sorted(self.dirty_archives):
+                self.save_archive(self.dirty_archives[filename], filename)
+                del self.dirty_archives[filename]
+                self.mark_saved([filename])
+        except Exception:
+            self.discard()
+            raise
+        finally:
+            self._batch_depth = depth
+
+    def discard(self):
+        """Drop all pending archive changes
+
+        Text set with set_text() is dropped from the text index as well.
+        The dropped archives are no longer listed by changes().
+        """
+        while self.dirty_archives:
+            filename, archive = self.dirty_archives.popitem()
+            self.archive_cache.invalidate(
+                os.path.join(self.files.directory, 'fs', filename))
+            if filename == self.text_archive_file and \
+                    self._text_index is not None:
+                self._text_index.invalidate()
+            self.mark_saved([filename])
 
     def __getattr__(self, name):
         if name[-8:] == '_archive':
@@ -313,6 +541,93 @@ class Game(Editable, Version):
         from pokemon.msgdata.msg import Text
         return Text(self).load(self.get_text(file_id))
 
+    def set_text(self, file_id, data):
+        """Replace a text file and update the text index if it is open"""
+        Game.__getattr__(self, 'set_text')(file_id, data)
+        if self.lookups.peek(('text', file_id)) is not data:
+            self.lookups.invalidate(('text', file_id))
+        if self._text_index is not None:
+            self._text_index.update(file_id)
+
+    def text_table(self, key):
+        """Get a decoded text file by its text_contents key
+
+        The Text is decoded once and shared until the text archive changes
+        or the file is replaced with set_text(). Modify it only to pass it
+        to set_text().
+
+        Parameters
+        ----------
+        key : string
+            eg 'pokemon_names' or 'map_names'
+
+        Returns
+        -------
+        text : pokemon.msgdata.msg.Text
+        """
+        file_id = self.locale_text_id(key)
+        return self.lookups.get(('text', file_id),
+                                lambda: self.text(file_id),
+                                self.text_archive)
+
+    def map_code_names(self):
+        """Get the readable code name of every map from mapname.bin
+
+        The list is shared and only read again once the file changes.
+
+        Returns
+        -------
+        code_names : list
+        """
+        from pokemon.map import read_code_names
+        path = os.path.join(self.files.directory, 'fs', self.mapname_file)
+        stat = os.stat(path)
+
+        def loader():
+            with self.open('fs', self.mapname_file) as handle:
+                return read_code_names(handle)
+        return self.lookups.get('map_code_names', loader,
+                                (stat.st_mtime, stat.st_size))
+
+    @property
+    def text_index(self):
+        """Searchable index of the text archive
+
+        Returns
+        -------
+        index : pokemon.msgdata.text_index.TextIndex
+        """
+        if self._text_index is None:
+            from pokemon.msgdata.text_index import TextIndex
+            self._text_index = TextIndex(self)
+        return self._text_index
+
+    def records(self, name, model):
+        """Load every record of a fixed-size archive at once
+
+        Parameters
+        ----------
+        name : string
+            Archive name, eg 'personal', 'waza', 'item' or 'exp'
+        model : Editable or Editable class
+            Model of one record. Classes are instantiated with this game,
+            so pass an instance for models that take no game (GrowTbl()).
+
+        Returns
+        -------
+        table : generic.records.RecordTable
+        """
+        from generic.records import RecordTable
+        if isinstance(model, type):
+            model = model(self)
+        return RecordTable(model, getattr(self, name+'_archive').files)
+
+    def save_records(self, name, table):
+        """Write a RecordTable from records() back to its archive"""
+        archive = getattr(self, name+'_archive')
+        archive.files[:] = table.to_files()
+        self.save_archive(archive, getattr(self, name+'_archive_file'))
+
     def locale_text_id(self, key):
         return self.text_contents[REGION_CODES[self.region_code]][key]
 
@@ -322,6 +637,49 @@ class Game(Editable, Version):
         m.load_id(map_id, shallow)
         return m
 
+    def maps_all(self, shallow=False):
+        """Iterate over every map
+
+        The map table is read from one open arm9.dec.bin and the name
+        tables are shared by all maps. Maps are loaded as they are
+        reached.
+
+        Parameters
+        ----------
+        shallow : bool, optional
+            If True, only the map header is loaded. See Map.load_id
+
+        Yields
+        ------
+        map : pokemon.map.Map
+        """
+        from pokemon.map import Map
+        with self.open('arm9.dec.bin', mode='rb') as handle:
+            for map_id in xrange(len(self.map_code_names())):
+                m = Map(self)
+                m.load_entry(handle, map_id, shallow)
+                yield m
+
+    def pokemon_all(self):
+        """Iterate over every Pokemon
+
+        The personal, evolution and level-up move archives are parsed
+        once and the name tables are shared by all Pokemon. Each Pokemon
+        is loaded as it is reached.
+
+        Yields
+        ------
+        pokemon : pokemon.pokemon_container.Pokemon
+        """
+        from pokemon.pokemon_container import Pokemon
+        count = min(len(self.personal_archive.files),
+                    len(self.evo_archive.files),
+                    len(self.wotbl_archive.files),
+                    len(self.text_table('pokemon_names')),
+                    len(self.text_table('species_names')))
+        for natid in xrange(count):
+            yield Pokemon.from_id(self, natid)
+
     @cached_property
     def overlay_table(self):
         with self.open('header.bin') as header:
@@ -340,6 +698,25 @@ class Game(Editable, Version):
         pass
 
 
+class ArchiveBatch(object):
+    """Context for Game.batch()"""
+    def __init__(self, game):
+        self.game = game
+
+    def __enter__(self):
+        self.game._batch_depth += 1
+        return self.game
+
+    def __exit__(self, type_, value, traceback):
+        self.game._batch_depth -= 1
+        if self.game._batch_depth:
+            return
+        if type_ is None:
+            self.game.flush()
+        else:
+            self.game.discard()
+
+
 class DP(Game):
     gen = 4
     idx = 0
@@ -469,8 +846,9 @@ class HGSS(Game):
     }
 
     def init(self):
-        blz.decompress_arm9(self)
-        blz.decompress_overlays(self)
+        with self.manifest:
+            blz.decompress_arm9(self, manifest=self.manifest)
+            blz.decompress_overlays(self, manifest=self.manifest)
 
         with open(os.path.join(self.files.directory, 'arm9.dec.bin'), 'r+')\
                 as handle:
@@ -502,8 +880,9 @@ class BW(Game):
     commands_files = ('bw.json', )
 
     def init(self):
-        blz.decompress_arm9(self)
-        blz.decompress_overlays(self)
+        with self.manifest:
+            blz.decompress_arm9(self, manifest=self.manifest)
+            blz.decompress_overlays(self, manifest=self.manifest)
 
 
 class B2W2(BW):
@@ -524,9 +903,7 @@ class XY(Game):
     personal_archive_file = 'a/2/1/8'
     wotbl_archive_file = 'a/2/1/4'
     script_archive_file = 'a/0/1/1'
-
-    def archive(self, filename):
-        return GARC(open(os.path.join(self.files.directory, 'fs', filename)))
+    archive_class = GARC
 
 
 class ORAS(XY):
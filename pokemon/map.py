@@ -11,6 +11,42 @@ from pokemon.game import Game
 from pokemon.msgdata.msg import Text
 
 
+def read_code_names(handle):
+    """Read the code name of every map from mapname.bin
+
+    Parameters
+    ----------
+    handle : file
+
+    Returns
+    -------
+    names : list
+        Names like 'T 01: None None-None' for codes that are understood
+        and the raw codes for the rest
+    """
+    names = []
+    while True:
+        try:
+            code = handle.read(16).strip(chr(0))
+            if not code:
+                break
+        except:
+            break
+        match = re.match(
+            '([CTDLRWP])([0-9]{2})(PC|FS|GYM|R)?'
+            '([0-9]{2})?([0-9]{2})?', code)
+        if match is None:
+            names.append(code)
+            continue
+        names.append('{type} {loc_id}: {subtype} {sub_id}-{sub_id2}'
+                     .format(type=match.group(1),
+                             loc_id=match.group(2),
+                             subtype=match.group(3),
+                             sub_id=match.group(4),
+                             sub_id2=match.group(5)))
+    return names
+
+
 class Map(Editable):
     WEATHER_NONE = 0
     WEATHER_RAIN = 1  # 1-3
@@ -76,7 +112,7 @@ class Map(Editable):
         self.events = ZoneEvents(game)
         self.text = Text(game)
         self.area_data = AreaData()
-        self.names = self.game.text(self.game.locale_text_id('map_names'))
+        self.names = self.game.text_table('map_names')
         self.code_names = self.get_code_names()
 
     @property
@@ -90,35 +126,17 @@ class Map(Editable):
         self.music_copy_idx = value
 
     def get_code_names(self):
-        names = []
-        with self.game.open('fs', self.game.mapname_file) as handle:
-            while True:
-                try:
-                    code = handle.read(16).strip(chr(0))
-                    if not code:
-                        break
-                except:
-                    break
-                match = re.match(
-                    '([CTDLRWP])([0-9]{2})(PC|FS|GYM|R)?'
-                    '([0-9]{2})?([0-9]{2})?', code)
-                if match is None:
-                    names.append(code)
-                    continue
-                names.append('{type} {loc_id}: {subtype} {sub_id}-{sub_id2}'
-                             .format(type=match.group(1),
-                                     loc_id=match.group(2),
-                                     subtype=match.group(3),
-                                     sub_id=match.group(4),
-                                     sub_id2=match.group(5)))
-        return names
+        return self.game.map_code_names()
 
     def load_id(self, map_id, shallow=False):
         with open(os.path.join(self.game.files.directory, 'arm9.dec.bin'))\
                 as handle:
-            handle.seek(self.game.map_table+map_id*self.get_size())
-            # data = handle.read(self.get_size())
-            self.load(handle)
+            self.load_entry(handle, map_id, shallow)
+
+    def load_entry(self, handle, map_id, shallow=False):
+        """Load a map from an already open arm9.dec.bin"""
+        handle.seek(self.game.map_table+map_id*self.get_size())
+        self.load(handle)
         self.code_name = self.code_names[map_id]
         self.name = self.names[self.map_name]
         if not shallow:
@@ -143,15 +161,17 @@ class Map(Editable):
             self.save(handle)
         if shallow:
             return
-        if self.name != self.names[self.map_name]:
-            self.names[self.map_name] = self.name
-            self.game.set_text(self.game.locale_text_id('map_names'),
-                               self.names)
-        # TODO: codename?
-        self.game.set_text(self.text_idx, self.text)
-        self.game.set_area_data(self.area_data_idx, self.area_data)
-        self.game.set_script(self.script_idx, self.script)
-        self.game.set_script(self.script_condition_idx, self.script_conditions)
-        self.game.set_event(self.event_idx, self.events)
-        if self.encounter_idx != self.no_encounters:
-            self.game.set_encounter(self.encounter_idx, self.encounters)
+        with self.game.batch():
+            if self.name != self.names[self.map_name]:
+                self.names[self.map_name] = self.name
+                self.game.set_text(self.game.locale_text_id('map_names'),
+                                   self.names)
+            # TODO: codename?
+            self.game.set_text(self.text_idx, self.text)
+            self.game.set_area_data(self.area_data_idx, self.area_data)
+            self.game.set_script(self.script_idx, self.script)
+            self.game.set_script(self.script_condition_idx,
+                                 self.script_conditions)
+            self.game.set_event(self.event_idx, self.events)
+            if self.encounter_idx != self.no_encounters:
+                self.game.set_encounter(self.encounter_idx, self.encounters)
@@ -2,6 +2,9 @@
 import codecs
 import os
 import re
+import struct
+
+import numpy as np
 
 from atomic import AtomicStruct
 from generic.archive import Archive
@@ -49,13 +52,13 @@ def decompress(string, incr=15):
     string : list
         The decompressed string
     """
-    if string.pop(0) != 0xF100:
+    if string[0] != 0xF100:
         raise ValueError('Invalid compression character')
     newstring = []
     container = 0
     bit = 0
-    while string:
-        container |= string.pop(0) << bit
+    for idx in xrange(1, len(string)):
+        container |= string[idx] << bit
         bit += incr
         while bit >= 9:
             bit -= 9
@@ -102,6 +105,232 @@ def compress(string, incr=15):
     return newstring
 
 
+def gather_strings(reader, offsets, sizes):
+    """Read the encrypted 16-bit strings of a text file in one array
+
+    Parameters
+    ----------
+    reader : BinaryIO
+    offsets : list
+        Offset of each string
+    sizes : list
+        Number of characters in each string
+
+    Returns
+    -------
+    chars : numpy.ndarray
+        All strings concatenated as uint16
+    """
+    chunks = []
+    for offset, size in zip(offsets, sizes):
+        reader.seek(offset)
+        chunks.append(reader.read(size*2))
+    return np.frombuffer(''.join(chunks), dtype='<u2').astype(np.uint16)
+
+
+def split_strings(chars, sizes):
+    """Split a concatenated character array back into lists"""
+    chars = chars.tolist()
+    strings = []
+    start = 0
+    for size in sizes:
+        strings.append(chars[start:start+size])
+        start += size
+    return strings
+
+
+def string_positions(sizes):
+    """Index of each character within its own string, and the index of the
+    string it belongs to, for a concatenation of strings of given sizes
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    owners = np.repeat(np.arange(len(sizes)), sizes)
+    starts = np.cumsum(sizes)-sizes
+    return np.arange(sizes.sum())-starts[owners], owners
+
+
+def decrypt4(chars, sizes):
+    """Decrypt Gen IV strings
+
+    The key for string i starts at TEXT_KEY4_INIT*(i+1) and advances by
+    TEXT_KEY4_STEP for every character.
+
+    Parameters
+    ----------
+    chars : numpy.ndarray
+        Concatenated encrypted strings
+    sizes : list
+        Number of characters in each string
+
+    Returns
+    -------
+    strings : list
+        List of decrypted character lists
+    """
+    positions, owners = string_positions(sizes)
+    keys = (TEXT_KEY4_INIT*(owners+1)+TEXT_KEY4_STEP*positions) & 0xFFFF
+    return split_strings(chars ^ keys.astype(np.uint16), sizes)
+
+
+def decrypt5(chars, sizes):
+    """Decrypt Gen V strings
+
+    Each string is keyed by its last character XOR 0xFFFF. Walking
+    backwards, the key is rotated right by 3 bits for every character.
+
+    Parameters
+    ----------
+    chars : numpy.ndarray
+        Concatenated encrypted strings
+    sizes : list
+        Number of characters in each string
+
+    Returns
+    -------
+    strings : list
+        List of decrypted character lists
+    seeds : list
+        Key of each string
+    """
+    positions, owners = string_positions(sizes)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    seeds = chars[np.cumsum(sizes)-1].astype(np.int64) ^ 0xFFFF
+    shifts = (3*(sizes[owners]-1-positions)) % 16
+    keys = seeds[owners]
+    keys = ((keys >> shifts) | (keys << (16-shifts))) & 0xFFFF
+    return split_strings(chars ^ keys.astype(np.uint16), sizes), \
+        seeds.tolist()
+
+
+def decode4(string):
+    """Convert a decrypted Gen IV character list to text
+
+    Returns
+    -------
+    text : string
+    """
+    text = []
+    idx = 0
+    total = len(string)
+    while idx < total:
+        char = string[idx]
+        idx += 1
+        if char == 0xFFFF:
+            break
+        elif char == 0xFFFE:
+            args = [string[idx]]
+            count = string[idx+1]
+            idx += 2
+            args += string[idx:idx+count]
+            idx += count
+            text.append('VAR(')
+            text.append(', '.join(map(str, args)))
+            text.append(')')
+        elif char == 0xE000:
+            text.append('\\n')
+        elif char == 0x25bc:
+            text.append('\\r')
+        elif char == 0x25bd:
+            text.append('\\f')
+        else:
+            try:
+                text.append(table[char])
+            except KeyError:
+                text.append('\\?{0:04x}'.format(char))
+    else:
+        raise RuntimeError('Did not have a terminating character')
+    return ''.join(text)
+
+
+def decode5(string):
+    """Convert a decrypted Gen V character list to text
+
+    Returns
+    -------
+    text : string or unicode
+    """
+    text = []
+    idx = 0
+    total = len(string)
+    while idx < total:
+        char = string[idx]
+        idx += 1
+        if char == 0xFFFF:
+            break
+        elif char == 0xFFFE:
+            text.append('\\n')
+        elif char < 20 or char > 0xF000:
+            text.append('\\?{0:04X}'.format(char))
+        elif char == 0xF000:
+            kind = string[idx]
+            count = string[idx+1]
+            idx += 2
+            if kind == 0xbe00 and not count:
+                text.append('\\f')
+            elif kind == 0xbe01 and not count:
+                text.append('\\r')
+            else:
+                args = [kind]
+                args += string[idx:idx+count]
+                idx += count
+                text.append('VAR(')
+                text.append(', '.join(map(str, args)))
+                text.append(')')
+        else:
+            text.append(unichr(char))
+    return ''.join(text)
+
+
+def is_text(data, version=game.Version(4, 0)):
+    """Check whether every string of a text file lies inside of it
+
+    This only reads the tables, so it is safe to call on data of an
+    unknown format before handing it to Text.load.
+
+    Parameters
+    ----------
+    data : string or buffer
+    version : Version
+
+    Returns
+    -------
+    valid : bool
+    """
+    size = len(data)
+    if version in game.GEN_IV:
+        if size < 4:
+            return False
+        num, seed = struct.unpack_from('<HH', data)
+        table_end = 4+8*num
+        if not num or table_end > size:
+            return False
+        states = (((seed*0x2FD) & 0xFFFF) *
+                  np.arange(1, num+1, dtype=np.int64)) & 0xFFFF
+        table = np.frombuffer(data[4:table_end], dtype='<u4').reshape(num, 2)
+        table = table ^ (states | states << 16)[:, None]
+        starts = table[:, 0]
+        stops = starts+2*table[:, 1]
+    else:
+        if size < 12:
+            return False
+        numblocks, num = struct.unpack_from('<HH', data)
+        if not numblocks or 12+4*numblocks > size:
+            return False
+        starts = []
+        stops = []
+        for block_offset in struct.unpack_from('<{0}I'.format(numblocks),
+                                               data, 12):
+            if block_offset+4+8*num > size:
+                return False
+            table = np.frombuffer(data[block_offset+4:block_offset+4+8*num],
+                                  dtype='<u4').reshape(num, 2)
+            starts.append(block_offset+table[:, 0].astype(np.int64))
+            stops.append(starts[-1]+2*(table[:, 1] & 0xFFFF))
+        starts = np.concatenate(starts)
+        stops = np.concatenate(stops)
+    return bool((starts >= 4).all() and (stops <= size).all())
+
+
 class TableEntry(Editable):
     def define(self, version=game.Version(4, 0)):
         self.uint32('offset')
@@ -157,66 +386,40 @@ class Text(Archive, Editable):
         sizes = []
         if self.version in game.GEN_IV:
             commented = False  # (self.seed & 0x1FF) == 0x1FF
-            for i in xrange(1, self.num+1):
-                state = (((self.seed*0x2FD) & 0xFFFF)*i) & 0xFFFF
-                key = state | state << 16
-                offsets.append(reader.readUInt32() ^ key)
-                sizes.append(reader.readUInt32() ^ key)
+            states = (((self.seed*0x2FD) & 0xFFFF) *
+                      np.arange(1, self.num+1, dtype=np.int64)) & 0xFFFF
+            keys = (states | states << 16)[:, None]
+            table_data = reader.readArray('<u4', 2*self.num)
+            table_data = table_data.reshape(self.num, 2) ^ keys
+            offsets = table_data[:, 0].tolist()
+            sizes = table_data[:, 1].tolist()
             if commented:
-                state = (((self.seed*0x2FD) & 0xFFFF)*i) & 0xFFFF
+                state = (((self.seed*0x2FD) & 0xFFFF)*self.num) & 0xFFFF
                 key = state | state << 16
                 comment_ofs = reader.readUInt32() ^ key
                 term = reader.readUInt32() ^ key
                 if term != 0xFFFF:
                     raise ValueError('Expected 0xFFFF comment ofs terminator.'
                                      ' Got {0:#x}'.format(term))
-            for i in xrange(self.num):
+            strings = decrypt4(gather_strings(reader, offsets, sizes), sizes)
+            for i, string in enumerate(strings):
                 compressed = False
-                reader.seek(offsets[i])
-                size = sizes[i]
-                string = []
-                key = (TEXT_KEY4_INIT*(i+1)) & 0xFFFF
-                for j in range(size):
-                    string.append(reader.readUInt16() ^ key)
-                    key = (key+TEXT_KEY4_STEP) & 0xFFFF
                 if string[0] == 0xF100:
                     compressed = True
                     string = decompress(string)
-                text = ''
-                while string:
-                    char = string.pop(0)
-                    if char == 0xFFFF:
-                        break
-                    elif char == 0xFFFE:
-                        text += 'VAR('
-                        args = [string.pop(0)]
-                        count = string.pop(0)
-                        args += string[:count]
-                        string = string[count:]
-                        text += ', '.join(map(str, args))
-                        text += ')'
-                    elif char == 0xE000:
-                        text += '\\n'
-                    elif char == 0x25bc:
-                        text += '\\r'
-                    elif char == 0x25bd:
-                        text += '\\f'
-                    else:
-                        try:
-                            text += table[char]
-                        except KeyError:
-                            text += '\\?{0:04x}'.format(char)
-                    name = '0_{0:05}'.format(i)
-                    if compressed:
-                        name += 'c'
-                    self.files[name] = text
-                    self.ids[i] = name
-                else:
-                    raise RuntimeError('Did not have a terminating character')
+                text = decode4(string)
+                if string[0] == 0xFFFF:
+                    # Entries with no characters before the terminator
+                    # are not listed
+                    continue
+                name = '0_{0:05}'.format(i)
+                if compressed:
+                    name += 'c'
+                self.files[name] = text
+                self.ids[i] = name
         else:
             commented = False
-            for i in xrange(self.numblocks):
-                offsets.append(reader.readUInt32())
+            offsets = reader.readArray('<u4', self.numblocks).tolist()
             block = Editable()
             block.uint32('size')
             block.array('entries', TableEntry(self.version).base_struct,
@@ -225,45 +428,19 @@ class Text(Archive, Editable):
             for i, block_offset in enumerate(offsets):
                 reader.seek(block_offset)
                 block.load(reader)
-                for j, entry in enumerate(block.entries):
+                entries = list(block.entries)
+                sizes = [entry.charcount for entry in entries]
+                strings, seeds = decrypt5(gather_strings(
+                    reader, [block_offset+entry.offset for entry in entries],
+                    sizes), sizes)
+                for j, entry in enumerate(entries):
                     compressed = False
-                    text = ''
-                    reader.seek(block_offset+entry.offset)
-                    encchars = [reader.readUInt16()
-                                for k in xrange(entry.charcount)]
-                    seed = key = encchars[-1] ^ 0xFFFF
-                    string = []  # decrypted chars
-                    while encchars:
-                        char = encchars.pop() ^ key
-                        key = ((key >> 3) | (key << 13)) & 0xFFFF
-                        string.insert(0, char)
+                    string = strings[j]
+                    seed = seeds[j]
                     if string[0] == 0xF100:
                         compressed = True
                         string = decompress(string, 16)
-                    while string:
-                        char = string.pop(0)
-                        if char == 0xFFFF:
-                            break
-                        elif char == 0xFFFE:
-                            text += '\\n'
-                        elif char < 20 or char > 0xF000:
-                            text += '\\?{0:04X}'.format(char)
-                        elif char == 0xF000:
-                            kind = string.pop(0)
-                            count = string.pop(0)
-                            if kind == 0xbe00 and not count:
-                                text += '\\f'
-                            elif kind == 0xbe01 and not count:
-                                text += '\\r'
-                            else:
-                                text += 'VAR('
-                                args = [kind]
-                                args += string[:count]
-                                string = string[count:]
-                                text += ', '.join(map(str, args))
-                                text += ')'
-                        else:
-                            text += unichr(char)
+                    text = decode5(string)
                     name = '{0}_{1:05}'.format(i, j)
                     c = 65
                     for k in xrange(16):
@@ -0,0 +1,227 @@
+
+import hashlib
+import os
+import re
+import sqlite3
+
+from pokemon.msgdata.msg import Text
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    file_id INTEGER,
+    entry_id INTEGER,
+    text TEXT,
+    PRIMARY KEY (file_id, entry_id)
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT,
+    file_id INTEGER,
+    entry_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS tokens_token ON tokens (token);
+CREATE INDEX IF NOT EXISTS tokens_file ON tokens (file_id);
+"""
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens
+
+    Returns
+    -------
+    tokens : set
+    """
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class TextIndex(object):
+    """Persistent search index over a Game's text archive
+
+    Decoded strings are stored in an SQLite database in the workspace,
+    keyed by (file_id, entry_id). The index is checked against the text
+    archive's mtime and size before each query. When they differ, the
+    subfiles are hashed and only the ones whose contents changed are
+    decoded again.
+
+    Parameters
+    ----------
+    game : Game
+    path : string, optional
+        Location of the database. Defaults to text_index.db in the
+        workspace.
+
+    Examples
+    --------
+    >>> index = game.text_index
+    >>> index.search('Professor')
+    [(0, 12, u'Professor Rowan...'), ...]
+    >>> index.search_tokens('rare candy')
+    [(...), ...]
+    """
+    def __init__(self, game, path=None):
+        self.game = game
+        if path is None:
+            path = os.path.join(game.files.directory, 'text_index.db')
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    @property
+    def archive_path(self):
+        return os.path.join(self.game.files.directory, 'fs',
+                            self.game.text_archive_file)
+
+    def get_meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?',
+                                (key, )).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                          (key, value))
+
+    def stamp(self):
+        stat = os.stat(self.archive_path)
+        return '{0}:{1}'.format(stat.st_mtime, stat.st_size)
+
+    def refresh(self):
+        """Bring the index up to date with the text archive
+
+        Returns
+        -------
+        changed : list
+            file_ids that were reindexed
+        """
+        stamp = self.stamp()
+        if self.get_meta('stamp') == stamp:
+            return []
+        digests = dict(self.conn.execute('SELECT file_id, digest FROM files'))
+        files = self.game.text_archive.files
+        changed = []
+        with self.conn:
+            for file_id, data in enumerate(files):
+                digest = hashlib.sha1(data).hexdigest()
+                if digests.get(file_id) != digest:
+                    self.index_file(file_id, data, digest)
+                    changed.append(file_id)
+            self.conn.execute('DELETE FROM files WHERE file_id >= ?',
+                              (len(files), ))
+            self.conn.execute('DELETE FROM entries WHERE file_id >= ?',
+                              (len(files), ))
+            self.conn.execute('DELETE FROM tokens WHERE file_id >= ?',
+                              (len(files), ))
+            self.set_meta('stamp', stamp)
+        return changed
+
+    def invalidate(self):
+        """Check every file against the text archive on the next query
+
+        Files whose indexed contents no longer match it are reindexed.
+        """
+        with self.conn:
+            self.conn.execute('DELETE FROM meta WHERE key = ?', ('stamp', ))
+
+    def update(self, file_id, data=None):
+        """Reindex a single text file
+
+        This is called by Game.set_text so that the index reflects new text
+        immediately, even if the archive write is deferred by a batch.
+
+        Parameters
+        ----------
+        file_id : int
+        data : string, optional
+            Raw text file. Defaults to the current archive contents.
+        """
+        if data is None:
+            data = self.game.text_archive.files[file_id]
+        with self.conn:
+            self.index_file(file_id, data, hashlib.sha1(data).hexdigest())
+
+    def index_file(self, file_id, data, digest):
+        """Replace the rows of one file. Call inside a transaction"""
+        self.conn.execute('DELETE FROM entries WHERE file_id = ?',
+                          (file_id, ))
+        self.conn.execute('DELETE FROM tokens WHERE file_id = ?',
+                          (file_id, ))
+        self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?)',
+                          (file_id, digest))
+        try:
+            text = Text(self.game).load(data)
+        except Exception:
+            # Not all files in the archive decode cleanly; index them empty
+            return
+        entries = []
+        tokens = []
+        for entry_id, name in text.ids.iteritems():
+            value = text.files[name]
+            if isinstance(value, str):
+                value = value.decode('utf-8', 'replace')
+            entries.append((file_id, entry_id, value))
+            tokens.extend((token, file_id, entry_id)
+                          for token in tokenize(value))
+        self.conn.executemany('INSERT INTO entries VALUES (?, ?, ?)',
+                              entries)
+        self.conn.executemany('INSERT INTO tokens VALUES (?, ?, ?)', tokens)
+
+    def search(self, substring, case_sensitive=False):
+        """Find entries containing a substring
+
+        Parameters
+        ----------
+        substring : string
+        case_sensitive : bool, optional
+
+        Returns
+        -------
+        matches : list
+            List of (file_id, entry_id, text)
+        """
+        self.refresh()
+        if case_sensitive:
+            query = 'SELECT * FROM entries WHERE instr(text, ?) > 0'
+            args = (substring, )
+        else:
+            pattern = re.sub(r'([\\%_])', r'\\\1', substring)
+            query = "SELECT * FROM entries WHERE text LIKE ? ESCAPE '\\'"
+            args = ('%'+pattern+'%', )
+        return self.conn.execute(query+' ORDER BY file_id, entry_id',
+                                 args).fetchall()
+
+    def search_tokens(self, query):
+        """Find entries containing every word in query, in any order
+
+        Parameters
+        ----------
+        query : string
+
+        Returns
+        -------
+        matches : list
+            List of (file_id, entry_id, text)
+        """
+        self.refresh()
+        tokens = sorted(tokenize(query))
+        if not tokens:
+            return []
+        return self.conn.execute(
+            'SELECT entries.* FROM entries JOIN ('
+            ' SELECT file_id, entry_id FROM tokens WHERE token IN ({0})'
+            ' GROUP BY file_id, entry_id HAVING COUNT(*) = ?) AS hits'
+            ' USING (file_id, entry_id)'
+            ' ORDER BY file_id, entry_id'.format(', '.join('?'*len(tokens))),
+            tokens+[len(tokens)]).fetchall()
+
+    def close(self):
+        self.conn.close()
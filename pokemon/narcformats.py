@@ -0,0 +1,131 @@
+"""Formatters for diffing the NARCs of a game
+
+See ntr.narcdiff for how formatters are used.
+"""
+
+import os
+
+from ntr.header_bin import HeaderBin
+from pokemon.game import Game
+from pokemon.msgdata.msg import Text, is_text
+from pokemon.poketool.personal import Personal
+from util.io import BufferReader
+
+
+def record_fields(record, prefix=''):
+    """Flatten a record into (key, value) pairs in field order
+
+    Nested structs are named 'struct.field' and arrays 'array[idx]'
+    """
+    for key in record.keys:
+        value = getattr(record, key)
+        if hasattr(value, 'keys'):
+            for pair in record_fields(value, prefix+key+'.'):
+                yield pair
+        elif hasattr(value, '__len__') and not isinstance(value, basestring):
+            for idx, item in enumerate(value):
+                yield '{0}{1}[{2}]'.format(prefix, key, idx), item
+        else:
+            yield prefix+key, value
+
+
+def personal_formatter(game):
+    """Describe Personal records field by field"""
+    personal = Personal(game)
+    size = personal.get_size()
+
+    def formatter(data):
+        if len(data) != size:
+            raise ValueError('Expected a {0} byte record'.format(size))
+        personal.load(BufferReader(data))
+        return list(record_fields(personal))
+    return formatter
+
+
+def text_formatter(game):
+    """Describe text files with one line per entry"""
+    def formatter(data):
+        if not is_text(data, game):
+            raise ValueError('Not a text file')
+        text = Text(game).load(BufferReader(data))
+        return sorted(text.files.items())
+    return formatter
+
+
+FORMATS = {
+    'personal': personal_formatter,
+    'text': text_formatter,
+}
+
+
+def find_game(directory):
+    """Find the game of the workspace containing a directory
+
+    Parameters
+    ----------
+    directory : string
+
+    Returns
+    -------
+    game : pokemon.game.Game or None
+    workspace : string or None
+    """
+    directory = os.path.abspath(directory)
+    while True:
+        try:
+            with open(os.path.join(directory, 'header.bin'), 'rb') as handle:
+                return Game.from_header(HeaderBin(handle)), directory
+        except (IOError, ValueError):
+            pass
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None, None
+        directory = parent
+
+
+def detect(game, path, files=()):
+    """Pick the formatter for an archive of a game
+
+    The path is matched against the game's archive names first. Git
+    passes copies of old revisions as temporary files named
+    XXXXXX_<basename>, so named archives are also matched by their
+    basename. Otherwise the first files are checked against each format.
+
+    Parameters
+    ----------
+    game : pokemon.game.Game
+    path : string
+        Path of the archive, or of its temporary copy
+    files : list, optional
+        Files of the archive
+
+    Returns
+    -------
+    name : string or None
+        Key of FORMATS
+    """
+    path = path.replace(os.sep, '/')
+    basename = path.rsplit('/', 1)[-1]
+    for name in FORMATS:
+        try:
+            archive_file = getattr(game, name+'_archive_file')
+        except (AttributeError, KeyError):
+            continue
+        if path.endswith('/'+archive_file) or path == archive_file:
+            return name
+        archive_basename = archive_file.rsplit('/', 1)[-1]
+        if '.' in archive_basename and \
+                basename.split('_', 1)[-1] == archive_basename:
+            return name
+    sample = [data for data in files[:8] if len(data)]
+    if not sample:
+        return None
+    for name in sorted(FORMATS):
+        formatter = FORMATS[name](game)
+        try:
+            for data in sample:
+                formatter(data)
+        except Exception:
+            continue
+        return name
+    return None
@@ -16,10 +16,10 @@ class Pokemon(Editable):
         self.restrict('levelmoves')
         self.name = ''
         self.restrict('name')
-        self.names = game.text(game.locale_text_id('pokemon_names'))
+        self.names = game.text_table('pokemon_names')
         self.species_name = ''
         self.restrict('species_name')
-        self.species_names = game.text(game.locale_text_id('species_names'))
+        self.species_names = game.text_table('species_names')
 
     def load_id(self, natid):
         self.personal.load(self.game.get_personal(natid))
@@ -36,14 +36,16 @@ class Pokemon(Editable):
         return target
 
     def commit(self, natid):
-        self.game.set_personal(natid, self.personal)
-        self.game.set_evo(natid, self.evolutions)
-        self.game.set_wotbl(natid, self.levelmoves)
-        if self.name != self.names[natid]:
-            self.names[natid] = self.name
-            self.game.set_text(self.game.locale_text_id('pokemon_names'),
-                               self.names)
-        if self.species_name != self.species_names[natid]:
-            self.species_names[natid] = self.species_name
-            self.game.set_text(self.game.locale_text_id('species_names'),
-                               self.species_names)
+        with self.game.batch():
+            self.game.set_personal(natid, self.personal)
+            self.game.set_evo(natid, self.evolutions)
+            self.game.set_wotbl(natid, self.levelmoves)
+            if self.name != self.names[natid]:
+                self.names[natid] = self.name
+                self.game.set_text(self.game.locale_text_id('pokemon_names'),
+                                   self.names)
+            if self.species_name != self.species_names[natid]:
+                self.species_names[natid] = self.species_name
+                self.game.set_text(
+                    self.game.locale_text_id('species_names'),
+                    self.species_names)
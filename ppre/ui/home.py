@@ -13,8 +13,7 @@ from util import hook
 def confirm(func):
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
-        print(self.save_hash)
-        if self.save_hash and (self.save_hash != self.session.game.checksum()):
+        if self.session.game.dirty:
             print('Save first')
             with self.prompt('should_save') as prompt:
                 # TODO: Yes/No
@@ -66,7 +65,7 @@ class HomeUserInterface(BaseUserInterface):
                 project_group.edit('version')
                 project_group.edit('output')
         self.clear()
-        self.save_hash = self.session.game.checksum()
+        self.session.game.mark_clean()
         self.save_filename = None
 
     def clear(self):
@@ -214,7 +213,7 @@ class HomeUserInterface(BaseUserInterface):
                     game.project.from_dict(dict(parser.items('project')))
                     game.write_config()
                 self.set_game(game)
-                self.save_hash = self.session.game.checksum()
+                self.session.game.mark_clean()
                 self.save_filename = target
 
             @prompt.on('cancel')
@@ -232,9 +231,10 @@ class HomeUserInterface(BaseUserInterface):
                     pass
                 parser.set('files', 'workspace',
                            self.session.game.files.directory)
+                self.session.game.flush()
                 self.session.game.write_config()
                 parser.write(handle)
-            self.save_hash = self.session.game.checksum()
+            self.session.game.mark_clean()
         else:
             try:
                 self.save_as()
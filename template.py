@@ -27,9 +27,13 @@ try:
 except:
     pass
 
+# Every file opened for writing, so that gen.py can record what was written
+written = []
+
 class templatefile(file):
     def __init__(self, name, mode="w", title="Data"):
         super(templatefile, self).__init__(name, mode)
+        written.append(name)
         self.title = title
         defaultopen(self, self.title)
     def close(self):
@@ -0,0 +1,44 @@
+"""Load modules as they were before the optimizations, for comparison
+
+The benchmarks time each implementation against the one it replaced. The
+old source is read from git history rather than kept as a copy in the
+tree. Its imports resolve against the current tree.
+"""
+
+import imp
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+# Revision the optimizations started from. Override with BENCH_BASELINE.
+BASELINE = os.environ.get('BENCH_BASELINE',
+                          '26c02f24b587b9d61e7b3b56fde4970174f3ac54')
+
+
+def load(path, revision=BASELINE):
+    """Import a module of the repository as it was at a revision
+
+    Parameters
+    ----------
+    path : string
+        Path relative to the repository root, eg 'compression/blz.py'
+    revision : string, optional
+        Any git revision. Defaults to BASELINE.
+
+    Returns
+    -------
+    module : module
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    source = subprocess.check_output(
+        ['git', 'show', '{0}:{1}'.format(revision, path)], cwd=ROOT)
+    name = 'baseline_'+os.path.splitext(path)[0].replace('/', '_')
+    module = imp.new_module(name)
+    module.__file__ = '{0}:{1}'.format(revision, path)
+    # Keep it alive. Python 2 clears the globals of a module once it is freed
+    sys.modules[name] = module
+    exec compile(source, module.__file__, 'exec') in module.__dict__
+    return module
@@ -0,0 +1,66 @@
+"""Benchmark BLZ compression and decompression on overlay-sized inputs
+
+Compares compression.blz.decompress against the original byte-by-byte
+in-place implementation, loaded from git history.
+"""
+
+import os
+import random
+import time
+
+from rawdb.compression import blz
+from rawdb.util.io import BinaryIO
+
+import baseline
+
+
+def synthetic_overlay(size, seed=0):
+    """Code-like data: repeated instruction words, tables and zero runs"""
+    rand = random.Random(seed)
+    words = [os.urandom(rand.choice([2, 4, 4, 8])) for i in xrange(512)]
+    chunks = []
+    total = 0
+    while total < size:
+        choice = rand.random()
+        if choice < 0.6:
+            chunk = rand.choice(words)
+        elif choice < 0.7:
+            chunk = '\x00'*rand.randint(4, 64)
+        else:
+            chunk = os.urandom(rand.randint(1, 8))
+        chunks.append(chunk)
+        total += len(chunk)
+    return ''.join(chunks)[:size]
+
+
+def timed(func, repeat=5):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, best
+
+
+def main():
+    reference_decompress = baseline.load('compression/blz.py').decompress
+    for size in (0x4000, 0x10000, 0x40000, 0x100000):
+        data = synthetic_overlay(size)
+        compressed, compress_time = timed(lambda: blz.compress(data), 1)
+        end = len(compressed)
+        new, new_time = timed(
+            lambda: blz.decompress(BinaryIO(compressed), end))
+        old, old_time = timed(
+            lambda: reference_decompress(BinaryIO(compressed), end))
+        assert new == old
+        assert new.tostring() == data
+        print('{0:#8x}: ratio {1:.2f} compress {2:.3f}s decompress '
+              '{3:.3f}s (reference {4:.3f}s, {5:.1f}x)'.format(
+                  size, end/float(size), compress_time, new_time, old_time,
+                  old_time/new_time))
+
+
+if __name__ == '__main__':
+    main()
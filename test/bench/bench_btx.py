@@ -0,0 +1,62 @@
+"""Benchmark BTX0 texture export and import
+
+Decodes a synthetic TEX0 of 2000 16-color textures to images, comparing
+TEX.images against the original per-pixel decoding loaded from git
+history, then imports the images back with TEX.flush.
+"""
+
+import os
+import time
+
+from rawdb.ntr.g3d import btx
+from rawdb.ntr.g3d.btx import FORMAT_I4, TEX
+
+import baseline
+
+TEXTURES = 2000
+SIZE = 32
+
+
+def build(module, texdata, paldata):
+    """Build a TEX of I4 textures with the given btx module"""
+    tex = module.TEX()
+    size = SIZE*SIZE >> 1
+    tex.texdict.num = TEXTURES
+    tex.texdict.names = ['image_%04d' % idx for idx in xrange(TEXTURES)]
+    tex.texparams = [module.TexParam(idx*size, SIZE, SIZE, FORMAT_I4, idx & 1)
+                     for idx in xrange(TEXTURES)]
+    tex.texdata = texdata
+    tex.paldict.num = TEXTURES
+    tex.paldict.names = ['palette_%04d' % idx for idx in xrange(TEXTURES)]
+    tex.palparams = [module.PalParam(idx*32, 0) for idx in xrange(TEXTURES)]
+    tex.paldata = paldata
+    return tex
+
+
+def main():
+    texdata = os.urandom(TEXTURES*SIZE*SIZE >> 1)
+    paldata = os.urandom(TEXTURES*32)
+    tex = build(btx, texdata, paldata)
+    old_tex = build(baseline.load('ntr/g3d/btx.py'), texdata, paldata)
+    start = time.time()
+    ref = [image.tobytes() for image in old_tex.images]
+    ref_time = time.time()-start
+    start = time.time()
+    images = tex.images
+    new = [image.tobytes() for image in images]
+    new_time = time.time()-start
+    assert ref == new
+    print('{0} textures reference: {1:.3f}s new: {2:.3f}s ({3:.1f}x)'.format(
+        TEXTURES, ref_time, new_time, ref_time/new_time))
+    files = tex.files
+    start = time.time()
+    new_tex = TEX()
+    for data in files:
+        new_tex.add(data=data)
+    new_tex.flush()
+    print('{0} textures imported in {1:.3f}s'.format(
+        TEXTURES, time.time()-start))
+
+
+if __name__ == '__main__':
+    main()
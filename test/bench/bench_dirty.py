@@ -0,0 +1,43 @@
+"""Benchmark unsaved-change detection on a large Editable tree
+
+Compares Editable.dirty against recomputing Editable.checksum.
+"""
+
+import time
+
+from rawdb.generic.editable import XEditable as Editable
+
+
+class Entry(Editable):
+    def define(self):
+        self.uint16('value')
+        self.uint8('flags')
+
+
+class Project(Editable):
+    def define(self, count):
+        self.entries = [Entry() for i in xrange(count)]
+        self.restrict('entries')
+
+
+def main():
+    for count in (100, 1000, 10000):
+        project = Project(count)
+        project.mark_clean()
+        saved = project.checksum()
+        project.entries[count//2].value = 7
+        start = time.time()
+        changed = project.checksum() != saved
+        checksum_time = time.time()-start
+        start = time.time()
+        dirty = project.dirty
+        dirty_time = time.time()-start
+        assert changed and dirty
+        assert project.changes() == set(['entries'])
+        print('{0:>6} entries: dirty {1:.6f}s (checksum {2:.4f}s, '
+              '{3:.0f}x)'.format(count, dirty_time, checksum_time,
+                                 checksum_time/max(dirty_time, 1e-7)))
+
+
+if __name__ == '__main__':
+    main()
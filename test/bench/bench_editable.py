@@ -0,0 +1,45 @@
+"""Benchmark per-instance construction cost of Editables
+
+Compares construction with the compiled schema cache against compiling
+a new ctypes type for every instance.
+"""
+
+import time
+
+from rawdb.pokemon.game import HGSS
+from rawdb.pokemon.poketool.trainer import Trainer, TrainerPokemon
+from rawdb.pokemon.poketool.waza import Waza
+
+
+def construct(factory, count):
+    start = time.time()
+    for i in xrange(count):
+        factory()
+    return (time.time()-start)/count
+
+
+def main():
+    game = HGSS()
+    trainer = Trainer(game)
+    cases = [
+        ('Trainer', lambda: Trainer(game)),
+        ('TrainerPokemon', lambda: TrainerPokemon(trainer)),
+        ('Waza', lambda: Waza(game)),
+    ]
+    # The AtomicStruct class these models were built from
+    atomic_struct = [cls for cls in Waza.__mro__
+                     if cls.__name__ == 'AtomicStruct'][0]
+    get_schema_key = atomic_struct.__dict__['get_schema_key']
+    for name, factory in cases:
+        atomic_struct.get_schema_key = lambda self: None
+        try:
+            before = construct(factory, 700)
+        finally:
+            atomic_struct.get_schema_key = get_schema_key
+        after = construct(factory, 700)
+        print('{0:>16}: {1:.1f}us uncached, {2:.1f}us cached ({3:.1f}x)'
+              .format(name, before*1e6, after*1e6, before/after))
+
+
+if __name__ == '__main__':
+    main()
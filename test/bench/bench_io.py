@@ -0,0 +1,109 @@
+"""Benchmark the hot parsers on BufferReader against StringIO readers
+
+Compares FATB.load and SYMB.load_entries over a BufferReader with the
+original per-value loops over a StringIO backed BinaryIO, loaded from
+git history. Text.load is timed over both readers.
+"""
+
+import struct
+import time
+
+from rawdb.ntr.narc import NARC
+from rawdb.ntr.snd.sdat import SYMB
+from rawdb.pokemon.game import DP
+from rawdb.pokemon.msgdata.msg import Text
+from rawdb.util.io import BinaryIO, BufferReader
+
+import baseline
+
+
+def reference_fatb(old_narc, data):
+    """Original FATB entry loop over a StringIO backed BinaryIO"""
+    narc = old_narc.NARC()
+    reader = old_narc.BinaryIO(data)
+    reader.seek(0x10)
+    narc.fatb.load(reader)
+    return narc.fatb.entries_
+
+
+def reference_entries(old_sdat, data, num):
+    """Original SYMB.load_entries with character at a time strings"""
+    return old_sdat.SYMB.load_entries(old_sdat.BinaryIO(data), 0, (), num)
+
+
+def build_narc(count):
+    narc = NARC()
+    narc.files.extend(struct.pack('<I', idx)*(idx % 7)
+                      for idx in xrange(count))
+    return narc.save().getvalue()
+
+
+def build_symbols(count):
+    names = ['SEQ_{0:05}_SYMBOL'.format(idx) for idx in xrange(count)]
+    offsets = []
+    offset = 4*count
+    for name in names:
+        offsets.append(offset)
+        offset += len(name)+1
+    return (struct.pack('<{0}I'.format(count), *offsets) +
+            ''.join(name+'\x00' for name in names))
+
+
+def build_text(count):
+    text = Text(DP())
+    text.seed = 0x1234
+    text.files = dict(('0_{0:05}'.format(idx), 'Text entry {0}'.format(idx))
+                      for idx in xrange(count))
+    return text.save().getvalue()
+
+
+def timed(func, repeat=5):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, best
+
+
+def load_fatb(data):
+    narc = NARC()
+    reader = BufferReader(data)
+    reader.seek(0x10)
+    narc.fatb.load(reader)
+    return narc.fatb.entries_
+
+
+def load_text(reader):
+    text = Text(DP())
+    text.load(reader)
+    return text.files
+
+
+def main():
+    old_narc = baseline.load('ntr/narc.py')
+    old_sdat = baseline.load('ntr/snd/sdat.py')
+    narc = build_narc(20000)
+    symbols = build_symbols(5000)
+    text = build_text(2000)
+    cases = [
+        ('FATB.load', lambda: load_fatb(narc),
+         lambda: reference_fatb(old_narc, narc)),
+        ('SYMB.load_entries',
+         lambda: SYMB.load_entries(BufferReader(symbols), 0, (), 5000),
+         lambda: reference_entries(old_sdat, symbols, 5000)),
+        ('Text.load', lambda: load_text(BufferReader(text)),
+         lambda: load_text(BinaryIO(text))),
+    ]
+    for name, func, reference in cases:
+        new, new_time = timed(func)
+        old, old_time = timed(reference)
+        assert new == old
+        print('{0:>18}: {1:.4f}s (reference {2:.4f}s, {3:.1f}x)'.format(
+            name, new_time, old_time, old_time/new_time))
+
+
+if __name__ == '__main__':
+    main()
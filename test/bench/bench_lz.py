@@ -0,0 +1,63 @@
+"""Benchmark LZ compression throughput
+
+Compares common.lz.compress at several levels against the original
+sliding window LZCompress, loaded from git history, on graphics-like
+input.
+"""
+
+import random
+import time
+
+from rawdb.common.lz import COMPRESSION_LZ77, COMPRESSION_LZSS, LZ, compress
+
+import baseline
+
+
+def reference_compress(module, data):
+    """Original LZ77 compression scanning every position in the window"""
+    return module.LZCompress(module.BinaryIO(data)).handle.getvalue()
+
+
+def synthetic_graphics(size, seed=0):
+    """4bpp-like tile data with repeated rows and flat areas"""
+    rand = random.Random(seed)
+    rows = [''.join(chr(rand.choice([0, 0x11, 0x12, 0x21, 0x34, 0x43]))
+                    for i in xrange(4)) for j in xrange(64)]
+    chunks = []
+    total = 0
+    while total < size:
+        if rand.random() < 0.2:
+            chunk = '\x00'*32
+        else:
+            chunk = ''.join(rand.choice(rows) for i in xrange(8))
+        chunks.append(chunk)
+        total += len(chunk)
+    return ''.join(chunks)[:size]
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time()-start
+
+
+def main():
+    old_lz = baseline.load('common/lz.py')
+    for size in (0x2000, 0x8000):
+        data = synthetic_graphics(size)
+        ref, ref_time = timed(reference_compress, old_lz, data)
+        assert LZ(ref).data == data
+        print('{0:#7x} reference: {1:6d} bytes {2:.3f}s ({3:.1f} KB/s)'
+              .format(size, len(ref), ref_time, size/1024./ref_time))
+        for compression in (COMPRESSION_LZ77, COMPRESSION_LZSS):
+            for level in (0, 6, 9):
+                out, out_time = timed(compress, data, compression, level)
+                assert LZ(out).data == data
+                print('{0:#7x} {1:#x} level {2}: {3:6d} bytes {4:.3f}s '
+                      '({5:.1f} KB/s, {6:.1f}x)'.format(
+                          size, compression, level, len(out), out_time,
+                          size/1024./out_time, ref_time/out_time))
+
+
+if __name__ == '__main__':
+    main()
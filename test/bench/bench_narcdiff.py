@@ -0,0 +1,54 @@
+"""Benchmark structural NARC diffs on growing Personal archives
+
+Compares narcdiff.diff against a line diff (difflib) of the full
+textconv output of both archives, which is what git does with a textconv.
+"""
+
+import difflib
+import time
+
+from rawdb.ntr import narcdiff
+from rawdb.pokemon.game import DP
+from rawdb.pokemon.narcformats import personal_formatter
+from rawdb.pokemon.poketool.personal import Personal
+
+
+def build_records(count):
+    personal = Personal(DP())
+    files = []
+    for idx in xrange(count):
+        personal.base_stat.hp = idx % 256
+        personal.catchrate = idx % 200
+        files.append(personal.save().getvalue())
+    return files
+
+
+def reference(old, new, formatter):
+    return [line for line in difflib.unified_diff(
+        list(narcdiff.render(old, formatter)),
+        list(narcdiff.render(new, formatter)), lineterm='')
+        if line[:1] in '+-' and line[:3] not in ('+++', '---')]
+
+
+def main():
+    formatter = personal_formatter(DP())
+    for count in (1000, 4000, 16000):
+        old = build_records(count)
+        new = list(old)
+        for idx in xrange(0, count, 500):
+            new[idx] = new[idx][:1]+'\xFF'+new[idx][2:]
+        start = time.time()
+        lines = list(narcdiff.diff(old, new, formatter))
+        diff_time = time.time()-start
+        start = time.time()
+        expected = reference(old, new, formatter)
+        reference_time = time.time()-start
+        assert [line for line in lines if line[:1] in '+-'] == \
+            [line for line in expected if 'sha1' not in line]
+        print('{0:>6} files: {1:.4f}s (textconv + difflib {2:.4f}s, '
+              '{3:.1f}x)'.format(count, diff_time, reference_time,
+                                 reference_time/diff_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark NCGR sprite export and decryption
+
+Exports every sprite of a synthetic 500 sprite archive to RGBA images,
+comparing NCGR.get_image against the original per-byte loops. Then
+decrypts a pokegra-sized archive of encrypted sprites, comparing
+ncgr.crypt against the original per-word LCG loop. The originals are
+loaded from git history.
+"""
+
+import array
+import os
+import time
+
+from rawdb.ntr.g2d.ncgr import NCGR, crypt
+from rawdb.ntr.g2d.nclr import NCLR
+from rawdb.ntr.narc import NARC
+from rawdb.util.io import BinaryIO
+
+import baseline
+
+SPRITES = 500
+ENCRYPTED_SPRITES = 2500
+WIDTH = 20
+HEIGHT = 10
+
+
+def reference_decrypt(old_ncgr, data):
+    """Original CHAR.encrypt with ENCRYPTION_REVERSE"""
+    char = old_ncgr.NCGR().char
+    char.data = data
+    char.encrypt(old_ncgr.NCGR.ENCRYPTION_REVERSE)
+    return char.data
+
+
+def build_archive():
+    narc = NARC()
+    for idx in xrange(SPRITES):
+        ncgr = NCGR()
+        ncgr.numblocks = 1
+        ncgr.cpos.loaded = False
+        ncgr.char.width = WIDTH
+        ncgr.char.height = HEIGHT
+        ncgr.char.data = os.urandom(WIDTH*HEIGHT*32)
+        ncgr.char.datasize = len(ncgr.char.data)
+        narc.files.append(ncgr.save().getvalue())
+    clr = NCLR()
+    clr.pltt.format = clr.pltt.FORMAT_16BIT
+    clr.pltt.data = array.array('H', os.urandom(32))
+    clr.pltt.datasize = 32
+    return narc.save().getvalue(), clr
+
+
+def export(data, clr):
+    narc = NARC(BinaryIO(data))
+    return [NCGR(reader=BinaryIO(ncgr)).get_image(clr=clr).tobytes()
+            for ncgr in narc.files]
+
+
+def reference_export(data, clr, old_ncgr, old_nclr):
+    """Original per-byte NCGR.get_image and NCLR palette conversion"""
+    narc = NARC(BinaryIO(data))
+    clr = old_nclr.NCLR(reader=old_ncgr.BinaryIO(clr.save().getvalue()))
+    return [old_ncgr.NCGR(reader=old_ncgr.BinaryIO(ncgr))
+            .get_image(clr=clr).tobytes() for ncgr in narc.files]
+
+
+def main():
+    old_ncgr = baseline.load('ntr/g2d/ncgr.py')
+    old_nclr = baseline.load('ntr/g2d/nclr.py')
+    data, clr = build_archive()
+    start = time.time()
+    ref = reference_export(data, clr, old_ncgr, old_nclr)
+    ref_time = time.time()-start
+    start = time.time()
+    new = export(data, clr)
+    new_time = time.time()-start
+    assert ref == new
+    print('{0} sprites reference: {1:.3f}s new: {2:.3f}s ({3:.1f}x)'.format(
+        SPRITES, ref_time, new_time, ref_time/new_time))
+
+    sprites = [os.urandom(WIDTH*HEIGHT*32)
+               for idx in xrange(ENCRYPTED_SPRITES)]
+    start = time.time()
+    ref = [reference_decrypt(old_ncgr, data) for data in sprites]
+    ref_time = time.time()-start
+    start = time.time()
+    new = [crypt(data, NCGR.ENCRYPTION_REVERSE)[0] for data in sprites]
+    new_time = time.time()-start
+    for ref_data, new_data in zip(ref, new):
+        words = array.array('H', new_data)
+        words.reverse()
+        assert words.tostring() == ref_data
+    print('{0} encrypted sprites reference: {1:.3f}s new: {2:.3f}s '
+          '({3:.1f}x)'.format(ENCRYPTED_SPRITES, ref_time, new_time,
+                              ref_time/new_time))
+
+    encrypted = NARC()
+    for data in sprites:
+        ncgr = NCGR(NCGR.ENCRYPTION_REVERSE)
+        ncgr.numblocks = 1
+        ncgr.cpos.loaded = False
+        ncgr.char.width = WIDTH
+        ncgr.char.height = HEIGHT
+        ncgr.char.data = data
+        ncgr.char.datasize = len(data)
+        encrypted.files.append(ncgr.save().getvalue())
+    data = encrypted.save().getvalue()
+    start = time.time()
+    narc = NARC(BinaryIO(data))
+    for ncgr in narc.files:
+        NCGR(NCGR.ENCRYPTION_REVERSE, reader=BinaryIO(ncgr))
+    print('{0} encrypted NCGRs loaded in {1:.3f}s'.format(
+        ENCRYPTED_SPRITES, time.time()-start))
+
+
+if __name__ == '__main__':
+    main()
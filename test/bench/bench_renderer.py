@@ -0,0 +1,84 @@
+"""Benchmark NCER cell bank and NSCR screen rendering
+
+Renders a synthetic bank of 200 cells and a 256x192 screen with
+TileRenderer, comparing against the original per-pixel drawing loaded
+from git history.
+"""
+
+import array
+import random
+import time
+
+from rawdb.ntr.g2d import ncer, ncgr, nclr, nscr
+from rawdb.ntr.g2d.renderer import TileRenderer
+
+import baseline
+
+CELLS = 200
+
+
+def build(rand, ncer, nscr, ncgr, nclr):
+    """Build a random bank, screen, graphic and palette with the given
+    ncer, nscr, ncgr and nclr modules
+    """
+    clr = nclr.NCLR()
+    clr.pltt.format = clr.pltt.FORMAT_16BIT
+    clr.pltt.data = array.array('H', [rand.randrange(0x8000)
+                                      for idx in xrange(256)])
+    cgr = ncgr.NCGR()
+    cgr.char.data = ''.join(chr(rand.randrange(256))
+                            for idx in xrange(32*1024))
+    cgr.char.datasize = len(cgr.char.data)
+    bank = ncer.NCER()
+    for idx in xrange(CELLS):
+        cell = ncer.Cell(0)
+        for attr_idx in xrange(4):
+            attr = ncer.CellAttributes()
+            attr.x = rand.randrange(-32, 32)
+            attr.y = rand.randrange(-32, 32)
+            attr.shape = rand.randrange(3)
+            attr.size_ = rand.randrange(4)
+            attr.rotparam = rand.choice([0, 0x8, 0x10, 0x18])
+            attr.tileofs = rand.randrange(960)
+            attr.pal_id = rand.randrange(16)
+            cell.attrs.append(attr)
+        bank.cebk.cells.append(cell)
+    scr = nscr.NSCR()
+    scr.scrn.width = 256
+    scr.scrn.height = 192
+    scr.scrn.data = array.array('H', [rand.randrange(1024) |
+                                      rand.randrange(16) << 12
+                                      for idx in xrange(32*24)])
+    return bank, scr, cgr, clr
+
+
+def main():
+    bank, scr, cgr, clr = build(random.Random(0), ncer, nscr, ncgr, nclr)
+    old_bank, old_scr, old_cgr, old_clr = build(
+        random.Random(0), *[baseline.load('ntr/g2d/{0}.py'.format(name))
+                            for name in ('ncer', 'nscr', 'ncgr', 'nclr')])
+    start = time.time()
+    ref = [old_bank.get_image(idx, old_cgr, old_clr).tobytes()
+           for idx in xrange(CELLS)]
+    ref_time = time.time()-start
+    start = time.time()
+    renderer = TileRenderer(cgr, clr)
+    new = [bank.get_image(idx, renderer=renderer).tobytes()
+           for idx in xrange(CELLS)]
+    new_time = time.time()-start
+    assert ref == new
+    print('{0} cells reference: {1:.3f}s new: {2:.3f}s ({3:.1f}x)'.format(
+        CELLS, ref_time, new_time, ref_time/new_time))
+    start = time.time()
+    ref = old_scr.get_image(old_cgr, old_clr).tobytes()
+    ref_time = time.time()-start
+    start = time.time()
+    new = scr.get_image(cgr, clr).tobytes()
+    new_time = time.time()-start
+    assert ref == new
+    print('screen reference: {0:.3f}s new: {1:.3f}s ({2:.1f}x)'.format(
+        ref_time, new_time, ref_time/new_time))
+
+
+if __name__ == '__main__':
+    main()
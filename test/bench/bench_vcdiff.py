@@ -0,0 +1,48 @@
+"""Benchmark VCDIFF patch creation and application on ROM-sized images
+
+There is no in-process reference (patches used to be made by the xdelta3
+binary), so this reports the time and patch size for typical edits.
+"""
+
+import os
+import random
+import time
+from cStringIO import StringIO
+
+from rawdb.compression import vcdiff
+
+
+def edited(source, count, seed=0):
+    rand = random.Random(seed)
+    target = bytearray(source)
+    for idx in xrange(count):
+        pos = rand.randrange(len(target)-0x100)
+        target[pos:pos+0x40] = os.urandom(0x40)
+    return bytes(target)
+
+
+def main():
+    size = 128 << 20
+    source = os.urandom(size)
+    cases = [
+        ('scattered edits', edited(source, 500)),
+        ('inserted bytes', source[:0x100]+'x'*0x4D+source[0x100:]),
+        ('appended file', source+os.urandom(0x80000)),
+    ]
+    for name, target in cases:
+        patch = StringIO()
+        start = time.time()
+        vcdiff.encode(source, target, patch)
+        encode_time = time.time()-start
+        out = StringIO()
+        start = time.time()
+        vcdiff.decode(source, StringIO(patch.getvalue()), out)
+        decode_time = time.time()-start
+        assert out.getvalue() == target
+        print('{0:>16}: {1} byte patch, encode {2:.2f}s, decode '
+              '{3:.2f}s'.format(name, len(patch.getvalue()), encode_time,
+                                decode_time))
+
+
+if __name__ == '__main__':
+    main()
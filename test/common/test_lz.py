@@ -0,0 +1,39 @@
+
+import os
+import unittest
+
+from rawdb.common.lz import COMPRESSION_LZ77, COMPRESSION_LZSS, LZ, \
+    LZCompress, compress
+from rawdb.util.io import BinaryIO
+
+
+class TestLZ(unittest.TestCase):
+    data = ''.join(['abc', 'abcabcabcd'*40, os.urandom(200), '\x00'*5000,
+                    'pattern'*300, 'z'])
+
+    def roundtrip(self, data, compression, level=6):
+        compressed = compress(data, compression, level)
+        self.assertEqual(ord(compressed[0]), compression)
+        self.assertEqual(LZ(compressed).data, data)
+        return compressed
+
+    def test_lz77(self):
+        for level in (0, 6, 9):
+            self.roundtrip(self.data, COMPRESSION_LZ77, level)
+
+    def test_lzss(self):
+        lz77 = self.roundtrip(self.data, COMPRESSION_LZ77)
+        lzss = self.roundtrip(self.data, COMPRESSION_LZSS)
+        self.assertLess(len(lzss), len(lz77))
+        for size in (0x10, 0x11, 0x110, 0x111, 0x10110, 0x10111):
+            self.roundtrip('x'+'y'*size, COMPRESSION_LZSS)
+
+    def test_small(self):
+        for data in ('', 'a', 'ab', 'aaaa'):
+            self.roundtrip(data, COMPRESSION_LZ77)
+            self.roundtrip(data, COMPRESSION_LZSS)
+
+    def test_compress_handle(self):
+        handle = BinaryIO(self.data)
+        LZCompress(handle, COMPRESSION_LZSS)
+        self.assertEqual(LZ(handle.getvalue()).data, self.data)
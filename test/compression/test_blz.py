@@ -0,0 +1,137 @@
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from rawdb.compression import blz
+from rawdb.util.io import BinaryIO
+
+
+def roundtrip(data, start=0):
+    compressed = blz.compress(data, start)
+    if compressed is None:
+        return None
+    return blz.decompress(BinaryIO(compressed), len(compressed)).tostring()
+
+
+class TestBLZ(unittest.TestCase):
+    def test_roundtrip(self):
+        data = ''.join(['header', '\x00'*64, 'abcdefgh'*200, os.urandom(300),
+                        'abcabcabc'*50, '\xFF'*17])
+        self.assertEqual(roundtrip(data), data)
+        self.assertEqual(roundtrip(data, 0x40), data)
+
+    def test_overlap(self):
+        data = 'xy'+'\x01'*1000+'z'
+        self.assertEqual(roundtrip(data), data)
+
+    def test_incompressible(self):
+        self.assertIsNone(blz.compress(os.urandom(256)))
+        self.assertIsNone(blz.compress(''))
+
+    def test_decoders_match(self):
+        data = ''.join(['abcd'*300, os.urandom(500), '\x00'*2000, 'xy'*700])
+        compressed = blz.compress(data)
+        topinfo = struct.unpack_from('I', compressed, len(compressed)-8)[0]
+        stream = compressed[len(compressed)-(topinfo & 0xFFFFFF):
+                            len(compressed)-(topinfo >> 24)]
+        expected = blz._decode_slices(stream)
+        self.assertTrue(data.endswith(expected))
+        self.assertEqual(blz._decode_array(stream).tostring(), expected)
+
+
+class FakeGame(object):
+    def __init__(self, directory):
+        self.files = self
+        self.directory = directory
+
+
+class TestOverlays(unittest.TestCase):
+    def setUp(self):
+        self.workspaces = []
+
+    def tearDown(self):
+        for workspace in self.workspaces:
+            shutil.rmtree(workspace)
+
+    def make_game(self):
+        workspace = tempfile.mkdtemp()
+        self.workspaces.append(workspace)
+        os.mkdir(os.path.join(workspace, 'overlays'))
+        table = ''
+        for file_id in xrange(4):
+            data = ''.join([chr(file_id)*32, 'overlay'*100,
+                            struct.pack('I', file_id)*50])
+            reserved = 0
+            if file_id % 2:
+                data = blz.compress(data)
+                reserved = 1 << 24 | len(data)
+            with open(os.path.join(workspace, 'overlays',
+                                   'overlay_{0:04}.bin'.format(file_id)),
+                      'wb') as handle:
+                handle.write(data)
+            table += struct.pack('8I', file_id, 0, 0, 0, 0, 0, file_id,
+                                 reserved)
+        with open(os.path.join(workspace, 'overarm9.bin'), 'wb') as handle:
+            handle.write(table)
+        with open(os.path.join(workspace, 'header.bin'), 'wb') as handle:
+            handle.write('\x00'*0x54+struct.pack('I', len(table)))
+        return FakeGame(workspace)
+
+    def read_output(self, game):
+        directory = os.path.join(game.files.directory, 'overlays_dez')
+        return [open(os.path.join(directory, name), 'rb').read()
+                for name in sorted(os.listdir(directory))
+                if name.startswith('overlay_')]
+
+    def test_parallel_matches_serial(self):
+        serial = self.make_game()
+        parallel = self.make_game()
+        blz.decompress_overlays(serial, workers=1)
+        blz.decompress_overlays(parallel, workers=2)
+        self.assertEqual(self.read_output(serial), self.read_output(parallel))
+        self.assertEqual(self.read_output(serial)[1],
+                         '\x01'*32+'overlay'*100+struct.pack('I', 1)*50)
+
+    def test_skip_up_to_date(self):
+        game = self.make_game()
+        blz.decompress_overlays(game, workers=1)
+        workspace = game.files.directory
+        os.remove(os.path.join(workspace, 'overarm9.dec.bin'))
+        missing = os.path.join(workspace, 'overlays_dez', 'overlay_0003.bin')
+        expected = self.read_output(game)
+        os.remove(missing)
+        fresh = os.path.join(workspace, 'overlays_dez', 'overlay_0001.bin')
+        os.utime(fresh, (0, 0))
+        blz.decompress_overlays(game, workers=1)
+        self.assertEqual(self.read_output(game), expected)
+        self.assertEqual(os.path.getmtime(fresh), 0)
+
+    def test_source_change(self):
+        game = self.make_game()
+        blz.decompress_overlays(game, workers=1)
+        workspace = game.files.directory
+        kept = os.path.join(workspace, 'overlays_dez', 'overlay_0000.bin')
+        os.utime(kept, (0, 0))
+        with open(os.path.join(workspace, 'overlays', 'overlay_0002.bin'),
+                  'wb') as handle:
+            handle.write('replaced')
+        blz.decompress_overlays(game, workers=1)
+        self.assertEqual(self.read_output(game)[2], 'replaced')
+        self.assertEqual(os.path.getmtime(kept), 0)
+
+    def test_edit_kept(self):
+        game = self.make_game()
+        blz.decompress_overlays(game, workers=1)
+        workspace = game.files.directory
+        edited = os.path.join(workspace, 'overlays_dez', 'overlay_0003.bin')
+        with open(edited, 'ab') as handle:
+            handle.write('edit')
+        with open(os.path.join(workspace, 'overlays', 'overlay_0002.bin'),
+                  'wb') as handle:
+            handle.write('replaced')
+        blz.decompress_overlays(game, workers=1)
+        self.assertEqual(self.read_output(game)[2], 'replaced')
+        self.assertTrue(self.read_output(game)[3].endswith('edit'))
@@ -0,0 +1,89 @@
+import os
+import random
+import unittest
+from cStringIO import StringIO
+
+from rawdb.compression import vcdiff
+
+
+def roundtrip(source, target, regions=()):
+    patch = StringIO()
+    vcdiff.encode(source, target, patch, regions)
+    out = StringIO()
+    vcdiff.decode(source, StringIO(patch.getvalue()), out)
+    return out.getvalue(), len(patch.getvalue())
+
+
+class TestVCDIFF(unittest.TestCase):
+    def test_code_table(self):
+        self.assertEqual(len(vcdiff.CODE_TABLE), 256)
+        self.assertEqual(vcdiff.CODE_TABLE[19], (vcdiff.COPY, 0, 0, 0, 0, 0))
+        self.assertEqual(vcdiff.CODE_TABLE[163],
+                         (vcdiff.ADD, 1, 0, vcdiff.COPY, 4, 0))
+        self.assertEqual(vcdiff.CODE_TABLE[255],
+                         (vcdiff.COPY, 4, 8, vcdiff.ADD, 1, 0))
+
+    def test_rfc_example(self):
+        """Decode the example of RFC 3284 section 4.3"""
+        data = 'wxyzz'
+        inst = bytearray([20, 5, 20, 19, 12, 0, 4])
+        addr = bytearray([0, 4, 24])
+        delta = bytearray([28, 0, len(data), len(inst), len(addr)])
+        delta += data+inst+addr
+        patch = vcdiff.VCDIFF_MAGIC+'\x00' + \
+            bytes(bytearray([vcdiff.VCD_SOURCE, 16, 0, len(delta)])+delta)
+        out = StringIO()
+        vcdiff.decode('abcdefghijklmnop', StringIO(patch), out)
+        self.assertEqual(out.getvalue(), 'abcdwxyzefghefghefghefghzzzz')
+
+    def test_roundtrip(self):
+        rand = random.Random(0)
+        source = os.urandom(0x40000)
+        edited = bytearray(source)
+        for idx in xrange(20):
+            edited[rand.randrange(len(edited))] ^= 0xFF
+        cases = [
+            bytes(edited),
+            source[:0x1000]+'inserted'*40+source[0x1000:],
+            source[:0x2000]+source[0x3000:],
+            source[0x30000:]+source[:0x30000],
+            source+'\xff'*0x10000,
+            '',
+        ]
+        for target in cases:
+            out, size = roundtrip(source, target)
+            self.assertEqual(out, target)
+            self.assertLess(size, 0x800)
+        self.assertEqual(roundtrip('', 'new')[0], 'new')
+
+    def test_windows(self):
+        source = os.urandom(vcdiff.MAX_WINDOW+0x1000)
+        target = source[:0x100]+'x'+source[0x100:]
+        out, size = roundtrip(source, target)
+        self.assertEqual(out, target)
+        self.assertLess(size, 0x100)
+        windows = vcdiff.plan_windows([], len(source), len(target))
+        self.assertEqual([window.target_start for window in windows],
+                         [0, vcdiff.MAX_WINDOW])
+
+    def test_regions(self):
+        first = os.urandom(0x800)
+        second = os.urandom(0x800)
+        source = first+second
+        target = second+'\x00'*0x10+first
+        regions = [(0, 0x800, 0x800, 0x1000), (0x810, 0x1010, 0, 0x800)]
+        windows = vcdiff.plan_windows(regions, len(source), len(target))
+        self.assertEqual([(window.target_start, window.target_stop)
+                          for window in windows],
+                         [(0, 0x800), (0x800, 0x810), (0x810, 0x1010)])
+        out, size = roundtrip(source, target, regions)
+        self.assertEqual(out, target)
+        self.assertLess(size, 0x80)
+
+    def test_corrupt(self):
+        patch = StringIO()
+        vcdiff.encode('source data'*10, 'target data'*10, patch)
+        self.assertRaises(ValueError, vcdiff.decode, 'different'*10,
+                          StringIO(patch.getvalue()), StringIO())
+        self.assertRaises(ValueError, vcdiff.decode, '',
+                          StringIO('not a patch'), StringIO())
@@ -0,0 +1,127 @@
+import unittest
+
+from rawdb.generic.editable import XEditable as Editable
+
+
+class Example(Editable):
+    def define(self, wide=False, extra=False):
+        self.uint8('a')
+        self.uint8('b')
+        if wide:
+            with self.replace('b'):
+                self.uint16('b')
+        if extra:
+            with self.after('a'):
+                self.uint8('c')
+
+
+class TestSchemaCache(unittest.TestCase):
+    def test_shared(self):
+        first = Example()
+        second = Example()
+        self.assertIs(first._type, second._type)
+        first.a = 3
+        second.a = 4
+        self.assertEqual(first.a, 3)
+        self.assertEqual(second.save().getvalue(), '\x04\x00')
+
+    def test_layouts(self):
+        plain = Example()
+        wide = Example(wide=True)
+        extra = Example(False, True)
+        self.assertIsNot(plain._type, wide._type)
+        self.assertIsNot(plain._type, extra._type)
+        self.assertIs(wide._type, Example(wide=True)._type)
+        wide.b = 0x1234
+        self.assertEqual(wide.get_size(), 4)
+        self.assertEqual(wide.save().getvalue(), '\x00\x00\x34\x12')
+        extra.c = 7
+        self.assertEqual(extra.save().getvalue(), '\x00\x07\x00')
+
+    def test_no_instance_state(self):
+        class Owned(Editable):
+            def define(self, owner):
+                self.owner = owner
+                self.uint8('a')
+
+        owned = Owned(owner=Child())
+        self.assertNotIn('owner', owned._type.__dict__)
+        self.assertIs(Owned(owner=owned.owner)._type, owned._type)
+
+
+class Child(Editable):
+    def define(self):
+        self.uint8('value')
+
+
+class Parent(Editable):
+    def define(self):
+        self.uint8('a')
+        self.child = Child()
+        self.restrict('child')
+        self.children = []
+        self.restrict('children')
+
+
+class TestChangeTracking(unittest.TestCase):
+    def test_set(self):
+        parent = Parent()
+        self.assertFalse(parent.dirty)
+        parent.a = 0
+        self.assertFalse(parent.dirty)
+        parent.a = 3
+        self.assertTrue(parent.dirty)
+        self.assertEqual(parent.changes(), set(['a']))
+        generation = parent.mark_clean()
+        self.assertFalse(parent.dirty)
+        self.assertEqual(parent.changes(), set())
+        parent.a = 4
+        self.assertEqual(parent.changes(generation), set(['a']))
+
+    def test_mark_saved(self):
+        parent = Parent()
+        parent.a = 3
+        parent.child.value = 5
+        parent.mark_saved(['a'])
+        self.assertTrue(parent.dirty)
+        self.assertEqual(parent.changes(), set(['child']))
+        parent.mark_saved(['child'])
+        self.assertFalse(parent.dirty)
+        self.assertEqual(parent.changes(), set())
+
+    def test_children(self):
+        parent = Parent()
+        parent.child.value = 5
+        self.assertTrue(parent.child.dirty)
+        self.assertEqual(parent.changes(), set(['child']))
+        parent.mark_clean()
+        child = Child()
+        parent.children.append(child)
+        self.assertEqual(parent.changes(), set(['children']))
+        parent.mark_clean()
+        child.value = 1
+        self.assertEqual(parent.changes(), set(['children']))
+        parent.mark_clean()
+        parent.children.pop()
+        parent.mark_clean()
+        child.value = 2
+        self.assertFalse(parent.dirty)
+
+    def test_replace(self):
+        parent = Parent()
+        old = parent.child
+        parent.child = Child()
+        parent.mark_clean()
+        old.value = 1
+        self.assertFalse(parent.dirty)
+        parent.child.value = 1
+        self.assertEqual(parent.changes(), set(['child']))
+        parent.children.extend([Child(), Child()])
+        parent.mark_clean()
+        parent.children[1] = Child()
+        self.assertTrue(parent.dirty)
+        parent.mark_clean()
+        parent.children[1].value = 9
+        self.assertTrue(parent.dirty)
+        parent.children[:] = []
+        self.assertEqual(len(parent.children), 0)
@@ -0,0 +1,56 @@
+import os
+import unittest
+
+from rawdb.generic.editable import XEditable as Editable
+from rawdb.generic.records import RecordTable
+
+
+class Record(Editable):
+    def define(self):
+        self.uint8('a')
+        self.uint16('b')
+        self.uint8('low', width=3)
+        self.int8('signed', width=4)
+        self.uint8('top', width=1)
+        self.array('values', self.uint16, length=3)
+        self.uint32('c')
+
+
+class TestRecordTable(unittest.TestCase):
+    def setUp(self):
+        self.model = Record()
+        self.size = self.model.get_size()
+        self.files = [os.urandom(self.size+idx % 3) for idx in xrange(20)]
+
+    def test_round_trip(self):
+        table = RecordTable(self.model, self.files)
+        self.assertEqual(len(table), len(self.files))
+        self.assertEqual(table.to_files(), self.files)
+
+    def test_values(self):
+        table = RecordTable(self.model, self.files)
+        for idx, data in enumerate(self.files):
+            record = Record(reader=data)
+            row = table[idx]
+            for name in ('a', 'b', 'low', 'signed', 'top', 'c'):
+                self.assertEqual(getattr(record, name), row[name], name)
+            self.assertEqual(list(record.values), list(row['values']))
+
+    def test_write_back(self):
+        table = RecordTable(self.model, self.files)
+        table.records['signed'][:] = -3
+        table.records['values'][:, 1] = 0x1234
+        table.records['c'][::2] = 7
+        for idx, data in enumerate(table.to_files()):
+            record = Record(reader=data)
+            original = Record(reader=self.files[idx])
+            self.assertEqual(record.signed, -3)
+            self.assertEqual(record.values[1], 0x1234)
+            self.assertEqual(record.c, 7 if not idx % 2 else original.c)
+            self.assertEqual(record.low, original.low)
+            self.assertEqual(record.top, original.top)
+            self.assertEqual(data[self.size:], self.files[idx][self.size:])
+
+    def test_short_record(self):
+        with self.assertRaises(ValueError):
+            RecordTable(self.model, [os.urandom(self.size-1)])
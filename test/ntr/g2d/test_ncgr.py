@@ -0,0 +1,120 @@
+
+import array
+import os
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from rawdb.ntr.g2d.ncgr import CHAR, NCGR, crypt, keystream
+from rawdb.ntr.g2d.nclr import NCLR, bgr555_to_rgba, rgba_to_bgr555
+from rawdb.util.io import BinaryIO
+
+
+def build_ncgr(format, type_, width, height):
+    ncgr = NCGR()
+    ncgr.char.format = format
+    ncgr.char.type = type_
+    ncgr.char.width = width
+    ncgr.char.height = height
+    subwidth = 4 if format == CHAR.FORMAT_16BIT else 8
+    ncgr.char.data = os.urandom(width*height*8*subwidth)
+    ncgr.char.datasize = len(ncgr.char.data)
+    ncgr.numblocks = 1
+    ncgr.cpos.loaded = False
+    return ncgr
+
+
+class TestCHAR(unittest.TestCase):
+    def test_tile_layout(self):
+        ncgr = build_ncgr(CHAR.FORMAT_16BIT, 0, 2, 1)
+        ncgr.char.data = '\x21'*32+'\x43'*32
+        tiles = ncgr.get_tiles()
+        self.assertEqual(len(tiles), 2)
+        self.assertEqual(tiles[0][0], [1, 2]*4)
+        self.assertEqual(tiles[1][7], [3, 4]*4)
+        self.assertEqual(ncgr.char.get_pixels()[:16], [1, 2]*4+[3, 4]*4)
+
+    def test_round_trip(self):
+        for format in (CHAR.FORMAT_16BIT, CHAR.FORMAT_256BIT):
+            for type_ in (0, CHAR.TYPE_LINEAR):
+                ncgr = build_ncgr(format, type_, 3, 2)
+                data = ncgr.char.data
+                ncgr.char.set_pixels(ncgr.char.get_pixels(), 3, 2)
+                self.assertEqual(ncgr.char.data, data)
+                ncgr.set_tiles(ncgr.get_tiles())
+                self.assertEqual(ncgr.char.data, data)
+                out = ncgr.save().getvalue()
+                self.assertEqual(NCGR(reader=BinaryIO(out)).char.data, data)
+
+
+class TestImage(unittest.TestCase):
+    def test_get_image(self):
+        ncgr = build_ncgr(CHAR.FORMAT_16BIT, 0, 1, 1)
+        ncgr.char.data = '\x10'*32
+        pixels = list(ncgr.get_image().getdata())
+        self.assertEqual(pixels[:2], [(0, 0, 0, 0), (1, 1, 1, 255)])
+        pixels = list(ncgr.get_image(transparent=False).getdata())
+        self.assertEqual(pixels[0], (0, 0, 0, 255))
+
+    def test_set_image(self):
+        img = Image.new('RGBA', (16, 8))
+        colors = [(0, 0, 0, 0), (0xF8, 0, 0, 255), (0, 0x80, 0x10, 255)]
+        img.putdata([colors[idx % 3] for idx in xrange(16*8)])
+        clr = NCLR()
+        clr.pltt.format = clr.pltt.FORMAT_16BIT
+        clr.pltt.data = array.array('H', [0]*16)
+        ncgr = NCGR()
+        ncgr.set_image(img, clr)
+        self.assertEqual((ncgr.char.width, ncgr.char.height), (2, 1))
+        self.assertEqual(clr.get_palettes()[0][1:3], colors[1:])
+        self.assertEqual(list(ncgr.get_image(clr=clr).getdata()),
+                         list(img.getdata()))
+
+
+class TestPalette(unittest.TestCase):
+    def test_conversion(self):
+        values = np.arange(0x8000, dtype=np.uint16)
+        colors = bgr555_to_rgba(values)
+        self.assertEqual(tuple(colors[0x7C1F]), (0xF8, 0, 0xF8, 255))
+        self.assertTrue(np.array_equal(rgba_to_bgr555(colors), values))
+
+    def test_set_palette(self):
+        clr = NCLR()
+        clr.pltt.format = clr.pltt.FORMAT_16BIT
+        clr.pltt.data = array.array('H', [0]*32)
+        palette = [(idx*8, 0, 0xF8-idx*8, 255) for idx in xrange(16)]
+        clr.set_palette(1, palette)
+        self.assertEqual(clr.get_palettes()[1], palette)
+        self.assertEqual(list(clr.pltt.data[:16]), [0]*16)
+        self.assertEqual(clr.get_palette(1)[2], '\x10\x00\xe8\xff')
+
+
+class TestEncryption(unittest.TestCase):
+    def test_keystream(self):
+        key = 0x1234
+        keys = []
+        for idx in xrange(100):
+            keys.append(key & 0xFFFF)
+            key = key*CHAR.ENCRYPT_MULT+CHAR.ENCRYPT_CARRY
+        self.assertEqual(keystream(0x1234, 100).tolist(), keys)
+
+    def test_crypt(self):
+        plain = os.urandom(0x1000)
+        for encryption in (NCGR.ENCRYPTION_REVERSE,
+                           NCGR.ENCRYPTION_FORWARDS):
+            if encryption == NCGR.ENCRYPTION_REVERSE:
+                plain = plain[:-2]+'\x00\x00'
+            else:
+                plain = '\x00\x00'+plain[2:]
+            data, seed = crypt(plain, encryption, 0xBEEF)
+            self.assertEqual(crypt(data, encryption), (plain, 0xBEEF))
+
+    def test_round_trip(self):
+        for encryption in (NCGR.ENCRYPTION_REVERSE,
+                           NCGR.ENCRYPTION_FORWARDS):
+            ncgr = build_ncgr(CHAR.FORMAT_16BIT, 0, 4, 4)
+            data = ncgr.save().getvalue()
+            ncgr = NCGR(encryption, reader=BinaryIO(data))
+            self.assertEqual(ncgr.save().getvalue(), data)
+            self.assertEqual(ncgr.save().getvalue(), data)
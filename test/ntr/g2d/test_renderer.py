@@ -0,0 +1,73 @@
+
+import array
+import unittest
+
+import numpy as np
+
+from rawdb.ntr.g2d.ncer import NCER, Cell, CellAttributes
+from rawdb.ntr.g2d.ncgr import NCGR
+from rawdb.ntr.g2d.nclr import NCLR
+from rawdb.ntr.g2d.nscr import NSCR
+from rawdb.ntr.g2d.renderer import TileRenderer
+
+
+def build_sources():
+    """Two tiles, each with a single pixel set, and a grayscale palette"""
+    cgr = NCGR()
+    tiles = np.zeros((2, 8, 8), dtype=np.uint8)
+    tiles[0, 0, 0] = 1
+    tiles[1, 0, 7] = 2
+    cgr.set_tiles(tiles)
+    clr = NCLR()
+    clr.pltt.format = clr.pltt.FORMAT_16BIT
+    clr.pltt.data = array.array('H', [idx*0x421 for idx in xrange(16)]*2)
+    return cgr, clr
+
+
+class TestTileRenderer(unittest.TestCase):
+    def setUp(self):
+        self.cgr, self.clr = build_sources()
+        self.renderer = TileRenderer(self.cgr, self.clr)
+
+    def test_flipped(self):
+        tiles = self.renderer.flipped(True, True)
+        self.assertEqual(tiles[0, 7, 7], 1)
+        self.assertIs(tiles, self.renderer.flipped(1, 1))
+
+    def test_screen(self):
+        scr = NSCR()
+        scr.scrn.width = 16
+        scr.scrn.height = 16
+        # plain, horizontal flip, vertical flip, second palette
+        scr.scrn.data = array.array('H', [0, 0x400, 0x800, 0x1001])
+        canvas = np.asarray(scr.get_image(self.cgr, self.clr))
+        self.assertEqual(tuple(canvas[0, 0]), (8, 8, 8, 255))
+        self.assertEqual(tuple(canvas[0, 15]), (8, 8, 8, 255))
+        self.assertEqual(tuple(canvas[15, 0]), (8, 8, 8, 255))
+        self.assertEqual(tuple(canvas[8, 15]), (16, 16, 16, 255))
+        self.assertEqual(np.count_nonzero(canvas[..., 3]), 4)
+
+    def test_cell(self):
+        ncer = NCER()
+        cell = Cell(0)
+        for x, rotparam in ((0, 0), (4, 0x8)):
+            attr = CellAttributes()
+            attr.x = x
+            attr.shape = CellAttributes.SHAPE_HORIZONTAL
+            attr.rotparam = rotparam
+            cell.attrs.append(attr)
+        ncer.cebk.cells.append(cell)
+        canvas = np.asarray(ncer.get_image(0, self.cgr, self.clr))
+        self.assertEqual(canvas.shape, (9, 21, 4))
+        # The flipped block draws over the first without erasing it
+        self.assertEqual(tuple(canvas[0, 0]), (8, 8, 8, 255))
+        self.assertEqual(tuple(canvas[0, 15]), (16, 16, 16, 255))
+        self.assertEqual(tuple(canvas[0, 4]), (16, 16, 16, 255))
+        self.assertEqual(tuple(canvas[0, 19]), (8, 8, 8, 255))
+
+    def test_clip(self):
+        canvas = self.renderer.new_canvas(4, 4)
+        self.renderer.blit(canvas, 1, 8, 8, -4, 0, 0)
+        self.assertEqual(tuple(canvas[0, 3]), (16, 16, 16, 255))
+        self.renderer.blit(canvas, 0, 8, 8, 10, 10, 0)
+        self.assertEqual(np.count_nonzero(canvas[..., 3]), 1)
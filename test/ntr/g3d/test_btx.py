@@ -1,7 +1,11 @@
 
+import os
+import struct
 import unittest
 
-from rawdb.ntr.g3d.btx import BTX, TEX, TexInfo, TexParam
+from rawdb.ntr.g3d.btx import BTX, TEX, TexInfo, TexParam, PalParam, \
+    FORMAT_A3I5, FORMAT_I2, FORMAT_I4, FORMAT_I8, FORMAT_4X4, FORMAT_A5I3, \
+    FORMAT_DIRECT, decode_4x4, decode_direct, pack_texels, unpack_texels
 from rawdb.util.io import BinaryIO
 
 
@@ -38,3 +42,102 @@ class TestTEX(unittest.TestCase):
         new = TEX()
         new.load(BinaryIO(out))
         self.assertEqual(default.texparams, new.texparams)
+
+
+def reference_4x4(texels, plttidx, colors, width, height):
+    """Per-texel FORMAT_4X4 decoder"""
+    def rgb(value):
+        return [value & 0x1F, (value >> 5) & 0x1F, (value >> 10) & 0x1F]
+
+    pixels = {}
+    block = 0
+    for block_y in xrange(0, height, 4):
+        for block_x in xrange(0, width, 4):
+            word, = struct.unpack_from('<I', texels, block*4)
+            entry, = struct.unpack_from('<H', plttidx, block*2)
+            base = (entry & 0x3FFF)*2
+            mode = entry >> 14
+            color0 = rgb(colors[base])
+            color1 = rgb(colors[base+1])
+            if mode == 0:
+                palette = [color0, color1, rgb(colors[base+2]), None]
+            elif mode == 1:
+                palette = [color0, color1,
+                           [(a+b)//2 for a, b in zip(color0, color1)], None]
+            elif mode == 2:
+                palette = [color0, color1, rgb(colors[base+2]),
+                           rgb(colors[base+3])]
+            else:
+                palette = [color0, color1,
+                           [(a*5+b*3)//8 for a, b in zip(color0, color1)],
+                           [(a*3+b*5)//8 for a, b in zip(color0, color1)]]
+            for idx in xrange(16):
+                color = palette[(word >> (idx*2)) & 0x3]
+                if color is None:
+                    value = (0, 0, 0, 0)
+                else:
+                    value = tuple(c << 3 for c in color)+(255, )
+                pixels[(block_y+idx//4, block_x+idx % 4)] = value
+            block += 1
+    return [[pixels[(y, x)] for x in xrange(width)] for y in xrange(height)]
+
+
+class TestTextureCodec(unittest.TestCase):
+    def test_indexed_round_trip(self):
+        for format in (FORMAT_A3I5, FORMAT_I2, FORMAT_I4, FORMAT_I8,
+                       FORMAT_A5I3):
+            data = os.urandom(32*16)
+            bits = {FORMAT_I2: 2, FORMAT_I4: 4}.get(format, 8)
+            data = data[:32*16*bits//8]
+            indexes, alpha = unpack_texels(data, format, 32, 16)
+            self.assertEqual(indexes.shape, (16, 32))
+            self.assertEqual(pack_texels(indexes, format, alpha), data)
+
+    def test_i4(self):
+        indexes, alpha = unpack_texels('\x21'*32, FORMAT_I4, 8, 8)
+        self.assertIsNone(alpha)
+        self.assertEqual(indexes[0, :4].tolist(), [1, 2, 1, 2])
+        indexes, alpha = unpack_texels('\xff'*64, FORMAT_A3I5, 8, 8)
+        self.assertEqual((indexes[0, 0], alpha[0, 0]), (31, 252))
+
+    def test_direct(self):
+        data = struct.pack('<4H', 0x801F, 0x03E0, 0xFC00, 0)
+        rgba = decode_direct(data*16, 8, 8)
+        self.assertEqual(rgba[0, :4].tolist(), [[0xF8, 0, 0, 255],
+                                                [0, 0xF8, 0, 0],
+                                                [0, 0, 0xF8, 255],
+                                                [0, 0, 0, 0]])
+
+    def test_4x4(self):
+        width, height = 16, 8
+        blocks = width*height//16
+        texels = os.urandom(blocks*4)
+        colors = [struct.unpack('<H', os.urandom(2))[0] & 0x7FFF
+                  for idx in xrange(64)]
+        plttidx = ''.join(struct.pack('<H', (idx*3) | (idx % 4) << 14)
+                          for idx in xrange(blocks))
+        rgba = decode_4x4(texels, plttidx, colors, width, height)
+        self.assertEqual([map(tuple, row) for row in rgba.tolist()],
+                         reference_4x4(texels, plttidx, colors, width,
+                                       height))
+
+    def test_tex_formats(self):
+        tex = TEX()
+        tex.texdict.num = 2
+        tex.texdict.names = ['direct', 'compressed']
+        tex.texparams = [TexParam(0, 8, 8, FORMAT_DIRECT, 0),
+                         TexParam(0, 8, 8, FORMAT_4X4, 0)]
+        tex.texdata = os.urandom(128)
+        tex.tex4x4data = os.urandom(16)
+        tex.tex4x4paldata = '\x00\x00'*4
+        tex.paldict.num = 1
+        tex.paldict.names = ['pal']
+        tex.palparams = [PalParam(0, 0)]
+        tex.paldata = os.urandom(32)
+        out = TEX(BinaryIO(tex.save().getvalue())).save().getvalue()
+        new = TEX(BinaryIO(out))
+        self.assertEqual(new.tex4x4data, tex.tex4x4data)
+        self.assertEqual(new.tex4x4paldata, tex.tex4x4paldata)
+        self.assertEqual(new.save().getvalue(), out)
+        self.assertEqual([image.size for image in tex.images],
+                         [(8, 8), (8, 8)])
@@ -0,0 +1,105 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from rawdb.compression import vcdiff
+from rawdb.ntr import delta, ndstool
+from rawdb.ntr.header_bin import HeaderBin
+from rawdb.ntr.narc import NARC, file_ranges
+from rawdb.ntr.rom import ROM, NITROCODE
+
+
+def write(path, data):
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    with open(path, 'wb') as handle:
+        handle.write(data)
+
+
+def build_narc(files):
+    narc = NARC()
+    narc.files.extend(files)
+    return narc.save().getvalue()
+
+
+class TestDelta(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.workspace = os.path.join(self.directory, 'workspace')
+        header = HeaderBin()
+        header.name = 'POKEMON HG'
+        header.code = header.base_code = 'IPKE'
+        write(os.path.join(self.workspace, 'header.bin'),
+              header.save().getvalue())
+        write(os.path.join(self.workspace, 'arm9.bin'),
+              'arm9'*0x100+struct.pack('<III', NITROCODE, 0x800, 0))
+        write(os.path.join(self.workspace, 'arm7.bin'), 'arm7'*0x90)
+        write(os.path.join(self.workspace, 'banner.bin'),
+              struct.pack('<H', 1)+'b'*0x83E)
+        self.files = [os.urandom(0x100+idx*0x10) for idx in xrange(400)]
+        write(os.path.join(self.workspace, 'fs', 'data.narc'),
+              build_narc(self.files))
+        write(os.path.join(self.workspace, 'fs', 'z', 'big.bin'),
+              os.urandom(0x280000))
+        self.original = os.path.join(self.directory, 'original.nds')
+        ndstool.build(self.original, self.workspace)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, path):
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+    def test_file_ranges(self):
+        data = build_narc(['abc', '', 'defgh'])
+        ranges = file_ranges(data)
+        self.assertEqual([data[start:stop] for start, stop in ranges],
+                         ['abc', '', 'defgh'])
+        self.assertIsNone(file_ranges('not a narc'))
+
+    def test_rom_patch(self):
+        files = list(self.files)
+        files[3] = 'grown'*0x100
+        modified = os.path.join(self.directory, 'modified.nds')
+        shutil.copy(self.original, modified)
+        with ROM(modified, writable=True) as rom:
+            # Moved to the end of the ROM, past big.bin
+            self.assertFalse(rom.replace('data.narc', build_narc(files)))
+        self.assertTrue(delta.is_rom(modified))
+        patch = os.path.join(self.directory, 'patch.xdelta3')
+        delta.make_patch(patch, self.original, modified)
+        size = os.path.getsize(patch)
+        output = os.path.join(self.directory, 'output.nds')
+        delta.apply_patch(patch, self.original, output)
+        self.assertEqual(self.read(output), self.read(modified))
+        self.assertLess(size, 0x2000)
+        vcdiff.make_patch(patch, self.original, modified)
+        self.assertGreater(os.path.getsize(patch), 0x10000)
+
+    def test_narc_patch(self):
+        source = os.path.join(self.directory, 'source.narc')
+        target = os.path.join(self.directory, 'target.narc')
+        write(source, build_narc(self.files))
+        files = list(self.files)
+        files[0] = 'x'
+        write(target, build_narc(files))
+        patch = os.path.join(self.directory, 'patch.xdelta3')
+        delta.make_patch(patch, source, target)
+        output = os.path.join(self.directory, 'output.narc')
+        delta.apply_patch(patch, source, output)
+        self.assertEqual(self.read(output), self.read(target))
+        # Every FATB entry changes, but the files themselves are copied
+        self.assertLess(os.path.getsize(patch), 0x1000)
+        source_data = self.read(source)
+        target_data = self.read(target)
+        regions = delta.narc_regions(source_data, target_data,
+                                     (0, len(source_data)),
+                                     (0, len(target_data)))
+        self.assertEqual(len(regions), len(files)+1)
+        target_start, target_stop, source_start, source_stop = regions[2]
+        self.assertEqual(target_data[target_start:target_start+0x110],
+                         source_data[source_start:source_start+0x110])
@@ -0,0 +1,45 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rawdb.ntr.narc import NARC, LazyFiles
+from rawdb.util.io import BinaryIO
+
+
+def build_narc(files):
+    narc = NARC()
+    narc.files.extend(files)
+    return narc.save().getvalue()
+
+
+class TestNARC(unittest.TestCase):
+    files = ['abc', 'defgh', '', 'q'*10]
+
+    def test_default(self):
+        out = build_narc(self.files)
+        new = NARC(BinaryIO(out))
+        self.assertEqual(list(new.files), self.files)
+        self.assertEqual(out, new.save().getvalue())
+
+    def test_lazy(self):
+        out = build_narc(self.files)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'test.narc')
+            with open(path, 'wb') as handle:
+                handle.write(out)
+            with open(path, 'rb') as handle:
+                narc = NARC(handle, lazy=True)
+            self.assertIsInstance(narc.files, LazyFiles)
+            self.assertEqual([str(data) for data in narc.files], self.files)
+            self.assertEqual(out, narc.save().getvalue())
+            narc.files[2] = 'new'
+            self.assertTrue(narc.files.is_modified(2))
+            self.assertFalse(narc.files.is_modified(1))
+            new = NARC(narc.save().getvalue())
+            self.assertEqual(new.files[2], 'new')
+            self.assertEqual(new.files[3], self.files[3])
+        finally:
+            shutil.rmtree(directory)
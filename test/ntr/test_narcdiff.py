@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rawdb.ntr import narcdiff
+from rawdb.ntr.narc import NARC
+
+
+def words(data):
+    if data.startswith('!'):
+        raise ValueError('Not words')
+    return [(str(idx), word) for idx, word in enumerate(data.split())]
+
+
+class TestNARCDiff(unittest.TestCase):
+    old = ['same', 'one two three', 'x'*0x1000, 'gone']
+    new = ['same', 'one 2 three four', 'x'*0x800+'y'+'x'*0x7FF]
+
+    def test_compare(self):
+        self.assertEqual(
+            [(idx, status) for idx, status, old_digest, new_digest
+             in narcdiff.compare(self.old, self.new)],
+            [(1, 'changed'), (2, 'changed'), (3, 'removed')])
+        self.assertEqual(
+            [(idx, status) for idx, status, old_digest, new_digest
+             in narcdiff.compare(self.new, self.old)][-1],
+            (3, 'added'))
+
+    def test_render(self):
+        lines = list(narcdiff.render(['a b', '!'], words))
+        self.assertEqual(lines[0], 'File 0: 3 bytes, sha1 {0}'.format(
+            narcdiff.digest('a b')))
+        self.assertEqual(lines[1:3], ['0 0: a', '0 1: b'])
+        # Data the formatter rejects only gets its summary
+        self.assertEqual(len(lines), 4)
+
+    def test_diff(self):
+        lines = list(narcdiff.diff(self.old, self.new, words))
+        self.assertEqual(lines[0], 'Files: 4 -> 3')
+        self.assertTrue(lines[1].startswith('File 1 changed: 13 -> 16 bytes'))
+        self.assertEqual(lines[2:5], ['-1 1: two', '+1 1: 2', '+1 3: four'])
+        self.assertTrue(lines[5].startswith('File 2 changed'))
+        self.assertEqual(lines[6], '-2 0: '+'x'*0x1000)
+        self.assertTrue(lines[8].startswith('File 3 removed: 4 bytes'))
+        self.assertEqual(lines[9:], ['-3 0: gone'])
+
+    def test_diff_raw(self):
+        lines = list(narcdiff.diff(self.old, self.new))
+        self.assertEqual(lines[2], 'Bytes differ from offset 0x4')
+        self.assertEqual(lines[4], 'Bytes differ from offset 0x800')
+        self.assertEqual(len(lines), 6)
+
+    def test_first_difference(self):
+        data = 'z'*0x10000
+        self.assertEqual(narcdiff.first_difference(data, data), 0x10000)
+        self.assertEqual(narcdiff.first_difference(data, data[:0x8000]),
+                         0x8000)
+        self.assertEqual(
+            narcdiff.first_difference(data, data[:0x9001]+'!'+data), 0x9001)
+
+    def test_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'test.narc')
+            narc = NARC()
+            narc.files.extend(self.new)
+            with open(path, 'wb') as handle:
+                narc.save(handle)
+            loaded = narcdiff.load(path)
+            self.assertEqual([str(data) for data in loaded.files], self.new)
+            self.assertEqual(list(narcdiff.diff(loaded.files, self.new)), [])
+            with open(path, 'wb') as handle:
+                handle.write('not a narc')
+            self.assertIsNone(narcdiff.load(path))
+        finally:
+            shutil.rmtree(directory)
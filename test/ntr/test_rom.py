@@ -0,0 +1,184 @@
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from rawdb.ntr import ndstool
+from rawdb.ntr.header_bin import HeaderBin
+from rawdb.ntr.rom import ROM, NITROCODE, build_fnt, crc16, read_fnt, \
+    scan_tree
+from rawdb.pokemon.game import Game
+
+FS = {
+    'a/0/0/0': 'first',
+    'a/0/0/1': '',
+    'a/0/1/0': 'x'*0x300,
+    'data/z.bin': 'z',
+    'data/sub/deep.narc': 'NARC'+'\x01'*50,
+    'root.txt': 'at the root',
+    'msg.narc': 'messages',
+}
+
+
+def write(path, data):
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    with open(path, 'wb') as handle:
+        handle.write(data)
+
+
+def read_tree(directory):
+    files = {}
+    for root, dirs, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as handle:
+                files[os.path.relpath(path, directory)] = handle.read()
+    return files
+
+
+class WorkspaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.workspace = os.path.join(self.directory, 'workspace')
+        header = HeaderBin()
+        header.name = 'POKEMON HG'
+        header.code = header.base_code = 'IPKE'
+        header = bytearray(header.save().getvalue())
+        header[0x24:0x2C] = struct.pack('<II', 0x2000800, 0x2000000)
+        write(os.path.join(self.workspace, 'header.bin'), bytes(header))
+        write(os.path.join(self.workspace, 'arm9.bin'),
+              'arm9'*0x100+struct.pack('<III', NITROCODE, 0x800, 0))
+        write(os.path.join(self.workspace, 'arm7.bin'), 'arm7'*0x90)
+        write(os.path.join(self.workspace, 'overarm9.bin'),
+              struct.pack('8I', 0, 0, 0, 0, 0, 0, 0, 0) +
+              struct.pack('8I', 1, 0, 0, 0, 0, 0, 1, 0))
+        write(os.path.join(self.workspace, 'overarm7.bin'), '')
+        write(os.path.join(self.workspace, 'banner.bin'),
+              struct.pack('<H', 1)+'b'*0x83E)
+        for file_id in xrange(2):
+            write(os.path.join(self.workspace, 'overlays',
+                               'overlay_{0:04}.bin'.format(file_id)),
+                  chr(file_id)*(0x10+file_id))
+        for path, data in FS.items():
+            write(os.path.join(self.workspace, 'fs', path), data)
+        self.rom = os.path.join(self.directory, 'out.nds')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestROM(WorkspaceTestCase):
+    def test_fnt(self):
+        fnt, paths = build_fnt(scan_tree(os.path.join(self.workspace, 'fs')),
+                               2)
+        self.assertEqual(sorted(paths), sorted(FS))
+        self.assertEqual(read_fnt(fnt, 0), zip(paths, range(2, 9)))
+        # Files are numbered depth-first
+        self.assertEqual(paths[:3], ['msg.narc', 'root.txt', 'a/0/0/0'])
+
+    def test_build_read(self):
+        ndstool.build(self.rom, self.workspace)
+        with ROM(self.rom) as rom:
+            self.assertEqual(rom.info.base_code, 'IPKE')
+            self.assertEqual(rom.header.arm9_offset, 0x4000)
+            self.assertEqual(rom.header.arm9_size, 0x400)
+            self.assertEqual(rom.header.rom_size,
+                             os.path.getsize(self.rom))
+            self.assertEqual(len(rom.fat), 9)
+            for path, data in FS.items():
+                self.assertEqual(rom.read(path), data)
+                self.assertEqual(rom.fat[rom.file_id(path)][0] % 0x200, 0)
+            self.assertEqual(rom.read(1), '\x01'*0x11)
+            self.assertEqual([overlay.file_id
+                              for overlay in rom.overlays9.overlays], [0, 1])
+            self.assertEqual(struct.unpack_from('<H', rom.data, 0x15E)[0],
+                             crc16(rom.data[:0x15E]))
+
+    def test_dump_rebuild(self):
+        ndstool.build(self.rom, self.workspace)
+        dumped = os.path.join(self.directory, 'dumped')
+        ndstool.dump(self.rom, dumped)
+        files = read_tree(dumped)
+        original = read_tree(self.workspace)
+        # The header is filled in with the layout when built
+        self.assertEqual(files.pop('header.bin')[:0x20],
+                         original.pop('header.bin')[:0x20])
+        self.assertEqual(files, original)
+        rebuilt = os.path.join(self.directory, 'rebuilt.nds')
+        ndstool.build(rebuilt, dumped)
+        with open(self.rom, 'rb') as first, open(rebuilt, 'rb') as second:
+            self.assertEqual(first.read(), second.read())
+
+    def test_patch(self):
+        ndstool.build(self.rom, self.workspace)
+        with ROM(self.rom, writable=True) as rom:
+            self.assertTrue(rom.patch('a/0/1/0', 'y'*0x200))
+            self.assertTrue(rom.patch('data/z.bin', 'w'*0x200))
+            self.assertFalse(rom.patch('data/z.bin', 'w'*0x201))
+        with ROM(self.rom) as rom:
+            self.assertEqual(rom.read('a/0/1/0'), 'y'*0x200)
+            self.assertEqual(rom.read('data/z.bin'), 'w'*0x200)
+            self.assertEqual(rom.read('root.txt'), FS['root.txt'])
+
+    def test_patch_empty(self):
+        ndstool.build(self.rom, self.workspace)
+        with ROM(self.rom, writable=True) as rom:
+            self.assertEqual(rom.fat[rom.file_id('a/0/0/1')][0],
+                             rom.fat[rom.file_id('a/0/1/0')][0])
+            self.assertFalse(rom.patch('a/0/0/1', 'hello'))
+            self.assertFalse(rom.replace('a/0/0/1', 'hello'))
+        with ROM(self.rom) as rom:
+            self.assertEqual(rom.read('a/0/0/1'), 'hello')
+            self.assertEqual(rom.read('a/0/1/0'), FS['a/0/1/0'])
+
+    def test_relocate(self):
+        ndstool.build(self.rom, self.workspace)
+        size = os.path.getsize(self.rom)
+        with ROM(self.rom, writable=True) as rom:
+            self.assertFalse(rom.replace('msg.narc', 'm'*0x1000))
+            self.assertTrue(rom.replace('root.txt', 'r'*0x10))
+        with ROM(self.rom) as rom:
+            self.assertEqual(rom.read('msg.narc'), 'm'*0x1000)
+            self.assertEqual(rom.fat[rom.file_id('msg.narc')][0],
+                             size+(-size) % 0x200)
+            self.assertEqual(rom.header.rom_size, os.path.getsize(self.rom))
+            self.assertEqual(struct.unpack_from('<H', rom.data, 0x15E)[0],
+                             crc16(rom.data[:0x15E]))
+            for path, data in FS.items():
+                if path not in ('msg.narc', 'root.txt'):
+                    self.assertEqual(rom.read(path), data)
+
+
+class TestPatchRom(WorkspaceTestCase):
+    def test_patch_rom(self):
+        game = Game.from_workspace(self.workspace)
+        game.to_file(self.rom)
+        write(os.path.join(self.workspace, 'fs', 'a', '0', '0', '0'),
+              'f'*0x400)
+        write(os.path.join(self.workspace, 'fs', 'data', 'z.bin'), 'y')
+        self.assertEqual(game.changed_rom_files(self.rom),
+                         ['a/0/0/0', 'data/z.bin'])
+        self.assertEqual(game.patch_rom(self.rom), ['a/0/0/0'])
+        with ROM(self.rom) as rom:
+            self.assertEqual(rom.read('a/0/0/0'), 'f'*0x400)
+            self.assertEqual(rom.read('data/z.bin'), 'y')
+        write(os.path.join(self.workspace, 'arm7.bin'), 'changed')
+        self.assertRaises(ValueError, game.changed_rom_files, self.rom)
+
+    def test_patch_rom_empty(self):
+        game = Game.from_workspace(self.workspace)
+        game.to_file(self.rom)
+        write(os.path.join(self.workspace, 'fs', 'a', '0', '0', '1'),
+              'hello')
+        self.assertEqual(game.patch_rom(self.rom), ['a/0/0/1'])
+        with ROM(self.rom) as rom:
+            self.assertEqual(rom.read('a/0/0/1'), 'hello')
+            self.assertEqual(rom.read('a/0/1/0'), FS['a/0/1/0'])
+        self.assertEqual(game.changed_rom_files(self.rom), [])
+        self.assertFalse(game.manifest.changed(
+            self.rom, [path for name, path in
+                       ndstool.build_paths(self.workspace)]))
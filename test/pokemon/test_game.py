@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rawdb.ntr.narc import NARC
+from rawdb.pokemon.game import DP, Files
+
+
+class TestDirtyTracking(unittest.TestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.workspace, 'fs', 'a'))
+        self.game = DP()
+        self.game.files = Files(self.workspace)
+        self.game.mark_clean()
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_project(self):
+        self.game.project.name = 'Renamed'
+        self.assertTrue(self.game.dirty)
+        self.assertEqual(self.game.changes(), set(['project']))
+        self.game.mark_clean()
+        self.game.files.base = 'base.nds'
+        self.assertEqual(self.game.changes(), set(['files']))
+
+    def test_batch(self):
+        narc = NARC()
+        narc.files.append('data')
+        path = os.path.join(self.workspace, 'fs', 'a', 'b.narc')
+        with self.game.batch():
+            self.game.save_archive(narc, 'a/b.narc')
+            self.assertEqual(self.game.changes(), set(['a/b.narc']))
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(self.game.dirty)
+        self.assertEqual(self.game.changes(), set())
+        self.game.mark_clean()
+        self.game.save_archive(narc, 'a/b.narc')
+        self.assertFalse(self.game.dirty)
+
+    def test_batch_discarded(self):
+        narc = NARC()
+        narc.files.append('data')
+        with self.assertRaises(ValueError):
+            with self.game.batch():
+                self.game.save_archive(narc, 'a/b.narc')
+                raise ValueError()
+        self.assertFalse(os.path.exists(
+            os.path.join(self.workspace, 'fs', 'a', 'b.narc')))
+        self.assertFalse(self.game.dirty)
+        self.assertEqual(self.game.changes(), set())
+
+    def test_batch_keeps_other_changes(self):
+        with self.game.batch():
+            self.game.project.name = 'Renamed'
+            self.game.save_archive(NARC(), 'a/b.narc')
+        self.assertTrue(self.game.dirty)
+        self.assertEqual(self.game.changes(), set(['project']))
+
+    def test_save_failure(self):
+        narc = NARC()
+        narc.files.append('data')
+        self.game.save_archive(narc, 'a/b.narc')
+        path = os.path.join(self.workspace, 'fs', 'a', 'b.narc')
+        self.assertIn(path, self.game.archive_cache)
+        original = open(path, 'rb').read()
+
+        def fail(writer):
+            raise IOError()
+        narc.save = fail
+        with self.assertRaises(IOError):
+            self.game.save_archive(narc, 'a/b.narc')
+        self.assertNotIn(path, self.game.archive_cache)
+        self.assertEqual(open(path, 'rb').read(), original)
+
+    def test_flush_failure(self):
+        good = NARC()
+        good.files.append('data')
+        bad = NARC()
+
+        def fail(writer):
+            raise IOError()
+        bad.save = fail
+        with self.assertRaises(IOError):
+            with self.game.batch():
+                self.game.save_archive(bad, 'a/a.narc')
+                self.game.save_archive(good, 'a/b.narc')
+        self.assertEqual(self.game.dirty_archives, {})
+        self.assertFalse(os.path.exists(
+            os.path.join(self.workspace, 'fs', 'a', 'b.narc')))
+        self.assertFalse(self.game.dirty)
+        self.assertEqual(self.game.changes(), set())
+        self.game.save_archive(good, 'a/b.narc')
+        self.assertTrue(os.path.exists(
+            os.path.join(self.workspace, 'fs', 'a', 'b.narc')))
@@ -0,0 +1,36 @@
+import unittest
+
+from rawdb.pokemon import game
+from rawdb.pokemon.msgdata.msg import Text
+from rawdb.util.io import BinaryIO
+
+
+class TestText(unittest.TestCase):
+    def roundtrip(self, version, files, **attrs):
+        text = Text(version)
+        for key, value in attrs.items():
+            setattr(text, key, value)
+        text.files = dict(files)
+        out = text.save().getvalue()
+        new = Text(version)
+        new.load(BinaryIO(out))
+        return new
+
+    def test_gen4(self):
+        files = {
+            '0_00000': 'Hello\\nVAR(256, 1, 2)\\r\\f',
+            '0_00001c': 'Compressed text',
+            '0_00002': 'abc'*50,
+        }
+        new = self.roundtrip(game.Version(4, 0), files, seed=0x1234)
+        self.assertEqual(new.files, files)
+        self.assertEqual(new[1], 'Compressed text')
+
+    def test_gen5(self):
+        files = {
+            '0_00000[1234]': u'Hello\\nVAR(256, 1, 2)\\r\\f',
+            '0_00001c[ABCD]': u'Compressed text',
+            '0_00002[0000]': u'abc'*50,
+        }
+        new = self.roundtrip(game.Version(5, 0), files)
+        self.assertEqual(new.files, files)
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rawdb.ntr.header_bin import HeaderBin
+from rawdb.pokemon.game import BW, DP, HGSS, Game
+from rawdb.pokemon.msgdata.msg import Text, is_text
+from rawdb.pokemon.narcformats import FORMATS, detect, find_game, \
+    personal_formatter, text_formatter
+from rawdb.pokemon.poketool.personal import Personal
+
+
+def build_personal(game, **attrs):
+    personal = Personal(game)
+    for key, value in attrs.items():
+        setattr(personal, key, value)
+    return personal.save().getvalue()
+
+
+def build_text(game, lines):
+    text = Text(game)
+    text.seed = 0x55
+    text.files = dict(('0_{0:05}'.format(idx), line)
+                      for idx, line in enumerate(lines))
+    return text.save().getvalue()
+
+
+class TestFormatters(unittest.TestCase):
+    def test_personal(self):
+        fields = personal_formatter(DP())(build_personal(DP(), catchrate=45))
+        self.assertEqual(fields[:2], [('base_stat.hp', 0),
+                                      ('base_stat.attack', 0)])
+        self.assertIn(('types[1]', 0), fields)
+        self.assertIn(('catchrate', 45), fields)
+        self.assertEqual(fields[-1], ('tmblock[3]', 0))
+        self.assertRaises(ValueError, personal_formatter(BW()),
+                          build_personal(DP()))
+
+    def test_text(self):
+        for game in (DP(), BW()):
+            data = build_text(game, ['Hello', 'World'])
+            self.assertTrue(is_text(data, game))
+            self.assertEqual([value for key, value
+                              in text_formatter(game)(data)],
+                             ['Hello', 'World'])
+
+    def test_is_text(self):
+        data = build_text(DP(), ['Hello', 'World'])
+        self.assertFalse(is_text(data[:-2], DP()))
+        self.assertFalse(is_text('\xFF\xFF'+data[2:], DP()))
+        self.assertFalse(is_text(build_personal(DP()), DP()))
+        data = build_text(BW(), ['Hello', 'World'])
+        self.assertFalse(is_text(data[:-4], BW()))
+        self.assertFalse(is_text('\x01\x00\x01\x00'+'\xFF'*0x20, BW()))
+
+
+class TestDetect(unittest.TestCase):
+    def test_path(self):
+        game = DP()
+        self.assertEqual(detect(game, 'fs/poketool/personal/personal.narc'),
+                         'personal')
+        self.assertEqual(detect(game, '/tmp/a1B2c3_msg.narc'), 'text')
+        self.assertIsNone(detect(game, 'fs/poketool/waza/waza_tbl.narc'))
+        game = HGSS()
+        self.assertEqual(detect(game, os.path.join('fs', 'a', '0', '2', '7')),
+                         'text')
+        # Numbered archives are not matched by their basename alone
+        self.assertIsNone(detect(game, '/tmp/a1B2c3_7'))
+
+    def test_contents(self):
+        game = HGSS()
+        self.assertEqual(detect(game, '/tmp/a1B2c3_2',
+                                [build_personal(game)]*3), 'personal')
+        self.assertEqual(detect(game, '/tmp/a1B2c3_7',
+                                [build_text(game, ['a']), '',
+                                 build_text(game, ['b', 'c'])]), 'text')
+        self.assertIsNone(detect(game, '/tmp/a1B2c3_7', ['\x00'*40]))
+        self.assertEqual(sorted(FORMATS), ['personal', 'text'])
+
+
+class TestFindGame(unittest.TestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        header = HeaderBin()
+        header.name = 'POKEMON W'
+        header.code = header.base_code = 'IRAO'
+        with open(os.path.join(self.workspace, 'header.bin'), 'wb') \
+                as handle:
+            handle.write(header.save().getvalue())
+        os.makedirs(os.path.join(self.workspace, 'fs', 'a'))
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_find_game(self):
+        game, workspace = find_game(os.path.join(self.workspace, 'fs', 'a'))
+        self.assertEqual(workspace, self.workspace)
+        self.assertIn(game.game_name, BW.versions)
+        self.assertEqual(game.game_name, 'White')
+        self.assertEqual((game.gen, game.idx), (5, 1))
+
+    def test_from_header(self):
+        with open(os.path.join(self.workspace, 'header.bin'), 'rb') \
+                as handle:
+            game = Game.from_header(HeaderBin(handle))
+        self.assertEqual(game.region_code, 'O')
+        self.assertIsNone(game.files)
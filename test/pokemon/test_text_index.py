@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from rawdb.ntr.narc import NARC
+from rawdb.pokemon.game import DP, Files
+from rawdb.pokemon.msgdata.msg import Text
+
+
+def build_text(*strings):
+    text = Text(DP())
+    text.seed = 0x55
+    text.files = dict(('0_{0:05}'.format(idx), value)
+                      for idx, value in enumerate(strings))
+    return text.save().getvalue()
+
+
+class TestTextIndex(unittest.TestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.workspace, 'fs', 'msgdata'))
+        narc = NARC()
+        narc.files.extend([build_text('Hello world', 'Rare Candy'),
+                           build_text('Professor Rowan', 'world map')])
+        with open(os.path.join(self.workspace, 'fs', 'msgdata', 'msg.narc'),
+                  'wb') as handle:
+            handle.write(narc.save().getvalue())
+        self.game = DP()
+        self.game.files = Files(self.workspace)
+
+    def tearDown(self):
+        self.game.text_index.close()
+        shutil.rmtree(self.workspace)
+
+    def test_search(self):
+        index = self.game.text_index
+        self.assertEqual(index.search('WORLD'),
+                         [(0, 0, 'Hello world'), (1, 1, 'world map')])
+        self.assertEqual(index.search('WORLD', case_sensitive=True), [])
+        self.assertEqual(index.search_tokens('candy rare'),
+                         [(0, 1, 'Rare Candy')])
+        self.assertEqual(index.search_tokens('rare world'), [])
+        self.assertEqual(index.refresh(), [])
+
+    def test_set_text(self):
+        index = self.game.text_index
+        index.refresh()
+        time.sleep(0.01)
+        self.game.set_text(1, build_text('Professor Elm', 'Rare world'))
+        self.assertEqual(index.search_tokens('rare'),
+                         [(0, 1, 'Rare Candy'), (1, 1, 'Rare world')])
+        self.assertEqual(index.refresh(), [])
+
+    def test_discard(self):
+        index = self.game.text_index
+        index.refresh()
+        with self.assertRaises(KeyError):
+            with self.game.batch():
+                self.game.set_text(1, build_text('Professor Elm'))
+                self.assertEqual(index.search('Elm'),
+                                 [(1, 0, 'Professor Elm')])
+                raise KeyError
+        self.assertEqual(index.search('Elm'), [])
+        self.assertEqual(index.search('Rowan'), [(1, 0, 'Professor Rowan')])
+
+    def test_persistent(self):
+        self.game.text_index.refresh()
+        self.game.text_index.close()
+        self.game = DP()
+        self.game.files = Files(self.workspace)
+        self.assertEqual(self.game.text_index.refresh(), [])
+        self.assertEqual(self.game.text_index.search('Rowan'),
+                         [(1, 0, 'Professor Rowan')])
+
+
+class TestTextTable(unittest.TestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.workspace, 'fs', 'msgdata'))
+        self.path = os.path.join(self.workspace, 'fs', 'msgdata', 'msg.narc')
+        self.write([build_text('Bulbasaur', 'Ivysaur'),
+                    build_text('Seed', 'Seed')], 1000)
+        self.game = DP()
+        self.game.files = Files(self.workspace)
+        self.game.region_code = 'E'
+        self.game.text_contents = {'US': {'pokemon_names': 0,
+                                          'species_names': 1}}
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def write(self, files, mtime):
+        narc = NARC()
+        narc.files.extend(files)
+        with open(self.path, 'wb') as handle:
+            handle.write(narc.save().getvalue())
+        os.utime(self.path, (mtime, mtime))
+
+    def test_shared(self):
+        names = self.game.text_table('pokemon_names')
+        self.assertIs(self.game.text_table('pokemon_names'), names)
+        self.assertEqual(names[1], 'Ivysaur')
+        names[1] = 'Venusaur'
+        self.game.set_text(0, names)
+        self.assertIs(self.game.text_table('pokemon_names'), names)
+        self.game.set_text(0, build_text('Charmander'))
+        self.assertEqual(self.game.text_table('pokemon_names')[0],
+                         'Charmander')
+
+    def test_archive_changed(self):
+        self.assertEqual(self.game.text_table('species_names')[0], 'Seed')
+        self.write([build_text('Bulbasaur'), build_text('Lizard')], 2000)
+        self.assertEqual(self.game.text_table('species_names')[0], 'Lizard')
@@ -0,0 +1,71 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rawdb.util.cache import ArchiveCache, LookupCache
+
+
+class TestArchiveCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data, mtime=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as handle:
+            handle.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_hit_miss(self):
+        path = self.write('a', 'abcd')
+        cache = ArchiveCache()
+        self.assertEqual(cache.get(path, lambda handle: handle.read()), 'abcd')
+        self.assertEqual(cache.get(path, lambda handle: 'unused'), 'abcd')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_mtime_invalidation(self):
+        path = self.write('a', 'abcd', mtime=1000)
+        cache = ArchiveCache()
+        cache.get(path, lambda handle: handle.read())
+        self.write('a', 'efgh', mtime=2000)
+        self.assertEqual(cache.get(path, lambda handle: handle.read()), 'efgh')
+        self.assertEqual(cache.misses, 2)
+
+    def test_eviction(self):
+        paths = [self.write(name, 'x'*8) for name in 'abc']
+        cache = ArchiveCache(max_size=16)
+        for path in paths:
+            cache.get(path, lambda handle: handle.read())
+        self.assertNotIn(paths[0], cache)
+        self.assertIn(paths[2], cache)
+        self.assertEqual(cache.size, 16)
+        self.assertEqual(cache.evictions, 1)
+
+
+class TestLookupCache(unittest.TestCase):
+    def test_source(self):
+        cache = LookupCache()
+        source = object()
+        self.assertEqual(cache.get('names', lambda: [1], source), [1])
+        self.assertEqual(cache.get('names', lambda: [2], source), [1])
+        self.assertEqual(cache.get('names', lambda: [3], object()), [3])
+        self.assertEqual(cache.get('names', lambda: [4], (1, 2)), [4])
+        self.assertEqual(cache.get('names', lambda: [5], (1, 2)), [4])
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+    def test_invalidate(self):
+        cache = LookupCache()
+        cache.get('a', lambda: 'a')
+        cache.get('b', lambda: 'b')
+        cache.invalidate('a')
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.peek('b'), 'b')
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.peek('b'))
@@ -0,0 +1,102 @@
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from rawdb.util.io import AtomicFile, BinaryIO, BufferReader
+
+
+class TestAtomicFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'target')
+        with open(self.path, 'wb') as handle:
+            handle.write('original')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        with open(self.path, 'rb') as handle:
+            return handle.read()
+
+    def test_replace(self):
+        with AtomicFile(self.path) as handle:
+            handle.write('new')
+        self.assertEqual(self.read(), 'new')
+        self.assertEqual(os.listdir(self.directory), ['target'])
+
+    def test_interrupted(self):
+        with self.assertRaises(ValueError):
+            with AtomicFile(self.path) as handle:
+                handle.write('partial')
+                raise ValueError
+        self.assertEqual(self.read(), 'original')
+        self.assertEqual(os.listdir(self.directory), ['target'])
+
+
+DATA = 'name\x00other\x00'+struct.pack('<HIi', 0x1234, 0xDEADBEEF, -2)
+
+
+class TestBufferReader(unittest.TestCase):
+    def sources(self):
+        handle = tempfile.TemporaryFile()
+        self.addCleanup(handle.close)
+        handle.write(DATA)
+        handle.flush()
+        return [DATA, buffer(DATA), bytearray(DATA), memoryview(DATA),
+                mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)]
+
+    def test_reader(self):
+        self.assertIsInstance(BinaryIO.reader(DATA), BufferReader)
+        existing = BinaryIO(DATA)
+        self.assertIs(BinaryIO.reader(existing), existing)
+        self.assertEqual(BinaryIO.reader('').getvalue(), '')
+
+    def test_read(self):
+        for source in self.sources():
+            reader = BinaryIO.reader(source)
+            self.assertEqual(reader.readString(), 'name')
+            self.assertEqual(reader.readString(), 'other')
+            self.assertEqual(reader.readUInt16(), 0x1234)
+            self.assertEqual(reader.readUInt32(), 0xDEADBEEF)
+            self.assertEqual(reader.readInt32(), -2)
+            self.assertEqual(reader.tell(), len(DATA))
+            self.assertEqual(reader.read(), '')
+            with reader.seek(2):
+                self.assertEqual(reader.read(3), 'me\x00')
+            self.assertEqual(reader.tell(), len(DATA))
+            self.assertEqual(reader.getvalue(), DATA)
+
+    def test_unterminated(self):
+        reader = BufferReader(buffer('no terminator'))
+        self.assertRaises(EOFError, reader.readString)
+
+    def test_read_array(self):
+        for source in self.sources():
+            reader = BinaryIO.reader(source)
+            reader.seek(11)
+            self.assertEqual(reader.unpack_from('<H'), (0x1234, ))
+            values = reader.readArray('<u4', 2)
+            self.assertIsInstance(values, np.ndarray)
+            self.assertEqual(values.tolist(), [0xDEADBEEF, 0xFFFFFFFE])
+            reader.seek(0)
+            self.assertEqual(reader.readArray('B', 4).tolist(),
+                             map(ord, 'name'))
+        self.assertEqual(BinaryIO(DATA).readArray('<u2', 2).tolist(),
+                         [0x616E, 0x656D])
+
+    def test_write(self):
+        source = bytearray(DATA)
+        reader = BinaryIO.reader(source)
+        reader.seek(1)
+        reader.write('A')
+        reader.seek(0, 2)
+        reader.write('tail')
+        self.assertEqual(reader.getvalue(), 'nAme'+DATA[4:]+'tail')
+        self.assertEqual(bytes(source), DATA)
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rawdb.util.manifest import Manifest, file_digest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'fs'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data, mtime=1000):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as handle:
+            handle.write(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_digest_cache(self):
+        path = self.write('a', 'abcd')
+        manifest = Manifest(self.directory)
+        digest = manifest.digest(path)
+        manifest.files['a'][2] = 'cached'
+        self.assertEqual(manifest.digest(path), 'cached')
+        os.utime(path, (2000, 2000))
+        self.assertEqual(manifest.digest(path), digest)
+        self.assertIsNone(manifest.digest(path+'.missing'))
+
+    def test_changed(self):
+        source = self.write('fs/source', 'abcd')
+        product = self.write('product', 'built')
+        inputs = [os.path.join(self.directory, 'fs')]
+        manifest = Manifest(self.directory)
+        self.assertTrue(manifest.changed(product, inputs))
+        manifest.record(product, inputs)
+        manifest.save()
+        manifest = Manifest(self.directory)
+        self.assertFalse(manifest.changed(product, inputs))
+        self.write('fs/source', 'efgh', mtime=2000)
+        self.assertTrue(manifest.changed(product, inputs))
+        manifest.record(product, inputs)
+        self.write('fs/new', '')
+        self.assertTrue(manifest.changed(product, inputs))
+        manifest.record(product, inputs)
+        self.write('product', 'edited', mtime=3000)
+        self.assertTrue(manifest.changed(product, inputs))
+        self.assertFalse(manifest.changed(product, inputs, editable=True))
+        os.remove(product)
+        self.assertTrue(manifest.changed(product, inputs, editable=True))
+
+    def test_outputs(self):
+        self.write('fs/source', 'abcd')
+        product = self.write('product', 'built')
+        page = self.write('page', 'also built')
+        inputs = [os.path.join(self.directory, 'fs')]
+        manifest = Manifest(self.directory)
+        manifest.record(product, inputs, [page])
+        self.assertFalse(manifest.changed(product, inputs))
+        self.write('page', 'edited', mtime=2000)
+        self.assertTrue(manifest.changed(product, inputs))
+        manifest.record(product, inputs, [page])
+        os.remove(page)
+        self.assertTrue(manifest.changed(product, inputs))
+
+    def test_adopt(self):
+        self.write('fs/source', 'abcd')
+        product = self.write('product', 'built')
+        inputs = [os.path.join(self.directory, 'fs')]
+        manifest = Manifest(self.directory)
+        self.assertFalse(manifest.changed(product, inputs, editable=True))
+        self.assertIn(product, manifest)
+        self.write('fs/source', 'efgh', mtime=2000)
+        self.assertTrue(manifest.changed(product, inputs, editable=True))
+
+    def test_amend(self):
+        source = self.write('fs/source', 'abcd')
+        product = self.write('product', 'built')
+        inputs = [os.path.join(self.directory, 'fs')]
+        manifest = Manifest(self.directory)
+        manifest.record(product, inputs)
+        self.write('fs/source', 'efgh', mtime=2000)
+        self.write('product', 'bui1t', mtime=2000)
+        manifest.amend(product, [source])
+        self.assertNotEqual(manifest.products['product']['hash'],
+                            file_digest(product))
+        self.assertEqual(manifest.files['product'][2],
+                         manifest.products['product']['hash'])
+        self.assertFalse(manifest.changed(product, inputs))
+        self.write('product', 'edits', mtime=3000)
+        self.assertTrue(manifest.changed(product, inputs))
+
+    def test_outside_paths(self):
+        rom = tempfile.NamedTemporaryFile()
+        manifest = Manifest(self.directory)
+        self.assertEqual(manifest.key(rom.name), os.path.abspath(rom.name))
+        self.assertEqual(manifest.key(os.path.join(self.directory, 'fs', 'a')),
+                         'fs/a')
+        rom.close()
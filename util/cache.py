@@ -1,4 +1,8 @@
 
+from collections import OrderedDict
+import os
+
+
 class cached_property(property):
     def __get__(self, instance, owner):
         try:
@@ -12,3 +16,175 @@ class cached_property(property):
             instance._cached_props[self] = super(cached_property,
                                                  self).__get__(instance, owner)
             return instance._cached_props[self]
+
+
+class ArchiveCache(object):
+    """Cache of parsed archives keyed by their path on disk
+
+    Entries are invalidated when the file's mtime or size changes. Memory
+    is bounded by the total on-disk size of the cached archives; the least
+    recently used entries are evicted first once max_size is exceeded.
+
+    Archives handed out are shared between callers. Anything that modifies
+    one should save it back (see Game.save_archive) or call invalidate().
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Number of bytes of archives to keep loaded. Defaults to 64MB
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups served from the cache
+    misses : int
+        Number of lookups that required parsing the file
+    evictions : int
+        Number of entries dropped to stay under max_size
+    size : int
+        Current total size of the cached entries
+    """
+    def __init__(self, max_size=0x4000000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+    def get(self, path, loader):
+        """Get the parsed archive at path
+
+        Parameters
+        ----------
+        path : string
+            Archive file name
+        loader : func(handle)
+            Parser to use on a miss. It is passed an open file handle.
+
+        Returns
+        -------
+        archive : mixed
+            Result of loader
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_mtime, stat.st_size)
+        try:
+            entry = self.entries.pop(path)
+        except KeyError:
+            pass
+        else:
+            if entry[0] == stamp:
+                self.entries[path] = entry
+                self.hits += 1
+                return entry[1]
+            self.size -= entry[0][1]
+        self.misses += 1
+        with open(path, 'rb') as handle:
+            value = loader(handle)
+        self._add(path, stamp, value)
+        return value
+
+    def store(self, path, value):
+        """Update the cached value for a path after it has been written"""
+        self.invalidate(path)
+        stat = os.stat(path)
+        self._add(path, (stat.st_mtime, stat.st_size), value)
+
+    def invalidate(self, path=None):
+        """Drop a path (or everything if path is None) from the cache"""
+        if path is None:
+            self.entries.clear()
+            self.size = 0
+            return
+        try:
+            entry = self.entries.pop(path)
+        except KeyError:
+            return
+        self.size -= entry[0][1]
+
+    def _add(self, path, stamp, value):
+        self.entries[path] = (stamp, value)
+        self.size += stamp[1]
+        while self.size > self.max_size and len(self.entries) > 1:
+            path, entry = self.entries.popitem(last=False)
+            self.size -= entry[0][1]
+            self.evictions += 1
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class LookupCache(object):
+    """Cache of lookup tables derived from game data, like decoded names
+
+    Each entry remembers the source it was built from (eg the parsed
+    archive object or a file's stat). The entry is rebuilt when a
+    different source is passed to get(), or after invalidate().
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups served from the cache
+    misses : int
+        Number of lookups that required building the value
+    """
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader, source=None):
+        """Get a cached value
+
+        Parameters
+        ----------
+        key : hashable
+        loader : func()
+            Builds the value on a miss
+        source : mixed, optional
+            What the value is built from, compared by identity. Tuples
+            (eg an (mtime, size) stamp) are compared by value. A source
+            that does not match the cached one causes a rebuild.
+
+        Returns
+        -------
+        value : mixed
+            Result of loader. It is shared between callers.
+        """
+        try:
+            cached_source, value = self.entries[key]
+        except KeyError:
+            pass
+        else:
+            if cached_source is source or (isinstance(source, tuple) and
+                                           cached_source == source):
+                self.hits += 1
+                return value
+        self.misses += 1
+        value = loader()
+        self.entries[key] = (source, value)
+        return value
+
+    def peek(self, key):
+        """Get a cached value without building it. None if missing"""
+        try:
+            return self.entries[key][1]
+        except KeyError:
+            return None
+
+    def invalidate(self, key=None):
+        """Drop a key (or everything if key is None) from the cache"""
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,8 +1,14 @@
 
+import array
+import mmap
+import os
 import struct
+import tempfile
+
+import numpy as np
 from six import StringIO
 
-__all__ = ['BinaryIO']
+__all__ = ['BinaryIO', 'BufferReader', 'AtomicFile', 'get_buffer']
 
 NUL = chr(0)
 
@@ -96,6 +102,28 @@ class BinaryIO(StringIO):
     def writeInt32(self, value):
         self.write(StructReaders.int32.pack(value))
 
+    def readArray(self, type_, count):
+        """Read count values of the same type at once
+
+        Parameters
+        ----------
+        type_ : string or numpy.dtype
+            An array typecode like 'H' or 'I' returns an array.array.
+            Anything else is taken as a NumPy dtype and returns an ndarray.
+        count : int
+
+        Returns
+        -------
+        values : array.array or numpy.ndarray
+        """
+        try:
+            values = array.array(type_)
+        except (TypeError, ValueError):
+            dtype = np.dtype(type_)
+            return np.frombuffer(self.read(dtype.itemsize*count), dtype=dtype)
+        values.fromstring(self.read(values.itemsize*count))
+        return values
+
     def writeAlign(self, alignment=4, char='\x00'):
         """Writes char multiple times to align the writer
 
@@ -192,6 +220,9 @@ class BinaryIO(StringIO):
     def reader(target):
         """Creates a new reader for appropriate type
 
+        In-memory data (strings, buffers, mmaps, ...) is read through a
+        BufferReader without being copied.
+
         Parameters
         ----------
         target : unknown
@@ -201,6 +232,28 @@ class BinaryIO(StringIO):
         -------
         reader : BinaryIO
         """
+        if isinstance(target, BinaryIO):
+            return target
+        elif hasattr(target, 'read') and not isinstance(target, mmap.mmap):
+            return BinaryIO.adapter(target)
+        elif not target:
+            return BinaryIO()
+        else:
+            return BufferReader(target)
+
+    @staticmethod
+    def writer(target):
+        """Creates a new writer for appropriate type
+
+        Parameters
+        ----------
+        target : unknown
+            Writer available
+
+        Returns
+        -------
+        writer : BinaryIO
+        """
         if isinstance(target, BinaryIO):
             return target
         elif hasattr(target, 'read'):
@@ -209,7 +262,6 @@ class BinaryIO(StringIO):
             return BinaryIO()
         else:
             return BinaryIO(target)
-    writer = reader
 
 
 class BinaryIOAdapter(BinaryIO):
@@ -240,6 +292,149 @@ class BinaryIOAdapter(BinaryIO):
         return self.handle.tell()
 
 
+class BufferReader(BinaryIO):
+    """BinaryIO for reading an in-memory buffer
+
+    The data is not copied. Reads unpack straight out of the buffer at an
+    integer cursor and strings are found with a single search for their
+    terminator. The first write copies the data into a string.
+
+    Parameters
+    ----------
+    data : string, buffer, bytearray, memoryview or mmap
+    """
+    def __init__(self, data):
+        self.buf = data
+        self.len = len(data)
+        self.pos = 0
+        self.buflist = []
+        self.closed = False
+        self.softspace = 0
+        self._find = getattr(data, 'find', None)
+        if isinstance(data, memoryview):
+            self._string = memoryview.tobytes
+        elif isinstance(data, bytearray):
+            self._string = bytes
+        else:
+            self._string = lambda value: value
+
+    def read(self, size=-1):
+        pos = self.pos
+        if size is None or size < 0:
+            end = self.len
+        else:
+            end = min(pos+size, self.len)
+        self.pos = end
+        return self._string(self.buf[pos:end])
+
+    def write(self, value):
+        if not isinstance(self.buf, str):
+            self.buf = self._string(self.buf[:])
+            self._string = str
+        StringIO.write(self, value)
+        if self.buflist:
+            self.buf += ''.join(self.buflist)
+            self.buflist = []
+        self._find = self.buf.find
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        position = self.pos
+        if whence == 1:
+            offset += position
+        elif whence == 2:
+            offset += self.len
+        self.pos = max(0, offset)
+        return SeekReturn(self, position)
+
+    def getvalue(self):
+        if isinstance(self.buf, str):
+            return self.buf
+        return self._string(self.buf[:])
+
+    def unpack_from(self, fmt):
+        """Unpack a struct at the cursor and move past it
+
+        Parameters
+        ----------
+        fmt : string or struct.Struct
+
+        Returns
+        -------
+        values : tuple
+        """
+        if not isinstance(fmt, struct.Struct):
+            fmt = struct.Struct(fmt)
+        values = fmt.unpack_from(self.buf, self.pos)
+        self.pos += fmt.size
+        return values
+
+    def _unpack(self, reader):
+        value, = reader.unpack_from(self.buf, self.pos)
+        self.pos += reader.size
+        return value
+
+    def readUInt8(self):
+        return self._unpack(StructReaders.uint8)
+
+    def readInt8(self):
+        return self._unpack(StructReaders.int8)
+
+    def readUInt16(self):
+        return self._unpack(StructReaders.uint16)
+
+    def readInt16(self):
+        return self._unpack(StructReaders.int16)
+
+    def readUInt32(self):
+        return self._unpack(StructReaders.uint32)
+
+    def readInt32(self):
+        return self._unpack(StructReaders.int32)
+
+    def readArray(self, type_, count):
+        try:
+            values = array.array(type_)
+        except (TypeError, ValueError):
+            dtype = np.dtype(type_)
+            size = dtype.itemsize*count
+            try:
+                values = np.frombuffer(self.buf, dtype=dtype, count=count,
+                                       offset=self.pos)
+            except AttributeError:
+                # memoryview does not export the old buffer interface
+                values = np.frombuffer(self._string(
+                    self.buf[self.pos:self.pos+size]), dtype=dtype)
+            self.pos += size
+            return values
+        values.fromstring(self.read(values.itemsize*count))
+        return values
+    readArray.__doc__ = BinaryIO.readArray.__doc__
+
+    def readString(self):
+        pos = self.pos
+        if self._find is not None:
+            end = self._find(NUL, pos)
+        else:
+            end = pos
+            while end < self.len:
+                chunk = self._string(self.buf[end:end+0x40])
+                idx = chunk.find(NUL)
+                if idx >= 0:
+                    end += idx
+                    break
+                end += len(chunk)
+            else:
+                end = -1
+        if end < 0:
+            raise EOFError('String is not terminated')
+        self.pos = end+1
+        return self._string(self.buf[pos:end])
+    readString.__doc__ = BinaryIO.readString.__doc__
+
+
 class BoundIO(object):
     """Binds a binary_io to an object so that all of its functions use obj
     directly"""
@@ -259,3 +454,73 @@ class BoundIO(object):
             return bound_write_wrapper
         else:
             return attr
+
+
+class AtomicFile(object):
+    """Context for writing a file that only replaces its target on success
+
+    Data is written to a temporary file in the same directory. When the
+    context exits cleanly, the temporary file is renamed over the target.
+    If an exception is raised, the target is left untouched.
+
+    Example
+    -------
+    >>> with AtomicFile('archive.narc') as handle:
+    ...     narc.save(BinaryIO.adapter(handle))
+    """
+    def __init__(self, path, mode='wb'):
+        self.path = path
+        self.mode = mode
+        self.handle = None
+        self.temp_path = None
+
+    def __enter__(self):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, self.temp_path = tempfile.mkstemp(prefix='.'+name+'.',
+                                              suffix='.tmp', dir=directory)
+        try:
+            permissions = os.stat(self.path).st_mode & 0o777
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            permissions = 0o666 & ~umask
+        os.chmod(self.temp_path, permissions)
+        self.handle = os.fdopen(fd, self.mode)
+        return self.handle
+
+    def __exit__(self, type_, value, traceback):
+        self.handle.close()
+        if type_ is not None:
+            os.remove(self.temp_path)
+            return
+        if os.name == 'nt' and os.path.exists(self.path):
+            # Windows cannot rename over an existing file
+            os.remove(self.path)
+        os.rename(self.temp_path, self.path)
+
+
+def get_buffer(target):
+    """Get a read-only buffer of the entire contents behind a reader
+
+    File handles are memory-mapped so that their contents are only paged
+    in as they are accessed. In-memory readers return their string value.
+
+    Parameters
+    ----------
+    target : file, BinaryIO, or string
+
+    Returns
+    -------
+    buffer : mmap or string
+    """
+    if isinstance(target, BufferReader):
+        return target.buf
+    handle = getattr(target, 'handle', target)
+    try:
+        fileno = handle.fileno()
+    except (AttributeError, IOError):
+        try:
+            return handle.getvalue()
+        except AttributeError:
+            return handle
+    return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,229 @@
+
+import hashlib
+import json
+import os
+import time
+
+from util.io import AtomicFile
+
+# Files modified this recently may change again without their mtime moving
+RACY_WINDOW = 2
+
+
+def file_digest(path):
+    """Returns the sha1 hex digest of a file"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(0x100000), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """Content hashes of a workspace and of the products built from it
+
+    Every file hashed is kept with its size and mtime, so it is only read
+    again once either changes. Each product (a decompressed overlay, a
+    built ROM, ...) is recorded with the hashes of the inputs it was made
+    from. changed() then tells whether a step has to be redone.
+
+    Paths inside of the workspace are stored relative to it. Others (eg
+    a ROM being dumped or built) are stored as absolute paths.
+
+    Parameters
+    ----------
+    directory : string
+        Workspace directory
+    name : string, optional
+        File name of the manifest inside of directory
+
+    Attributes
+    ----------
+    files : dict
+        Path to [size, mtime, hash]. mtime is None for files that were
+        modified too recently to be trusted.
+    products : dict
+        Product path to {'hash': hash, 'inputs': {path: hash}}, plus
+        'outputs': {path: hash} for other files written along with it
+    """
+    def __init__(self, directory, name='manifest.json'):
+        self.directory = directory
+        self.path = os.path.join(directory, name)
+        self.files = {}
+        self.products = {}
+        try:
+            with open(self.path) as handle:
+                data = json.load(handle)
+            self.files = data['files']
+            self.products = data['products']
+        except (IOError, ValueError, KeyError):
+            pass
+
+    def key(self, path):
+        path = os.path.abspath(path)
+        relpath = os.path.relpath(path, os.path.abspath(self.directory))
+        if relpath.startswith(os.pardir):
+            return path
+        return relpath.replace(os.sep, '/')
+
+    def digest(self, path):
+        """Get the hash of a file, reading it only if it has changed
+
+        Returns
+        -------
+        hash : string or None
+            None if the file does not exist
+        """
+        key = self.key(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.files.pop(key, None)
+            return None
+        try:
+            size, mtime, hexdigest = self.files[key]
+        except KeyError:
+            pass
+        else:
+            if size == stat.st_size and mtime == stat.st_mtime:
+                return hexdigest
+        hexdigest = file_digest(path)
+        mtime = stat.st_mtime
+        if time.time()-mtime < RACY_WINDOW:
+            mtime = None
+        self.files[key] = [stat.st_size, mtime, hexdigest]
+        return hexdigest
+
+    def snapshot(self, inputs):
+        """Hash a list of files and directories
+
+        Directories are walked recursively. Missing paths are left out.
+
+        Returns
+        -------
+        hashes : dict
+            Path to hash for every file found
+        """
+        hashes = {}
+        for path in inputs:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        fname = os.path.join(root, name)
+                        hashes[self.key(fname)] = self.digest(fname)
+            else:
+                hexdigest = self.digest(path)
+                if hexdigest is not None:
+                    hashes[self.key(path)] = hexdigest
+        return hashes
+
+    def changed(self, product, inputs, editable=False):
+        """Check whether a product needs to be built again
+
+        Parameters
+        ----------
+        product : string
+            File that is built. Other files recorded as its outputs are
+            checked along with it.
+        inputs : list
+            Files and directories it is built from
+        editable : bool, optional
+            If True, the product is something the user edits after it is
+            made (eg arm9.dec.bin). Edits do not count as a change, and
+            an existing product without a record is taken as current.
+
+        Returns
+        -------
+        changed : bool
+            True if the product is missing or empty, its inputs differ
+            from the last record(), or (unless editable) it or one of its
+            outputs has been modified or removed since.
+        """
+        try:
+            if not os.path.getsize(product):
+                return True
+        except OSError:
+            return True
+        try:
+            record = self.products[self.key(product)]
+        except KeyError:
+            if editable:
+                self.record(product, inputs)
+                return False
+            return True
+        if record['inputs'] != self.snapshot(inputs):
+            return True
+        if editable:
+            return False
+        if record['hash'] != self.digest(product):
+            return True
+        for key, hexdigest in record.get('outputs', {}).items():
+            if self.digest(os.path.join(self.directory, key)) != hexdigest:
+                return True
+        return False
+
+    def record(self, product, inputs, outputs=None):
+        """Store a product as built from the current state of inputs
+
+        Parameters
+        ----------
+        product : string
+        inputs : list
+        outputs : list, optional
+            Other files written when the product was built
+        """
+        record = {'hash': self.digest(product),
+                  'inputs': self.snapshot(inputs)}
+        if outputs:
+            record['outputs'] = dict((self.key(path), self.digest(path))
+                                     for path in outputs)
+        self.products[self.key(product)] = record
+
+    def amend(self, product, inputs):
+        """Update a product after inputs were written into it in place
+
+        The product is not read again. Its hash is replaced by one derived
+        from the previous hash and the amended inputs, which is kept with
+        the product's current size and mtime so that digest() returns it
+        until the file is modified again.
+
+        Parameters
+        ----------
+        product : string
+            Product that has a record
+        inputs : list
+            Files written into it
+        """
+        key = self.key(product)
+        record = self.products[key]
+        digest = hashlib.sha1(record['hash'] or '')
+        for path in sorted(inputs):
+            hexdigest = self.digest(path)
+            record['inputs'][self.key(path)] = hexdigest
+            digest.update(self.key(path))
+            digest.update(hexdigest or '')
+        record['hash'] = digest.hexdigest()
+        # The product was just written by the caller, so its mtime is
+        # trusted even within RACY_WINDOW
+        stat = os.stat(product)
+        self.files[key] = [stat.st_size, stat.st_mtime, record['hash']]
+
+    def forget(self, product):
+        """Drop a product so that it is built again next time"""
+        self.products.pop(self.key(product), None)
+
+    def save(self):
+        with AtomicFile(self.path, 'w') as handle:
+            json.dump({'files': self.files, 'products': self.products},
+                      handle, indent=1, sort_keys=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        if type_ is None:
+            self.save()
+
+    def __contains__(self, product):
+        return self.key(product) in self.products
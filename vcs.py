@@ -40,6 +40,7 @@ class GitControl(object):
             attr_file.write('*.narc diff=narc\n')
         self.call('add', '.')
         self.call('config', 'diff.narc.textconv', 'narcinfo')
+        self.call('config', 'diff.narc.cachetextconv', 'true')
         self.commit('Initialized repository')
 
     def commit(self, message):
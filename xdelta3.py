@@ -1,15 +1,15 @@
-import os, subprocess
+"""Patch creation and application
+
+Patches are VCDIFF (RFC 3284) deltas, as made by xdelta3. They are
+built in-process by ntr.delta.
+"""
+
+from ntr.delta import apply_patch, make_patch
 
-if os.name == "nt":
-    binary = "bin/xdelta3.exe"
-else:
-    binary = "bin/xdelta3"
-    if not os.path.exists(binary):
-        binary = "xdelta3"
 
 def makePatch(patchname, fname1, fname2):
-    subprocess.call([binary, "-e", "-s", fname1, fname2, patchname])
-    
+    make_patch(patchname, fname1, fname2)
+
+
 def applyPatch(patchname, fname1, fname2):
-    subprocess.call([binary, "-d", "-s", fname1, patchname, fname2])
-    
\ No newline at end of file
+    apply_patch(patchname, fname1, fname2)